@@ -3,6 +3,12 @@ from features import sales_performance, sales_forecasting, churn, fraud
 from features import customer_behaviours;
 from features import delivery;
 from features import geographic_insight;
+from helpers.fact_filters import render_filter_bar
+from helpers.memory_cache import enable_copy_on_write, render_cache_stats
+from helpers.profiling import flush_metrics, instrument, render_profile_panel
+
+enable_copy_on_write()
+instrument(sales_performance, sales_forecasting, churn, fraud, customer_behaviours, delivery, geographic_insight)
 
 st.set_page_config(
     page_title="Business Intelligence Dashboard",
@@ -21,15 +27,20 @@ tab_names = [
 ]
 
 
+# Tabs built from the fact table share one set of filters per rerun.
+filtered_tabs = tab_names[:5]
+
 selected_tab = st.sidebar.radio("Select dashboard tab:", tab_names)
+if selected_tab in filtered_tabs:
+    filters = render_filter_bar(st.sidebar.expander("Filters", expanded=True))
 
 if selected_tab == "Sales Performance":
     st.header("Sales Performance")
 
     col1, col2 = st.columns(2)
-    sales_performance.render_revenue_overtime(col1)
-    sales_performance.render_product_partition(col2)
-    sales_performance.render_product_leaderboard(st.container())
+    sales_performance.render_revenue_overtime(col1, filters)
+    sales_performance.render_product_partition(col2, filters)
+    sales_performance.render_product_leaderboard(st.container(), filters)
 
 elif selected_tab == "Sales Forecasting":
         st.header("Sales Forecasting")
@@ -38,43 +49,43 @@ elif selected_tab == "Sales Forecasting":
         sales_forecasting.render_key_forecast_metris(col_key_forecast_metrics)
 
         col_seasonal_segmentation = st.container()
-        sales_forecasting.render_seasonal_segmentation(col_seasonal_segmentation)
+        sales_forecasting.render_seasonal_segmentation(col_seasonal_segmentation, filters)
 
 elif selected_tab == "Customer Behaviours":
         st.header("Customer Behaviours")
         col_customer_loyalty, col_sales_volumes_by_reviews  = st.columns(2)
-        customer_behaviours.render_customer_loyalty(col_customer_loyalty)
-        customer_behaviours.render_sales_volumes_by_reviews(col_sales_volumes_by_reviews)
+        customer_behaviours.render_customer_loyalty(col_customer_loyalty, filters)
+        customer_behaviours.render_sales_volumes_by_reviews(col_sales_volumes_by_reviews, filters)
 
         col_payment_analysis = st.container()
-        customer_behaviours.render_payment_analysis(col_payment_analysis)
+        customer_behaviours.render_payment_analysis(col_payment_analysis, filters)
 
 elif selected_tab == "Geographic Insights":
         st.header("Geographic Insights")
         col_sales_region, col_customer_dist = st.columns(2)
-        geographic_insight.render_sales_by_region(col_sales_region)
-        geographic_insight.render_customer_distribution(col_customer_dist)
+        geographic_insight.render_sales_by_region(col_sales_region, filters)
+        geographic_insight.render_customer_distribution(col_customer_dist, filters)
 
         col_seller_perf = st.container()
-        geographic_insight.render_seller_performance_by_region(col_seller_perf)
+        geographic_insight.render_seller_performance_by_region(col_seller_perf, filters)
 
         col_city_analysis = st.container()
-        geographic_insight.render_city_level_analysis(col_city_analysis)
+        geographic_insight.render_city_level_analysis(col_city_analysis, filters)
 
         col_product_pref = st.container()
-        geographic_insight.render_regional_product_preferences(col_product_pref)
+        geographic_insight.render_regional_product_preferences(col_product_pref, filters)
 
 elif selected_tab == "Delivery":
         st.header("Delivery Performance")
         col_delivery_perf, col_delay_analysis = st.columns(2)
-        delivery.render_delivery_performance(col_delivery_perf)
-        delivery.render_delivery_delay_analysis(col_delay_analysis)
+        delivery.render_delivery_performance(col_delivery_perf, filters)
+        delivery.render_delivery_delay_analysis(col_delay_analysis, filters)
 
         col_delivery_state = st.container()
-        delivery.render_delivery_by_state(col_delivery_state)
+        delivery.render_delivery_by_state(col_delivery_state, filters)
 
         col_freight = st.container()
-        delivery.render_freight_analysis(col_freight)
+        delivery.render_freight_analysis(col_freight, filters)
 
 elif selected_tab == "Customer Churn Prediction":
     churn.render_churn_prediction(st.container())
@@ -83,4 +94,6 @@ elif selected_tab == "Fraud Detection":
     fraud.render_fraud_detection(st.container())
 
 
-
+render_cache_stats(st.sidebar.expander("Cache"))
+render_profile_panel(st.sidebar.expander("Debug"))
+flush_metrics()
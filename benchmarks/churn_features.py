@@ -0,0 +1,116 @@
+import argparse
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import BASE_ROWS, make_fact_table
+from features.churn import build_churn_features
+from helpers.fact_store import apply_fact_dtypes
+
+
+def legacy_churn_features(df):
+    # Feature engineering as it was before build_churn_features, kept as the
+    # reference for output and timing.
+    # Lấy đơn hàng delivered
+    fact = df[df['order_status'] == 'delivered'].copy()
+    fact['purchase_ts'] = fact['purchase_date']
+    fact['delivered_ts'] = pd.to_datetime(fact['order_delivered_customer_date'], errors='coerce')
+    fact['estimated_ts'] = pd.to_datetime(fact['order_estimated_delivery_date'], errors='coerce')
+    fact['delivery_days'] = (fact['delivered_ts'] - fact['purchase_ts']).dt.days
+    fact['delay_days'] = (fact['delivered_ts'] - fact['estimated_ts']).dt.days
+    fact['item_total'] = fact['price'] + fact['freight_value']
+    fact['review_score'] = fact['review_score'].astype(float)
+
+    # Churn label
+    GLOBAL_END_DATE = fact['purchase_ts'].max()
+    CHURN_WINDOW = 90
+    CUTOFF_DATE = GLOBAL_END_DATE - timedelta(days=CHURN_WINDOW)
+    last_purchase = fact.groupby('customer_unique_id')['purchase_ts'].max().reset_index()
+    last_purchase['days_since_last'] = (GLOBAL_END_DATE - last_purchase['purchase_ts']).dt.days
+    last_purchase['churn'] = (last_purchase['days_since_last'] > CHURN_WINDOW).astype(int)
+    feat_df = fact[fact['purchase_ts'] <= CUTOFF_DATE].copy()
+
+    # Tạo features
+    cust = feat_df.groupby('customer_unique_id').agg(
+        num_orders=('order_id', 'nunique'),
+        total_spent=('item_total', 'sum'),
+        avg_order_value=('item_total', 'mean'),
+        avg_review=('review_score', 'mean'),
+        avg_delivery_days=('delivery_days', 'mean'),
+        avg_delay=('delay_days', 'mean'),
+        total_items=('order_item_id', 'count'),
+        preferred_payment=('payment_type', lambda x: x.mode().iloc[0] if not x.mode().empty else 'unknown')
+    ).reset_index()
+
+    last_in_period = feat_df.groupby('customer_unique_id')['purchase_ts'].max().reset_index()
+    last_in_period['recency'] = (CUTOFF_DATE - last_in_period['purchase_ts']).dt.days
+    cust = cust.merge(last_in_period[['customer_unique_id', 'recency']], on='customer_unique_id')
+    first = feat_df.groupby('customer_unique_id')['purchase_ts'].min().reset_index()
+    cust = cust.merge(first.rename(columns={'purchase_ts': 'first_ts'}), on='customer_unique_id')
+    cust['tenure_days'] = (CUTOFF_DATE - cust['first_ts']).dt.days + 1
+
+    tmp = feat_df.sort_values(['customer_unique_id', 'purchase_ts'])
+    tmp['prev_ts'] = tmp.groupby('customer_unique_id')['purchase_ts'].shift(1)
+    tmp['days_between'] = (tmp['purchase_ts'] - tmp['prev_ts']).dt.days
+    inter = tmp.groupby('customer_unique_id')['days_between'].agg([('avg_days_between', 'mean'), ('std_days_between', 'std')]).reset_index()
+    cust = cust.merge(inter, on='customer_unique_id', how='left')
+
+    for days in [30, 60, 90]:
+        start = CUTOFF_DATE - timedelta(days=days)
+        recent = feat_df[feat_df['purchase_ts'] >= start]
+        cnt = recent.groupby('customer_unique_id')['order_id'].nunique().reset_index()
+        cnt.columns = ['customer_unique_id', f'orders_last_{days}d']
+        cust = cust.merge(cnt, on='customer_unique_id', how='left')
+        cust[f'orders_last_{days}d'] = cust[f'orders_last_{days}d'].fillna(0).astype(int)
+
+    delay_per_order = feat_df.groupby(['customer_unique_id', 'order_id']).agg(delay=('delay_days', 'mean')).reset_index()
+    late = delay_per_order.groupby('customer_unique_id').agg(pct_late=('delay', lambda x: (x > 0).mean())).reset_index()
+    cust = cust.merge(late, on='customer_unique_id', how='left')
+
+    cols_to_fill = ['avg_days_between', 'std_days_between', 'pct_late', 'avg_review', 'avg_delay']
+    cust[cols_to_fill] = cust[cols_to_fill].fillna(0)
+
+    data = cust.merge(last_purchase[['customer_unique_id', 'churn']], on='customer_unique_id', how='left')
+    data = pd.get_dummies(data, columns=['preferred_payment'], prefix='pay', dtype=int)
+    data.fillna(0, inplace=True)
+    data.replace([np.inf, -np.inf], 0, inplace=True)
+    return data
+
+
+def _timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df)
+    return result, time.perf_counter() - start
+
+
+def run(scales, seed: int = 0, legacy: bool = True):
+    print(f"{'scale':>6} {'rows':>12} {'customers':>10} {'legacy s':>10} {'vectorized s':>13} {'speedup':>8}  match")
+    for scale in scales:
+        df = apply_fact_dtypes(make_fact_table(int(BASE_ROWS * scale), seed=seed))
+        new, new_time = _timed(build_churn_features, df)
+
+        old_time, match = float("nan"), "-"
+        if legacy:
+            old, old_time = _timed(legacy_churn_features, df)
+            try:
+                pd.testing.assert_frame_equal(new, old, check_exact=False, rtol=1e-9)
+                match = "yes"
+            except AssertionError as e:
+                match = f"NO: {str(e).splitlines()[0]}"
+
+        print(f"{scale:>6g} {len(df):>12,} {len(new):>10,} {old_time:>10.2f} {new_time:>13.2f} {old_time / new_time:>7.1f}x  {match}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare churn feature engineering against the legacy per-group implementation.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100], help="multiples of the current fact table size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-legacy", action="store_true", help="only time the vectorized path (the legacy one takes hours at 100x)")
+    args = parser.parse_args(argv)
+    run(args.scales, args.seed, legacy=not args.no_legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import BASE_ROWS, make_fact_table, use_local_store
+from etl.pipeline import ITEM_CHUNK_ROWS, RAW_TABLES, build_fact_table, run as run_pipeline, run_incremental
+from helpers import blob_cache
+from helpers.fact_dataset import load_manifest, read_fact_dataset
+from helpers.fact_store import FACT_BUCKET
+
+# Share of orders, the latest by purchase time, missing from the earlier
+# export the incremental check starts from.
+LATE_ORDER_SHARE = 0.1
+
+
+def write_raw_csvs(fact: pd.DataFrame, raw_dir: str):
+    # Splits a synthetic fact table back into the Olist source files.
+    def columns(name):
+        spec = RAW_TABLES[name]
+        return list(spec["dtype"]) + spec.get("dates", [])
+
+    matched = fact[fact["order_status"].notna()]
+    tables = {
+        "order_items": fact[columns("order_items")].drop_duplicates(["order_id", "order_item_id"]),
+        "orders": matched[columns("orders")].drop_duplicates("order_id"),
+        "customers": matched[columns("customers")].drop_duplicates("customer_id"),
+        "products": fact[columns("products")].drop_duplicates("product_id"),
+        "sellers": fact[columns("sellers")].drop_duplicates("seller_id"),
+        "payments": fact[fact["payment_type"].notna()].drop_duplicates("order_id").assign(payment_sequential=1)[columns("payments")],
+        "reviews": fact[fact["review_id"].notna()][columns("reviews")].drop_duplicates(["review_id", "order_id"]),
+    }
+    for name, table in tables.items():
+        table.to_csv(os.path.join(raw_dir, RAW_TABLES[name]["file"]), index=False)
+
+
+def legacy_fact_table(raw_dir: str):
+    # The BDA_BI.ipynb cells that build the fact table, kept as the reference
+    # for output and timing.
+    def read(name):
+        return pd.read_csv(os.path.join(raw_dir, RAW_TABLES[name]["file"]))
+
+    olist_customer = read("customers")
+    olist_orders = read("orders")
+    olist_order_items = read("order_items")
+    olist_order_payments = read("payments")
+    olist_order_reviews = read("reviews")
+    olist_products = read("products")
+    olist_sellers = read("sellers")
+
+    for df in [olist_customer, olist_orders, olist_order_items, olist_order_payments,
+               olist_order_reviews, olist_products, olist_sellers]:
+        df.drop_duplicates(inplace=True)
+
+    date_cols = RAW_TABLES["orders"]["dates"]
+    olist_orders[date_cols] = olist_orders[date_cols].apply(pd.to_datetime)
+    olist_orders = olist_orders[olist_orders["order_status"] == "delivered"]
+    olist_orders = olist_orders.dropna(subset=["order_delivered_customer_date"])
+    olist_order_items['shipping_limit_date'] = pd.to_datetime(olist_order_items['shipping_limit_date'])
+    olist_order_reviews["review_creation_date"] = pd.to_datetime(olist_order_reviews["review_creation_date"])
+    olist_order_reviews["review_answer_timestamp"] = pd.to_datetime(olist_order_reviews["review_answer_timestamp"])
+    olist_order_reviews["review_comment_title"] = olist_order_reviews["review_comment_title"].fillna("")
+    olist_order_reviews["review_comment_message"] = olist_order_reviews["review_comment_message"].fillna("")
+
+    olist_products["product_category_name"] = olist_products["product_category_name"].fillna("unknown")
+    for col in ["product_name_lenght", "product_description_lenght", "product_photos_qty",
+                "product_weight_g", "product_length_cm", "product_height_cm", "product_width_cm"]:
+        olist_products[col] = (
+            olist_products.groupby("product_category_name")[col]
+            .transform(lambda x: x.fillna(x.median()))
+        )
+    olist_customer["customer_zip_code_prefix"] = olist_customer["customer_zip_code_prefix"].astype(str)
+    olist_sellers["seller_zip_code_prefix"] = olist_sellers["seller_zip_code_prefix"].astype(str)
+
+    valid_ids = set(olist_order_items["order_id"])
+    olist_orders = olist_orders[olist_orders["order_id"].isin(valid_ids)]
+    payments_agg = olist_order_payments.groupby("order_id").agg({
+        "payment_value": "sum",
+        "payment_installments": "max",
+        "payment_type": lambda x: x.iloc[0]
+    }).reset_index()
+
+    olist_orders["delivery_time"] = (olist_orders["order_delivered_customer_date"] - olist_orders["order_purchase_timestamp"]).dt.days
+    olist_orders["delay_vs_estimated"] = (olist_orders["order_delivered_customer_date"] - olist_orders["order_estimated_delivery_date"]).dt.days
+
+    fact = (
+        olist_order_items
+        .merge(olist_orders, on="order_id", how="left")
+        .merge(olist_customer, on="customer_id", how="left")
+        .merge(olist_products, on="product_id", how="left")
+        .merge(olist_sellers, on="seller_id", how="left")
+        .merge(payments_agg, on="order_id", how="left")
+        .merge(olist_order_reviews, on="order_id", how="left")
+    )
+    fact["purchase_date"] = fact["order_purchase_timestamp"].dt.date
+    fact["purchase_year"] = fact["order_purchase_timestamp"].dt.year
+    fact["purchase_month"] = fact["order_purchase_timestamp"].dt.to_period("M")
+    fact["purchase_weekday"] = fact["order_purchase_timestamp"].dt.weekday
+    fact["delivery_time"] = (fact["order_delivered_customer_date"] - fact["order_purchase_timestamp"]).dt.days
+    fact["estimated_delivery_time"] = (fact["order_estimated_delivery_date"] - fact["order_purchase_timestamp"]).dt.days
+    fact["delivery_delay"] = (fact["order_delivered_customer_date"] - fact["order_estimated_delivery_date"]).dt.days
+    fact["item_total"] = fact["price"] + fact["freight_value"]
+    fact["has_comment"] = (fact["review_comment_message"].str.len() > 0).astype(int)
+    return fact
+
+
+def _as_objects(df: pd.DataFrame):
+    # The pipeline keeps low-cardinality columns categorical and reads ids
+    # with explicit dtypes; compare values only.
+    return df.assign(**{
+        col: df[col].astype(object).where(df[col].notna(), None)
+        for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype) or df[col].dtype == object
+    })
+
+
+def drop_latest_orders(raw_dir: str, out_dir: str, share: float = LATE_ORDER_SHARE):
+    # Copies the source files without the latest share of orders, as an
+    # export taken before those orders arrived.
+    orders = pd.read_csv(os.path.join(raw_dir, RAW_TABLES["orders"]["file"]), usecols=["order_id", "order_purchase_timestamp"])
+    late = orders.sort_values("order_purchase_timestamp")["order_id"].iloc[int(len(orders) * (1 - share)):]
+    for spec in RAW_TABLES.values():
+        table = pd.read_csv(os.path.join(raw_dir, spec["file"]), dtype=str, keep_default_na=False)
+        if "order_id" in table:
+            table = table[~table["order_id"].isin(late)]
+        table.to_csv(os.path.join(out_dir, spec["file"]), index=False)
+
+
+def incremental_matches(raw_dir: str, chunk_rows: int = ITEM_CHUNK_ROWS):
+    # Builds a dataset from the export without the latest orders, upserts
+    # the full export into it and compares the result with a full build.
+    with tempfile.TemporaryDirectory() as root:
+        early_dir = os.path.join(root, "early")
+        os.makedirs(early_dir)
+        drop_latest_orders(raw_dir, early_dir)
+        blob_cache.BLOB_CACHE_DIR = os.path.join(root, "blobs")
+        bucket = use_local_store(os.path.join(root, "storage")).bucket(FACT_BUCKET)
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_pipeline(early_dir, bucket, chunk_rows, "incremental", None)
+            run_incremental(raw_dir, bucket, chunk_rows, "incremental")
+            run_pipeline(raw_dir, bucket, chunk_rows, "full", None)
+
+        def rows(prefix):
+            df = read_fact_dataset(bucket, load_manifest(bucket, prefix)).to_pandas()
+            return _as_objects(df).sort_values(["order_id", "order_item_id", "review_id"], na_position="first").reset_index(drop=True)
+
+        pd.testing.assert_frame_equal(rows("incremental"), rows("full"))
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run(scales, seed: int = 0, chunk_rows: int = ITEM_CHUNK_ROWS, legacy: bool = True):
+    print(f"{'scale':>6} {'rows':>12} {'notebook s':>11} {'pipeline s':>11} {'speedup':>8}  match  incremental")
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as raw_dir:
+            write_raw_csvs(make_fact_table(int(BASE_ROWS * scale), seed=seed), raw_dir)
+            new, new_time = _timed(build_fact_table, raw_dir, chunk_rows)
+
+            old_time, match, incremental = float("nan"), "-", "-"
+            if legacy:
+                old, old_time = _timed(legacy_fact_table, raw_dir)
+                try:
+                    pd.testing.assert_frame_equal(_as_objects(new), _as_objects(old), check_dtype=False)
+                    match = "yes"
+                except AssertionError as e:
+                    match = f"NO: {str(e).splitlines()[0]}"
+                try:
+                    incremental_matches(raw_dir, chunk_rows)
+                    incremental = "yes"
+                except AssertionError as e:
+                    incremental = f"NO: {str(e).splitlines()[0]}"
+
+        print(f"{scale:>6g} {len(new):>12,} {old_time:>11.2f} {new_time:>11.2f} {old_time / new_time:>7.1f}x  {match}  {incremental}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the ETL pipeline with the notebook's fact table build on synthetic Olist CSVs.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10], help="multiples of the current fact table size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=ITEM_CHUNK_ROWS, help="order items per pipeline chunk")
+    parser.add_argument("--no-legacy", action="store_true", help="only time the pipeline, without the output checks")
+    args = parser.parse_args(argv)
+    run(args.scales, args.seed, args.chunk_rows, legacy=not args.no_legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import BASE_ROWS, make_fact_table
+from features.fraud import FRAUD_RULES_PATH, compare_repeat_orders, empty_fraud_state, load_fraud_rules
+
+
+def legacy_score(comp):
+    # The chained .loc rules from before the rule engine, for timing.
+    comp = comp.copy()
+    comp['fraud_score'] = 0
+    comp.loc[(comp['value_ratio'] >= 5) & comp['different_zip'], 'fraud_score'] = 100
+    comp.loc[comp['value_ratio'] >= 5, 'fraud_score'] = comp['fraud_score'].combine(75, max)
+    comp.loc[(3 <= comp['value_ratio']) & (comp['value_ratio'] < 5) & comp['different_zip'], 'fraud_score'] = 50
+    return comp['fraud_score'].to_numpy()
+
+
+def load_history(source: str, scale: float, seed: int):
+    if source == "gcs":
+        from features.fraud import MODEL_BUCKET, load_raw_orders
+        from helpers.gcs_loader import get_storage_client
+        df, _ = load_raw_orders(get_storage_client().bucket(MODEL_BUCKET))
+        return df
+    return make_fact_table(int(BASE_ROWS * scale), seed=seed)
+
+
+def _best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def run(rules, df, repeat: int = 5):
+    comp, _ = compare_repeat_orders(df, empty_fraud_state())
+    print(f"Order history: {len(df):,} rows, {len(comp):,} repeat rows compared against a first order")
+
+    hits, hits_time = _best_of(lambda: rules.hits(comp), repeat)
+    scores, score_time = _best_of(lambda: rules.score(comp, hits), repeat)
+    _, band_time = _best_of(lambda: rules.risk_band(scores[scores >= rules.threshold]), repeat)
+
+    print(f"\n{'rule':<28} {'score':>6} {'hits':>10} {'hit rate':>9}")
+    for name, weight, row in zip(rules.names, rules.weights, hits):
+        print(f"{name:<28} {weight:>6} {int(row.sum()):>10,} {row.mean() if len(row) else 0:>9.3%}")
+    flagged = int((scores >= rules.threshold).sum())
+    print(f"{'flagged (>= threshold)':<28} {rules.threshold:>6} {flagged:>10,} {flagged / max(len(comp), 1):>9.3%}")
+
+    print(f"\nconditions  {hits_time * 1000:8.2f} ms")
+    print(f"combine     {score_time * 1000:8.2f} ms")
+    print(f"risk bands  {band_time * 1000:8.2f} ms")
+
+    legacy, legacy_time = _best_of(lambda: legacy_score(comp), repeat)
+    print(f"legacy .loc {legacy_time * 1000:8.2f} ms  (rule set {'matches' if np.array_equal(legacy, scores) else 'differs from'} the legacy scores)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report per-rule hit rates and evaluation time of the fraud rule set.")
+    parser.add_argument("--rules", default=FRAUD_RULES_PATH, help="rule set JSON")
+    parser.add_argument("--source", choices=["synthetic", "gcs"], default="synthetic", help="order history to score")
+    parser.add_argument("--scale", type=float, default=1, help="synthetic history size as a multiple of the current fact table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions (best is reported)")
+    args = parser.parse_args(argv)
+
+    df = load_history(args.source, args.scale, args.seed)
+    run(load_fraud_rules(args.rules), df, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import datetime
+import inspect
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pyarrow as pa
+import pandas as pd
+
+from benchmarks.synthetic import use_synthetic_store
+from features import churn, customer_behaviours, delivery, fraud, geographic_insight, sales_forecasting, sales_performance
+from helpers import exports, forecast_refresh, forecast_store, forecasting
+from helpers.fact_cube import get_fact_cube
+from helpers.fact_filters import FactFilters
+from helpers.memory_cache import CACHE, enable_copy_on_write
+from helpers.model_registry import ModelRegistry
+from jobs.train_churn import train_and_publish
+
+# Every panel app.py renders, in tab order, with the widget values to use
+# where the defaults would skip the panel's main path.
+PANELS = [
+    (sales_performance, "render_revenue_overtime", {}),
+    (sales_performance, "render_product_partition", {}),
+    (sales_performance, "render_product_leaderboard", {}),
+    (sales_forecasting, "render_revenue_forecasting", {}),
+    (sales_forecasting, "render_key_forecast_metris", {}),
+    (sales_forecasting, "render_seasonal_segmentation", {}),
+    (customer_behaviours, "render_customer_loyalty", {}),
+    (customer_behaviours, "render_sales_volumes_by_reviews", {}),
+    (customer_behaviours, "render_payment_analysis", {}),
+    (geographic_insight, "render_sales_by_region", {}),
+    (geographic_insight, "render_customer_distribution", {}),
+    (geographic_insight, "render_seller_performance_by_region", {}),
+    (geographic_insight, "render_city_level_analysis", {}),
+    (geographic_insight, "render_regional_product_preferences", {}),
+    (delivery, "render_delivery_performance", {}),
+    (delivery, "render_delivery_delay_analysis", {}),
+    (delivery, "render_delivery_by_state", {}),
+    (delivery, "render_freight_analysis", {}),
+    (churn, "render_churn_prediction", {}),
+    (churn, "render_churn_prediction", {"churn_view": "Risk ranking"}),
+    (fraud, "render_fraud_detection", {}),
+]
+# Filter bar selections every fact panel is run with: the default, and one
+# that prunes dates, keeps several statuses and narrows states and
+# categories, so the sliced cube and the filtered scans are measured too.
+SELECTIONS = {
+    "default": {},
+    "filtered": {
+        "start": datetime.date(2017, 3, 15),
+        "end": datetime.date(2018, 2, 14),
+        "statuses": ("delivered", "shipped"),
+        "states": ("SP", "RJ", "MG"),
+        "categories": ("Bed Table Bath", "Beauty Health", "Sports Leisure"),
+    },
+}
+STUBBED_MODULES = [sales_performance, sales_forecasting, customer_behaviours, geographic_insight, delivery, churn, fraud, exports]
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "panels_baseline.json")
+METRICS = ["cold_ms", "warm_ms", "peak_mb", "allocs"]
+
+
+class PanelStopped(Exception):
+    pass
+
+
+class StreamlitStub:
+    # Stands in for the streamlit module and every container it returns.
+    # Widgets return their default (or the value set for their key), and
+    # charts and tables are serialized as Streamlit would before sending
+    # them to the browser, so that cost stays in the measurement.
+    def __init__(self):
+        self.session_state = {}
+        self.values = {}
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _widget(self, key, default):
+        value = self.values.get(key, default)
+        if key is not None:
+            self.session_state[key] = value
+        return value
+
+    def columns(self, spec, **kwargs):
+        return [self] * (spec if isinstance(spec, int) else len(spec))
+
+    def tabs(self, labels):
+        return [self] * len(labels)
+
+    def selectbox(self, label, options, index=0, key=None, **kwargs):
+        options = list(options)
+        return self._widget(key, options[index] if options and index is not None else None)
+
+    radio = selectbox
+
+    def multiselect(self, label, options, default=None, key=None, **kwargs):
+        return self._widget(key, list(default or []))
+
+    def date_input(self, label, value=None, key=None, **kwargs):
+        return self._widget(key, value)
+
+    def number_input(self, label, min_value=None, max_value=None, value=None, key=None, **kwargs):
+        return self._widget(key, min_value if value is None else value)
+
+    def slider(self, label, min_value=None, max_value=None, value=None, key=None, **kwargs):
+        return self._widget(key, min_value if value is None else value)
+
+    def text_input(self, label, value="", key=None, **kwargs):
+        return self._widget(key, value)
+
+    def checkbox(self, label, value=False, key=None, **kwargs):
+        return self._widget(key, value)
+
+    def button(self, *args, **kwargs):
+        return False
+
+    download_button = form_submit_button = button
+
+    def stop(self):
+        raise PanelStopped()
+
+    def altair_chart(self, chart, **kwargs):
+        chart.to_dict()
+
+    def plotly_chart(self, figure, **kwargs):
+        figure.to_json()
+
+    def dataframe(self, data=None, **kwargs):
+        if isinstance(data, pd.DataFrame):
+            pa.Table.from_pandas(data)
+
+    table = dataframe
+
+
+def use_stub():
+    stub = StreamlitStub()
+    for module in STUBBED_MODULES:
+        module.st = stub
+    return stub
+
+
+def prepare_models(root: str):
+    # Publishes a churn model and the total revenue forecast for the
+    # synthetic data, so those panels run their full path.
+    churn.CHURN_REGISTRY = os.path.join(root, "churn")
+    train_and_publish(ModelRegistry(churn.CHURN_REGISTRY), None, 0.0)
+    churn.get_churn_model_version.clear()
+
+    forecast_store.FORECAST_STORE_DIR = os.path.join(root, "forecasts")
+    # The module attribute for this process; the variable for the spawned
+    # workers that fit the forecast, which import the module anew.
+    forecasting.FORECAST_CACHE_DIR = os.path.join(root, "forecast_cache")
+    os.environ["BDABI_FORECAST_CACHE_DIR"] = forecasting.FORECAST_CACHE_DIR
+    forecast_refresh.FORECAST_BACKGROUND = False
+    forecast_refresh.precompute(get_fact_cube(), None, top=0, workers=1)
+
+
+def takes_filters(render):
+    return "filters" in inspect.signature(render).parameters
+
+
+def _render(stub, render, values, selection):
+    stub.session_state.clear()
+    stub.values = values
+    try:
+        # Fact panels get the filter bar selection, sliced anew on every run
+        # as in a rerun of the app.
+        if takes_filters(render):
+            render(stub, FactFilters(**selection))
+        else:
+            render(stub)
+        return "ok"
+    except PanelStopped:
+        return "stopped"
+
+
+def measure(stub, render, values, repeat: int, selection=None):
+    # Memory is measured on its own cold run, since tracing slows every
+    # allocation down; allocs are the traced blocks the panel left live
+    # (its output and what it cached).
+    selection = selection or {}
+    CACHE.clear()
+    tracemalloc.start()
+    before = len(tracemalloc.take_snapshot().traces)
+    try:
+        status = _render(stub, render, values, selection)
+        _, peak = tracemalloc.get_traced_memory()
+        allocs = len(tracemalloc.take_snapshot().traces) - before
+    finally:
+        tracemalloc.stop()
+
+    CACHE.clear()
+    start = time.perf_counter()
+    _render(stub, render, values, selection)
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _render(stub, render, values, selection)
+        warm.append(time.perf_counter() - start)
+
+    return {
+        "cold_ms": cold * 1000,
+        "warm_ms": statistics.median(warm) * 1000,
+        "peak_mb": peak / 1024 ** 2,
+        "allocs": allocs,
+        "status": status,
+    }
+
+
+def panel_name(module, function: str, values: dict, selection: str = "default"):
+    # Runs with the default selection keep their plain name, which the
+    # baseline files them under.
+    name = f"{module.__name__.rsplit('.', 1)[-1]}.{function.removeprefix('render_')}"
+    labels = [*values.values(), *([selection] if selection != "default" else [])]
+    return name + "".join(f"[{v}]" for v in labels)
+
+
+def compare(result: dict, baseline: dict, tolerance: float):
+    # Metrics more than `tolerance` times their baseline; values too small
+    # to time reliably are ignored.
+    floors = {"cold_ms": 5, "warm_ms": 5, "peak_mb": 1, "allocs": 100}
+    return [
+        f"{metric} x{result[metric] / max(baseline[metric], floors[metric]):.2f}"
+        for metric in METRICS
+        if metric in baseline and result[metric] > floors[metric] and result[metric] > tolerance * max(baseline[metric], floors[metric])
+    ]
+
+
+def run(scales, seed: int = 0, repeat: int = 3, panels=None, baseline=None, tolerance: float = 1.25):
+    enable_copy_on_write()
+    stub = use_stub()
+    results, regressions = {}, 0
+    print(f"{'scale':>6} {'panel':<60} {'cold ms':>9} {'warm ms':>9} {'peak MB':>9} {'allocs':>9}  {'status':<8} vs baseline")
+    for scale in scales:
+        scale_key = f"{scale:g}"
+        results[scale_key] = {}
+        with tempfile.TemporaryDirectory() as root:
+            use_synthetic_store(root, scale, seed)
+            prepare_models(root)
+            for module, function, values in PANELS:
+                render = getattr(module, function)
+                for selection, filters in (SELECTIONS.items() if takes_filters(render) else [("default", {})]):
+                    name = panel_name(module, function, values, selection)
+                    if panels and not any(p in name for p in panels):
+                        continue
+                    result = measure(stub, render, values, repeat, filters)
+                    results[scale_key][name] = result
+                    base = (baseline or {}).get(scale_key, {}).get(name)
+                    slower = compare(result, base, tolerance) if base else []
+                    regressions += bool(slower)
+                    note = ", ".join(slower) if slower else ("ok" if base else "-")
+                    print(f"{scale:>6g} {name:<60} {result['cold_ms']:>9.1f} {result['warm_ms']:>9.1f} {result['peak_mb']:>9.1f} {result['allocs']:>9,}  {result['status']:<8} {note}")
+    return results, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run every dashboard panel headlessly on synthetic fact tables and compare with a stored baseline.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100], help="multiples of the current fact table size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="warm runs per panel (median is reported)")
+    parser.add_argument("--panels", nargs="+", help="only panels whose name contains one of these")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown factor reported as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results, regressions = run(args.scales, args.seed, args.repeat, args.panels, baseline, args.tolerance)
+    if args.save_baseline:
+        merged = {**(baseline or {})}
+        for scale, panels in results.items():
+            merged[scale] = {**merged.get(scale, {}), **panels}
+        with open(args.baseline, "w") as f:
+            json.dump(merged, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"{regressions} panel(s) slower than the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
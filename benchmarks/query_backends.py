@@ -0,0 +1,73 @@
+import argparse
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import use_synthetic_store
+from helpers.fact_store import DELIVERED
+from helpers.query_engine import BACKENDS, aggregate_fact
+
+# The panel aggregations that run on the fact table rather than the cube.
+QUERIES = {
+    "city analysis": (["customer_city", "customer_state"], {
+        "customers": ("customer_id", "nunique"),
+        "orders": ("order_id", "nunique"),
+        "revenue": ("payment_value", "sum"),
+        "review_score": ("review_score", "mean"),
+    }, DELIVERED, "2017-01-01", "2018-06-30"),
+    "customer loyalty": (["customer_unique_id"], {"Order_Count": ("order_id", "nunique")}, DELIVERED, None, None),
+    "orders by review": (["review_score"], {"Total_Orders": ("order_id", "nunique")}, DELIVERED, None, None),
+}
+
+
+def _comparable(df: pd.DataFrame, keys):
+    df = df.astype({key: float if pd.api.types.is_numeric_dtype(df[key]) else str for key in keys})
+    return df.sort_values(keys).reset_index(drop=True).astype({c: float for c in df.columns if c not in keys})
+
+
+def _timed(fn, repeat: int):
+    start = time.perf_counter()
+    result = fn()
+    first = time.perf_counter() - start
+    best = first
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return result, first, best
+
+
+def run(scales, seed: int = 0, repeat: int = 3):
+    # "first" includes loading the fact frame (pandas) or the Parquet
+    # footers (duckdb); "best" is the warm panel rerun.
+    print(f"{'scale':>6} {'rows':>12} {'query':<18} {'backend':<8} {'first ms':>9} {'best ms':>9} {'groups':>9}  match")
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as root:
+            rows = use_synthetic_store(root, scale, seed)
+            for name, (by, aggregations, filters, start, end) in QUERIES.items():
+                results = {}
+                for backend in BACKENDS:
+                    result, first, best = _timed(lambda: aggregate_fact(by, aggregations, filters, start, end, backend), repeat)
+                    results[backend] = _comparable(result, by)
+                    match = "-"
+                    if backend != "pandas":
+                        try:
+                            pd.testing.assert_frame_equal(results[backend], results["pandas"], check_dtype=False)
+                            match = "yes"
+                        except AssertionError as e:
+                            match = f"NO: {str(e).splitlines()[0]}"
+                    print(f"{scale:>6g} {rows:>12,} {name:<18} {backend:<8} {first * 1000:>9.1f} {best * 1000:>9.1f} {len(result):>9,}  {match}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the panel aggregations on each query backend over a synthetic fact dataset.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10], help="multiples of the current fact table size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per query (best is reported)")
+    args = parser.parse_args(argv)
+    run(args.scales, args.seed, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
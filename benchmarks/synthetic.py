@@ -0,0 +1,318 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from helpers import blob_cache, gcs_loader
+from helpers.fact_dataset import fact_schema, new_dataset_version, publish_dataset, write_partitions
+from helpers.fact_store import FACT_BLOB, FACT_BUCKET, FACT_DATASET
+
+# Row count of the preprocessed Olist fact table written by BDA_BI.ipynb.
+BASE_ROWS = 113_314
+# Item rows generated at a time; memory use is set by this, not the table.
+CHUNK_ROWS = 250_000
+
+START = pd.Timestamp("2016-09-04")
+END = pd.Timestamp("2018-09-03")
+
+ORDER_STATUSES = ["delivered"]
+PAYMENT_TYPES = ["credit_card", "boleto", "voucher", "debit_card"]
+PAYMENT_WEIGHTS = [0.74, 0.19, 0.055, 0.015]
+REVIEW_SCORES = [1, 2, 3, 4, 5]
+REVIEW_WEIGHTS = [0.11, 0.03, 0.08, 0.19, 0.59]
+STATES = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "DF", "GO", "ES", "PE", "CE", "PA", "MT", "MA", "MS", "PB", "PI", "RN", "AL", "SE", "TO", "RO", "AM", "AC", "AP", "RR"]
+CATEGORIES = [
+    "cama_mesa_banho", "beleza_saude", "esporte_lazer", "moveis_decoracao", "informatica_acessorios",
+    "utilidades_domesticas", "relogios_presentes", "telefonia", "ferramentas_jardim", "automotivo",
+    "brinquedos", "cool_stuff", "perfumaria", "bebes", "eletronicos", "papelaria",
+    "fashion_bolsas_e_acessorios", "pet_shop", "moveis_escritorio", "consoles_games",
+    "malas_acessorios", "construcao_ferramentas_construcao", "eletrodomesticos", "instrumentos_musicais",
+    "eletroportateis", "casa_construcao", "livros_interesse_geral", "alimentos", "moveis_sala", "unknown",
+]
+
+# Share of item rows whose order is not in the delivered order table; the
+# ETL left-joins items to orders, so these rows carry no order columns.
+UNMATCHED_ORDER_SHARE = 0.022
+MISSING_REVIEW_SHARE = 0.008
+COMMENT_SHARE = 0.41
+REPEAT_ORDER_SHARE = 0.03
+MOVED_SHARE = 0.1
+
+
+def _hex_bytes(rng, n: int):
+    # 32-character lowercase hex ids, like Olist's, without a Python loop;
+    # as bytes they take a quarter of the memory of str.
+    digits = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    raw = rng.integers(0, 16, size=(n, 32), dtype=np.uint8)
+    return digits[raw].view("S32").ravel()
+
+
+def _hex_ids(rng, n: int):
+    return _hex_bytes(rng, n).astype(str)
+
+
+def _skewed(rng, n: int, size: int, skew: float):
+    # Index in [0, n) where low indexes are drawn more often as skew grows;
+    # skew=1 is uniform.
+    return np.minimum((rng.random(size) ** skew * n).astype(np.int64), n - 1)
+
+
+def _seconds(values):
+    return (np.asarray(values, dtype=float) * 1e9).astype(np.int64).view("m8[ns]")
+
+
+def _timestamps(rng, size: int):
+    # Order volume grows over the period, as it does in the real data.
+    span = (END - START).total_seconds()
+    seconds = np.sqrt(rng.random(size)) * span
+    return pd.DatetimeIndex(START.to_datetime64() + _seconds(seconds.astype(np.int64)))
+
+
+def make_catalog(n_rows: int, seed: int = 0, skew: float = 2.0):
+    # Products and sellers for a table of n_rows items; every chunk of a
+    # table built in parts draws from the same catalog.
+    rng = np.random.default_rng([seed, n_rows])
+    n_products = max(n_rows // 3, 1)
+    n_sellers = max(n_rows // 37, 1)
+    category = _skewed(rng, len(CATEGORIES), n_products, skew).astype(np.int8)
+    known = category != CATEGORIES.index("unknown")
+    seller_state = np.asarray(STATES)[_skewed(rng, len(STATES), n_sellers, skew * 1.5)]
+    return {
+        "product_id": _hex_bytes(rng, n_products),
+        "product_category_name": category,
+        "price": np.round(rng.lognormal(4.4, 0.9, n_products), 2),
+        "product_name_lenght": np.where(known, rng.integers(5, 76, n_products), np.nan),
+        "product_description_lenght": np.where(known, rng.integers(4, 3993, n_products), np.nan),
+        "product_photos_qty": np.where(known, rng.integers(1, 8, n_products), np.nan),
+        "product_weight_g": rng.gamma(1.0, 2000.0, n_products).round(),
+        "product_length_cm": rng.integers(7, 106, n_products).astype(float),
+        "product_height_cm": rng.integers(2, 106, n_products).astype(float),
+        "product_width_cm": rng.integers(6, 119, n_products).astype(float),
+        "seller_id": _hex_bytes(rng, n_sellers),
+        "seller_zip_code_prefix": rng.integers(1000, 99999, n_sellers).astype(str),
+        "seller_city": np.char.add("cidade ", seller_state),
+        "seller_state": seller_state,
+    }
+
+
+PRODUCT_COLUMNS = [
+    "product_name_lenght", "product_description_lenght", "product_photos_qty",
+    "product_weight_g", "product_length_cm", "product_height_cm", "product_width_cm",
+]
+SELLER_COLUMNS = ["seller_zip_code_prefix", "seller_city", "seller_state"]
+
+
+def make_fact_table(n_rows: int = BASE_ROWS, seed: int = 0, skew: float = 2.0, catalog=None, chunk: int = 0):
+    # Olist-shaped fact table with the 48 columns and dtypes written by
+    # BDA_BI.ipynb: one row per order item, order, customer, product, seller,
+    # payment and review columns repeated across the items of an order.
+    # skew concentrates sales on the first products, sellers, categories and
+    # states. A table built in chunks passes its catalog and the chunk
+    # number, which seeds the chunk's orders.
+    catalog = catalog if catalog is not None else make_catalog(n_rows, seed, skew)
+    rng = np.random.default_rng([seed, chunk])
+
+    # About 1.14 items per order and 3% of orders from returning customers.
+    items_per_order = rng.geometric(0.88, n_rows)
+    item_order = np.repeat(np.arange(n_rows), items_per_order)[:n_rows]
+    n_orders = int(item_order[-1]) + 1 if n_rows else 0
+    order_item_id = np.arange(n_rows) - np.searchsorted(item_order, item_order, side="left") + 1
+
+    order_customer = np.arange(n_orders)
+    returning = rng.random(n_orders) < REPEAT_ORDER_SHARE
+    order_customer[returning] = _skewed(rng, n_orders, int(returning.sum()), skew)
+    customers, order_customer = np.unique(order_customer, return_inverse=True)
+    n_customers = len(customers)
+    n_products = len(catalog["product_id"])
+    n_sellers = len(catalog["seller_id"])
+
+    # Order level
+    order_ids = _hex_ids(rng, n_orders)
+    customer_ids = _hex_ids(rng, n_orders)
+    purchase = _timestamps(rng, n_orders)
+    approved = purchase + _seconds(rng.exponential(10, n_orders) * 3600)
+    carrier = approved + _seconds(rng.gamma(2.0, 1.5, n_orders) * 86400)
+    delivered = carrier + _seconds(rng.gamma(2.5, 3.5, n_orders) * 86400)
+    estimated = (purchase + _seconds(rng.normal(24, 8, n_orders).clip(3) * 86400)).normalize()
+    matched = rng.random(n_orders) >= UNMATCHED_ORDER_SHARE
+    approved = approved.where(rng.random(n_orders) >= 0.0002)
+
+    customer_unique_ids = _hex_ids(rng, n_customers)
+    customer_state = np.asarray(STATES)[_skewed(rng, len(STATES), n_customers, skew)]
+    customer_zip = rng.integers(1000, 99999, n_customers).astype(str)
+    customer_city = np.char.add("cidade ", customer_zip.astype("U3"))
+    # Some returning customers order to a different address.
+    order_zip = customer_zip[order_customer]
+    moved = returning & (rng.random(n_orders) < MOVED_SHARE)
+    order_zip[moved] = rng.integers(1000, 99999, int(moved.sum())).astype(str)
+
+    payment_type = rng.choice(PAYMENT_TYPES, n_orders, p=PAYMENT_WEIGHTS)
+    installments = np.where(payment_type == "credit_card", rng.integers(1, 11, n_orders), 1).astype(float)
+    has_review = rng.random(n_orders) >= MISSING_REVIEW_SHARE
+    review_score = rng.choice(REVIEW_SCORES, n_orders, p=REVIEW_WEIGHTS).astype(float)
+    has_comment = rng.random(n_orders) < COMMENT_SHARE
+    review_created = (delivered + _seconds(rng.integers(0, 5, n_orders) * 86400)).normalize()
+    review_answered = review_created + _seconds(rng.exponential(2, n_orders) * 86400)
+
+    # Item level
+    product_index = _skewed(rng, n_products, n_rows, skew)
+    seller_index = _skewed(rng, n_sellers, n_rows, skew)
+    price = catalog["price"][product_index]
+    freight = np.round(rng.gamma(2.0, 10.0, n_rows), 2)
+
+    order_total = np.bincount(item_order, weights=price + freight, minlength=n_orders)
+    payment_value = np.round(order_total * np.where(rng.random(n_orders) < 0.03, rng.uniform(1.0, 1.3, n_orders), 1.0), 2)
+    payment_missing = rng.random(n_orders) < 0.00003
+    payment_value[payment_missing] = np.nan
+    installments[payment_missing] = np.nan
+
+    def order_col(values, mask=matched):
+        column = pd.Series(values)
+        if mask is not None:
+            column = column.where(mask)
+        return column.to_numpy()[item_order]
+
+    purchase_ts = pd.Series(order_col(purchase))
+    delivered_ts = pd.Series(order_col(delivered))
+    estimated_ts = pd.Series(order_col(estimated))
+
+    fact = pd.DataFrame({
+        "order_id": order_ids[item_order],
+        "order_item_id": order_item_id.astype(np.int64),
+        "product_id": catalog["product_id"][product_index].astype(str),
+        "seller_id": catalog["seller_id"][seller_index].astype(str),
+        "shipping_limit_date": (purchase + pd.Timedelta(days=6)).to_numpy()[item_order],
+        "price": price,
+        "freight_value": freight,
+        "customer_id": order_col(customer_ids),
+        "order_status": order_col(np.full(n_orders, ORDER_STATUSES[0], dtype=object)),
+        "order_purchase_timestamp": purchase_ts,
+        "order_approved_at": order_col(approved),
+        "order_delivered_carrier_date": order_col(carrier),
+        "order_delivered_customer_date": delivered_ts,
+        "order_estimated_delivery_date": estimated_ts,
+        "delivery_time": (delivered_ts - purchase_ts).dt.days,
+        "delay_vs_estimated": (delivered_ts - estimated_ts).dt.days,
+        "customer_unique_id": order_col(customer_unique_ids[order_customer]),
+        "customer_zip_code_prefix": order_col(order_zip),
+        "customer_city": order_col(customer_city[order_customer]),
+        "customer_state": order_col(customer_state[order_customer]),
+        "product_category_name": np.asarray(CATEGORIES)[catalog["product_category_name"][product_index]],
+        **{column: catalog[column][product_index] for column in PRODUCT_COLUMNS},
+        **{column: catalog[column][seller_index] for column in SELLER_COLUMNS},
+        "payment_value": payment_value[item_order],
+        "payment_installments": installments[item_order],
+        "payment_type": order_col(payment_type, ~payment_missing),
+        "review_id": order_col(_hex_ids(rng, n_orders), has_review),
+        "review_score": order_col(review_score, has_review),
+        "review_comment_title": order_col(np.where(has_comment & (rng.random(n_orders) < 0.3), "recomendo", ""), has_review),
+        "review_comment_message": order_col(np.where(has_comment, "produto entregue dentro do prazo", ""), has_review),
+        "review_creation_date": order_col(review_created, has_review),
+        "review_answer_timestamp": order_col(review_answered, has_review),
+    })
+
+    fact["purchase_date"] = fact["order_purchase_timestamp"].dt.date
+    fact["purchase_year"] = fact["order_purchase_timestamp"].dt.year
+    fact["purchase_month"] = fact["order_purchase_timestamp"].dt.to_period("M")
+    fact["purchase_weekday"] = fact["order_purchase_timestamp"].dt.weekday
+    fact["estimated_delivery_time"] = (fact["order_estimated_delivery_date"] - fact["order_purchase_timestamp"]).dt.days
+    fact["delivery_delay"] = (fact["order_delivered_customer_date"] - fact["order_estimated_delivery_date"]).dt.days
+    fact["item_total"] = fact["price"] + fact["freight_value"]
+    fact["has_comment"] = (fact["review_comment_message"].str.len() > 0).astype(int)
+    return fact
+
+
+def iter_fact_tables(n_rows: int, seed: int = 0, skew: float = 2.0, chunk_rows: int = CHUNK_ROWS):
+    # The table make_fact_table would build, in chunks of chunk_rows items
+    # sharing one catalog; a single chunk is exactly make_fact_table's table.
+    catalog = make_catalog(n_rows, seed, skew)
+    for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+        yield make_fact_table(min(chunk_rows, n_rows - start), seed, skew, catalog, chunk)
+
+
+def write_synthetic_dataset(bucket, n_rows: int, seed: int = 0, skew: float = 2.0, chunk_rows: int = CHUNK_ROWS, fact_blob=None):
+    # Streams a synthetic fact table into the partitioned dataset, as the
+    # ETL does, and into the monolithic blob if fact_blob is set.
+    version = new_dataset_version()
+    files, columns, rows = [], None, 0
+    writer = schema = None
+    with tempfile.TemporaryDirectory() as tmp:
+        monolithic = os.path.join(tmp, "fact.parquet")
+        for part, fact in enumerate(iter_fact_tables(n_rows, seed, skew, chunk_rows)):
+            columns = columns or list(fact.columns)
+            if schema is None:
+                schema = fact_schema(fact)
+            rows += len(fact)
+            files += write_partitions(fact, bucket, FACT_DATASET, version, part, schema)
+            if fact_blob:
+                table = pa.Table.from_pandas(fact, schema=schema, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(monolithic, table.schema)
+                writer.write_table(table)
+
+        if writer is not None:
+            writer.close()
+            bucket.blob(fact_blob).upload_from_filename(monolithic)
+    if files:
+        publish_dataset(bucket, FACT_DATASET, version, columns, files, schema=schema)
+    return version, rows
+
+
+def use_local_store(root: str):
+    gcs_loader.STORAGE_ROOT = root
+    gcs_loader.get_storage_client.clear()
+    gcs_loader.get_blob_generation.clear()
+    return gcs_loader.get_storage_client()
+
+
+def use_synthetic_store(root: str, scale: float, seed: int = 0, skew: float = 2.0):
+    # Points the app's storage and blob cache at a fresh directory holding a
+    # synthetic fact dataset.
+    blob_cache.BLOB_CACHE_DIR = os.path.join(root, "blobs")
+    bucket = use_local_store(os.path.join(root, "storage")).bucket(FACT_BUCKET)
+    _, rows = write_synthetic_dataset(bucket, int(BASE_ROWS * scale), seed, skew)
+    return rows
+
+
+def seed_models(bucket):
+    # Fraud candidates and a promoted churn model for the synthetic data, so
+    # those tabs open without running their jobs first.
+    from features.churn import CHURN_REGISTRY
+    from features.fraud import refresh_fraud_candidates
+    from helpers.fact_store import get_fact_version
+    from helpers.model_registry import ModelRegistry
+    from jobs.train_churn import train_and_publish
+
+    candidates, _ = refresh_fraud_candidates(bucket)
+    print(f"Scored {0 if candidates is None else len(candidates):,} fraud candidates")
+    version, metrics, _ = train_and_publish(ModelRegistry(CHURN_REGISTRY), get_fact_version(), 0.0)
+    print(f"Published churn model {version} with AUC {metrics['auc']:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Olist-shaped fact dataset to a local storage root, to run and load-test the dashboard without GCS.")
+    parser.add_argument("root", help="storage root to point BDABI_STORAGE_ROOT at")
+    parser.add_argument("--rows", type=int, default=BASE_ROWS, help="order item rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=2.0, help="concentration of sales on top products, sellers, categories and states (1 is uniform)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows generated at a time")
+    parser.add_argument("--blob", action="store_true", help="also write the monolithic fact blob")
+    parser.add_argument("--models", action="store_true", help="also score fraud candidates and train a churn model")
+    args = parser.parse_args(argv)
+
+    bucket = use_local_store(args.root).bucket(FACT_BUCKET)
+    start = time.perf_counter()
+    version, rows = write_synthetic_dataset(bucket, args.rows, args.seed, args.skew, args.chunk_rows, FACT_BLOB if args.blob else None)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {rows:,} fact rows (dataset {version}) in {elapsed:.1f}s, {rows / elapsed:,.0f} rows/s")
+    if args.models:
+        seed_models(bucket)
+
+
+if __name__ == "__main__":
+    main()
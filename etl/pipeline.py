@@ -0,0 +1,401 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from helpers.fact_dataset import (
+    PARTITION_COLUMNS,
+    dataset_schema,
+    fact_schema,
+    load_manifest,
+    new_dataset_version,
+    partition_key,
+    partition_values,
+    publish_dataset,
+    read_fact_dataset,
+    write_partitions,
+)
+from helpers.fact_store import FACT_BLOB, FACT_BUCKET, FACT_DATASET
+from helpers.gcs_loader import FETCH_WORKERS, get_storage_client
+
+# The fact table build from BDA_BI.ipynb: order items left-joined to their
+# order, customer, product, seller, payments and reviews. Only the order
+# items are read in chunks; every other table is a dimension held in memory.
+# Columns a left join or a missing date can leave empty are float64 in every
+# chunk, whether or not the chunk has an empty value, so chunks and
+# incremental upserts write one schema.
+CSV_DATE_FORMAT = "ISO8601"
+ITEM_CHUNK_ROWS = 250_000
+# Events that change an order's fact rows. Payments carry no timestamp and
+# arrive with the order's purchase.
+ORDER_EVENTS = ["order_purchase_timestamp", "order_approved_at", "order_delivered_carrier_date", "order_delivered_customer_date"]
+REVIEW_EVENTS = ["review_creation_date", "review_answer_timestamp"]
+
+RAW_TABLES = {
+    "customers": {
+        "file": "olist_customers_dataset.csv",
+        "dtype": {
+            "customer_id": str,
+            "customer_unique_id": str,
+            "customer_zip_code_prefix": "int32",
+            "customer_city": "category",
+            "customer_state": "category",
+        },
+    },
+    "orders": {
+        "file": "olist_orders_dataset.csv",
+        "dtype": {"order_id": str, "customer_id": str, "order_status": "category"},
+        "dates": [
+            "order_purchase_timestamp",
+            "order_approved_at",
+            "order_delivered_carrier_date",
+            "order_delivered_customer_date",
+            "order_estimated_delivery_date",
+        ],
+    },
+    "order_items": {
+        "file": "olist_order_items_dataset.csv",
+        "dtype": {
+            "order_id": str,
+            "order_item_id": "int64",
+            "product_id": str,
+            "seller_id": str,
+            "price": "float64",
+            "freight_value": "float64",
+        },
+        "dates": ["shipping_limit_date"],
+    },
+    "payments": {
+        "file": "olist_order_payments_dataset.csv",
+        "dtype": {
+            "order_id": str,
+            "payment_sequential": "int64",
+            "payment_type": "category",
+            "payment_installments": "float64",
+            "payment_value": "float64",
+        },
+    },
+    "reviews": {
+        "file": "olist_order_reviews_dataset.csv",
+        "dtype": {
+            "review_id": str,
+            "order_id": str,
+            "review_score": "float64",
+            "review_comment_title": str,
+            "review_comment_message": str,
+        },
+        "dates": ["review_creation_date", "review_answer_timestamp"],
+    },
+    "products": {
+        "file": "olist_products_dataset.csv",
+        "dtype": {
+            "product_id": str,
+            "product_category_name": str,
+            "product_name_lenght": "float64",
+            "product_description_lenght": "float64",
+            "product_photos_qty": "float64",
+            "product_weight_g": "float64",
+            "product_length_cm": "float64",
+            "product_height_cm": "float64",
+            "product_width_cm": "float64",
+        },
+    },
+    "sellers": {
+        "file": "olist_sellers_dataset.csv",
+        "dtype": {
+            "seller_id": str,
+            "seller_zip_code_prefix": "int32",
+            "seller_city": "category",
+            "seller_state": "category",
+        },
+    },
+}
+PRODUCT_MEASURES = [
+    "product_name_lenght", "product_description_lenght", "product_photos_qty",
+    "product_weight_g", "product_length_cm", "product_height_cm", "product_width_cm",
+]
+
+
+def read_raw_table(raw_dir: str, name: str, chunksize=None):
+    spec = RAW_TABLES[name]
+    return pd.read_csv(
+        os.path.join(raw_dir, spec["file"]),
+        usecols=list(spec["dtype"]) + spec.get("dates", []),
+        dtype=spec["dtype"],
+        parse_dates=spec.get("dates", []),
+        date_format=CSV_DATE_FORMAT,
+        chunksize=chunksize,
+    )
+
+
+def prepare_orders(orders: pd.DataFrame):
+    orders = orders.drop_duplicates()
+    orders = orders[(orders["order_status"] == "delivered") & orders["order_delivered_customer_date"].notna()]
+    return orders.assign(
+        delivery_time=(orders["order_delivered_customer_date"] - orders["order_purchase_timestamp"]).dt.days.astype("float64"),
+        delay_vs_estimated=(orders["order_delivered_customer_date"] - orders["order_estimated_delivery_date"]).dt.days.astype("float64"),
+    )
+
+
+def prepare_customers(customers: pd.DataFrame):
+    customers = customers.drop_duplicates()
+    return customers.assign(customer_zip_code_prefix=customers["customer_zip_code_prefix"].astype(str))
+
+
+def prepare_products(products: pd.DataFrame):
+    products = products.drop_duplicates()
+    products = products.assign(product_category_name=products["product_category_name"].fillna("unknown"))
+    medians = products.groupby("product_category_name")[PRODUCT_MEASURES].transform("median")
+    return products.fillna({col: medians[col] for col in PRODUCT_MEASURES})
+
+
+def prepare_sellers(sellers: pd.DataFrame):
+    sellers = sellers.drop_duplicates()
+    return sellers.assign(seller_zip_code_prefix=sellers["seller_zip_code_prefix"].astype(str))
+
+
+def aggregate_payments(payments: pd.DataFrame):
+    # Per order: total value, most installments and the payment type of the
+    # order's first payment row, which is what x.iloc[0] picked.
+    payments = payments.drop_duplicates()
+    totals = payments.groupby("order_id", sort=True).agg(
+        payment_value=("payment_value", "sum"),
+        payment_installments=("payment_installments", "max"),
+    )
+    first_type = payments.drop_duplicates("order_id").set_index("order_id")["payment_type"]
+    return totals.assign(payment_type=first_type.reindex(totals.index)).reset_index()
+
+
+def prepare_reviews(reviews: pd.DataFrame):
+    reviews = reviews.drop_duplicates()
+    return reviews.assign(
+        review_comment_title=reviews["review_comment_title"].fillna(""),
+        review_comment_message=reviews["review_comment_message"].fillna(""),
+    )
+
+
+class Dimension:
+    # A table joined on `key` through integer codes: the key's distinct
+    # values become categories, so each chunk's keys are hashed once and
+    # the merge itself runs on int32 codes. Keys missing from the table get
+    # code -1, which no row of the table has.
+
+    def __init__(self, frame: pd.DataFrame, key: str):
+        self.key = key
+        self.categories = pd.Index(frame[key].unique())
+        self.frame = frame.drop(columns=key).assign(_code=self._codes(frame[key]))
+
+    def _codes(self, keys):
+        return self.categories.get_indexer(keys).astype(np.int32)
+
+    def join(self, left: pd.DataFrame):
+        codes = self._codes(left[self.key])
+        return left.assign(_code=codes).merge(self.frame, on="_code", how="left").drop(columns="_code")
+
+
+def load_dimensions(raw_dir: str):
+    return [
+        Dimension(prepare_orders(read_raw_table(raw_dir, "orders")), "order_id"),
+        Dimension(prepare_customers(read_raw_table(raw_dir, "customers")), "customer_id"),
+        Dimension(prepare_products(read_raw_table(raw_dir, "products")), "product_id"),
+        Dimension(prepare_sellers(read_raw_table(raw_dir, "sellers")), "seller_id"),
+        Dimension(aggregate_payments(read_raw_table(raw_dir, "payments")), "order_id"),
+        Dimension(prepare_reviews(read_raw_table(raw_dir, "reviews")), "order_id"),
+    ]
+
+
+def add_derived_columns(fact: pd.DataFrame):
+    ts = fact["order_purchase_timestamp"]
+    delivered = fact["order_delivered_customer_date"]
+    estimated = fact["order_estimated_delivery_date"]
+    return fact.assign(
+        purchase_date=ts.dt.date,
+        purchase_year=ts.dt.year.astype("float64"),
+        purchase_month=ts.dt.to_period("M"),
+        purchase_weekday=ts.dt.weekday.astype("float64"),
+        delivery_time=(delivered - ts).dt.days.astype("float64"),
+        estimated_delivery_time=(estimated - ts).dt.days.astype("float64"),
+        delivery_delay=(delivered - estimated).dt.days.astype("float64"),
+        item_total=fact["price"] + fact["freight_value"],
+        has_comment=(fact["review_comment_message"].str.len() > 0).astype(int),
+    )
+
+
+def order_changes(raw_dir: str):
+    # Latest event time and purchase time per order id, over every order
+    # status, for finding the orders changed since a watermark.
+    orders = read_raw_table(raw_dir, "orders")
+    reviews = read_raw_table(raw_dir, "reviews")
+    events = pd.concat([
+        orders[["order_id"]].assign(changed_at=orders[ORDER_EVENTS].max(axis=1)),
+        reviews[["order_id"]].assign(changed_at=reviews[REVIEW_EVENTS].max(axis=1)),
+    ])
+    changes = events.groupby("order_id")["changed_at"].max().to_frame()
+    purchased = orders.drop_duplicates("order_id").set_index("order_id")["order_purchase_timestamp"]
+    return changes.assign(purchased_at=purchased.reindex(changes.index))
+
+
+def item_order_ids(raw_dir: str, chunk_rows: int = ITEM_CHUNK_ROWS):
+    # Distinct order ids of the items file, read one column at a time.
+    chunks = pd.read_csv(
+        os.path.join(raw_dir, RAW_TABLES["order_items"]["file"]),
+        usecols=["order_id"], dtype=str, chunksize=chunk_rows,
+    )
+    return pd.Index(pd.concat([c["order_id"] for c in chunks], ignore_index=True).unique())
+
+
+def build_fact_chunks(raw_dir: str, chunk_rows: int = ITEM_CHUNK_ROWS, order_ids=None):
+    # Yields the fact table one chunk of order items at a time, in the
+    # order of the items file, optionally only for the given orders.
+    # Duplicate item rows are dropped by their row hash. The items file lists
+    # each order's rows together, so a duplicate can only sit in the same
+    # chunk or, for the order a chunk ends on, in the next one; only that
+    # order's hashes are carried over, and memory stays at one chunk.
+    dimensions = load_dimensions(raw_dir)
+    carried, carried_order = np.empty(0, dtype=np.uint64), None
+    for items in read_raw_table(raw_dir, "order_items", chunksize=chunk_rows):
+        if order_ids is not None:
+            items = items[items["order_id"].isin(order_ids)]
+        hashes = pd.util.hash_pandas_object(items, index=False).to_numpy()
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, carried)
+        if len(items):
+            last_order = items["order_id"].iloc[-1]
+            last = hashes[items["order_id"].to_numpy() == last_order]
+            carried = np.union1d(carried, last) if last_order == carried_order else last
+            carried_order = last_order
+        fact = items[keep].reset_index(drop=True)
+        for dimension in dimensions:
+            fact = dimension.join(fact)
+        yield add_derived_columns(fact)
+
+
+def build_fact_table(raw_dir: str, chunk_rows: int = ITEM_CHUNK_ROWS):
+    return pd.concat(build_fact_chunks(raw_dir, chunk_rows), ignore_index=True)
+
+
+def run(raw_dir: str, bucket, chunk_rows: int = ITEM_CHUNK_ROWS, dataset_prefix=FACT_DATASET, fact_blob=FACT_BLOB, keep: int = 2):
+    # Streams the fact table into the partitioned dataset and, if fact_blob
+    # is set, the monolithic Parquet file; neither is published until every
+    # chunk is written.
+    previous = load_manifest(bucket, dataset_prefix) if dataset_prefix else None
+    watermark = order_changes(raw_dir)["changed_at"].max()
+    version = new_dataset_version()
+    files, columns, rows = [], None, 0
+    writer = schema = None
+    with tempfile.TemporaryDirectory() as tmp:
+        monolithic = os.path.join(tmp, "fact.parquet")
+        for part, fact in enumerate(build_fact_chunks(raw_dir, chunk_rows)):
+            columns = columns or list(fact.columns)
+            if schema is None:
+                schema = fact_schema(fact)
+            rows += len(fact)
+            if dataset_prefix:
+                files += write_partitions(fact, bucket, dataset_prefix, version, part, schema)
+            if fact_blob:
+                table = pa.Table.from_pandas(fact, schema=schema, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(monolithic, table.schema)
+                writer.write_table(table)
+            print(f"  chunk {part}: {len(fact):,} rows")
+
+        if writer is not None:
+            writer.close()
+            bucket.blob(fact_blob).upload_from_filename(monolithic)
+    if dataset_prefix and files:
+        publish_dataset(
+            bucket, dataset_prefix, version, columns, files, keep, schema,
+            watermark=watermark.isoformat(),
+            changes={
+                "base": previous["version"] if previous else None,
+                "orders": None,
+                "partitions": sorted({partition_key(f) for f in files}),
+            },
+        )
+    return version, rows
+
+
+def run_incremental(raw_dir: str, bucket, chunk_rows: int = ITEM_CHUNK_ROWS, dataset_prefix=FACT_DATASET, keep: int = 2):
+    # Rebuilds the fact rows of orders with events after the dataset's
+    # watermark, and of orders whose items are not in the dataset yet however
+    # old their events, against the current dimension snapshots, and upserts
+    # them:
+    # every partition that held or receives one of those orders is
+    # rewritten, every other file is carried over. The manifest's
+    # `changes` lists the rewritten partitions.
+    manifest = load_manifest(bucket, dataset_prefix)
+    if manifest is None or manifest.get("watermark") is None:
+        return run(raw_dir, bucket, chunk_rows, dataset_prefix, None, keep)
+
+    changes = order_changes(raw_dir)
+    known = read_fact_dataset(bucket, manifest, ["order_id"]).column("order_id").unique().to_pandas()
+    arrived = item_order_ids(raw_dir, chunk_rows).difference(known)
+    updated = changes.index[changes["changed_at"] > pd.Timestamp(manifest["watermark"])]
+    changed = changes.reindex(updated.union(arrived))
+    if changed.empty:
+        return manifest["version"], 0
+
+    new_rows = pd.concat(build_fact_chunks(raw_dir, chunk_rows, changed.index), ignore_index=True)
+    new_keys = partition_values(new_rows).drop_duplicates()
+    targets = {partition_key(dict(zip(PARTITION_COLUMNS, row))) for row in new_keys.itertuples(index=False)}
+
+    # An order's old rows sit in its purchase month, or in the partition
+    # without an order when it had no delivered order record.
+    months = {(ts.year, ts.month) for ts in changed["purchased_at"].dropna()}
+    candidates = [f for f in manifest["files"] if f["year"] is None or (f["year"], f["month"]) in months]
+
+    def holds_changed(f):
+        ids = read_fact_dataset(bucket, {"columns": ["order_id"], "files": [f]}, ["order_id"]).column("order_id")
+        return ids.to_pandas().isin(changed.index).any()
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        targets |= {partition_key(f) for f, held in zip(candidates, pool.map(holds_changed, candidates)) if held}
+
+    version = new_dataset_version()
+    kept = [f for f in manifest["files"] if partition_key(f) not in targets]
+    rewritten = [f for f in manifest["files"] if partition_key(f) in targets]
+    old_rows = read_fact_dataset(bucket, {"columns": manifest["columns"], "files": rewritten}).to_pandas() if rewritten else None
+    if old_rows is not None:
+        old_rows = old_rows[~old_rows["order_id"].isin(changed.index)]
+        new_rows = pd.concat([old_rows, new_rows[manifest["columns"]]], ignore_index=True)
+    # Manifests from before the schema was recorded take it from the rows,
+    # whose dtypes every build now pins.
+    schema = dataset_schema(manifest) or fact_schema(new_rows[manifest["columns"]])
+    files = write_partitions(new_rows, bucket, dataset_prefix, version, schema=schema)
+
+    publish_dataset(
+        bucket, dataset_prefix, version, manifest["columns"], kept + files, keep, schema,
+        watermark=changes["changed_at"].max().isoformat(),
+        changes={"base": manifest["version"], "orders": len(changed), "partitions": sorted(targets)},
+    )
+    return version, len(new_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the fact table from the Olist CSVs and publish it.")
+    parser.add_argument("raw_dir", help="directory with the Olist CSV files")
+    parser.add_argument("--bucket", default=FACT_BUCKET)
+    parser.add_argument("--chunk-rows", type=int, default=ITEM_CHUNK_ROWS, help="order items per chunk")
+    parser.add_argument("--dataset", default=FACT_DATASET, help="partitioned dataset prefix ('' to skip)")
+    parser.add_argument("--blob", default=FACT_BLOB, help="monolithic fact blob ('' to skip)")
+    parser.add_argument("--keep", type=int, default=2, help="dataset versions to keep")
+    parser.add_argument("--incremental", action="store_true", help="upsert only orders changed since the dataset's watermark")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    bucket = get_storage_client().bucket(args.bucket)
+    if args.incremental:
+        version, rows = run_incremental(args.raw_dir, bucket, args.chunk_rows, args.dataset, args.keep)
+        print(f"Wrote {rows:,} fact rows of changed partitions (dataset {version}) in {time.perf_counter() - start:.1f}s")
+        return
+    version, rows = run(args.raw_dir, bucket, args.chunk_rows, args.dataset, args.blob, args.keep)
+    print(f"Built {rows:,} fact rows (dataset {version}) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
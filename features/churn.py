@@ -1,103 +1,158 @@
 # features/churn.py
+import io
 import os
-import tempfile
 import warnings
 warnings.filterwarnings("ignore")
 
 import pandas as pd
 import numpy as np
 import joblib
-import shap
+from joblib import Parallel, delayed
 import lightgbm as lgb
 from datetime import timedelta
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import roc_auc_score
-from google.cloud import storage
 import streamlit as st
 import plotly.express as px
-import random
+
+from helpers.gcs_loader import read_parquet_bytes
+from helpers.memory_cache import cached
+from helpers.profiling import timed
+from helpers.model_registry import ModelRegistry
+from helpers.search_index import IdSearchIndex
 
 MODEL_BUCKET = "bdabi-group7"
-MODEL_PATHS = {
-    "model": "models/churn_model_best.pkl",
-    "explainer": "models/shap_explainer.pkl",
-    "features": "models/customer_features_full.parquet"
+CHURN_REGISTRY = os.environ.get("BDABI_CHURN_REGISTRY", f"gs://{MODEL_BUCKET}/models/churn")
+CHURN_ARTIFACTS = {
+    "model": "model.pkl",
+    "features": "customer_features.parquet",
+    "scores": "churn_scores.parquet",
+    "drivers": "churn_drivers.parquet",
 }
-OUT_DIR = "model_v2"
-os.makedirs(OUT_DIR, exist_ok=True)
+DRIVERS_TOP_K = 10
+RISK_TIERS = ["SAFE", "MONITOR", "HIGH RISK", "VERY HIGH RISK"]
+RISK_BINS = [0.0, 0.4, 0.6, 0.8, np.inf]
+RISK_COLORS = {"SAFE": "green", "MONITOR": "gray", "HIGH RISK": "orange", "VERY HIGH RISK": "red"}
+CHURN_WINDOW = 90
+ORDER_WINDOWS = [30, 60, 90]
+FACT_COLUMNS = [
+    "order_status", "customer_unique_id", "order_id", "order_item_id", "purchase_date",
+    "price", "freight_value", "review_score", "payment_type",
+    "order_delivered_customer_date", "order_estimated_delivery_date",
+]
 
 def load_raw_data():
-    from helpers.gcs_loader import load_parquet_from_gcs
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-    return df
-
-def train_churn_model(df):
+    from helpers.fact_store import DELIVERED, get_fact_table
+    return get_fact_table(FACT_COLUMNS, DELIVERED)
+
+def sorted_codes(values):
+    # Same result as pd.factorize(values, sort=True), but sorts the uniques as
+    # fixed-width strings, which is several times faster than object sorting.
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object)
+    order = np.argsort(uniques.astype(str), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return np.where(codes >= 0, rank[codes], -1), pd.Index(uniques[order])
+
+def build_churn_features(df):
     # Lấy đơn hàng delivered
-    fact = df[df['order_status'] == 'delivered'].copy()
-    fact['purchase_ts'] = fact['purchase_date']
-    fact['delivered_ts'] = pd.to_datetime(fact['order_delivered_customer_date'], errors='coerce')
-    fact['estimated_ts'] = pd.to_datetime(fact['order_estimated_delivery_date'], errors='coerce')
-    fact['delivery_days'] = (fact['delivered_ts'] - fact['purchase_ts']).dt.days
-    fact['delay_days'] = (fact['delivered_ts'] - fact['estimated_ts']).dt.days
-    fact['item_total'] = fact['price'] + fact['freight_value']
+    fact = df[df['order_status'] == 'delivered']
+    codes, ids = sorted_codes(fact['customer_unique_id'])
+    delivered_ts = pd.to_datetime(fact['order_delivered_customer_date'], errors='coerce')
+    estimated_ts = pd.to_datetime(fact['order_estimated_delivery_date'], errors='coerce')
+    rows = pd.DataFrame({
+        'cust': codes,
+        'order_id': pd.factorize(fact['order_id'])[0],
+        'order_item_id': fact['order_item_id'].to_numpy(),
+        'purchase_ts': fact['purchase_date'].to_numpy(),
+        'item_total': (fact['price'] + fact['freight_value']).to_numpy(),
+        'review_score': fact['review_score'].astype(float).to_numpy(),
+        'delivery_days': (delivered_ts - fact['purchase_date']).dt.days.to_numpy(),
+        'delay_days': (delivered_ts - estimated_ts).dt.days.to_numpy(),
+        'payment_type': fact['payment_type'].to_numpy(),
+    })
 
     # Churn label
-    GLOBAL_END_DATE = fact['purchase_ts'].max()
-    CHURN_WINDOW = 90
-    CUTOFF_DATE = GLOBAL_END_DATE - timedelta(days=CHURN_WINDOW)
-    last_purchase = fact.groupby('customer_unique_id')['purchase_ts'].max().reset_index()
-    last_purchase['days_since_last'] = (GLOBAL_END_DATE - last_purchase['purchase_ts']).dt.days
-    last_purchase['churn'] = (last_purchase['days_since_last'] > CHURN_WINDOW).astype(int)
-    feat_df = fact[fact['purchase_ts'] <= CUTOFF_DATE].copy()
-
-    # Tạo features
-    cust = feat_df.groupby('customer_unique_id').agg(
-        num_orders=('order_id', 'nunique'),
+    global_end_date = rows['purchase_ts'].max()
+    cutoff_date = global_end_date - timedelta(days=CHURN_WINDOW)
+    rows = rows[rows['cust'] >= 0]
+    last_purchase = rows.groupby('cust')['purchase_ts'].max()
+
+    # Every per-customer feature below comes from one pass over the rows of
+    # the feature period, sorted by customer and purchase time.
+    rows = rows[rows['purchase_ts'] <= cutoff_date].sort_values(['cust', 'purchase_ts'], kind='stable')
+    cust_codes = rows['cust'].to_numpy()
+    same_customer = np.r_[False, cust_codes[1:] == cust_codes[:-1]]
+    rows['days_between'] = rows['purchase_ts'].diff().dt.days.where(same_customer)
+
+    cust = rows.groupby('cust', sort=True).agg(
         total_spent=('item_total', 'sum'),
         avg_order_value=('item_total', 'mean'),
         avg_review=('review_score', 'mean'),
         avg_delivery_days=('delivery_days', 'mean'),
         avg_delay=('delay_days', 'mean'),
         total_items=('order_item_id', 'count'),
-        preferred_payment=('payment_type', lambda x: x.mode().iloc[0] if not x.mode().empty else 'unknown')
-    ).reset_index()
+        last_ts=('purchase_ts', 'max'),
+        first_ts=('purchase_ts', 'min'),
+        avg_days_between=('days_between', 'mean'),
+        std_days_between=('days_between', 'std'),
+    )
 
-    last_in_period = feat_df.groupby('customer_unique_id')['purchase_ts'].max().reset_index()
-    last_in_period['recency'] = (CUTOFF_DATE - last_in_period['purchase_ts']).dt.days
-    cust = cust.merge(last_in_period[['customer_unique_id', 'recency']], on='customer_unique_id')
-    first = feat_df.groupby('customer_unique_id')['purchase_ts'].min().reset_index()
-    cust = cust.merge(first.rename(columns={'purchase_ts': 'first_ts'}), on='customer_unique_id')
-    cust['tenure_days'] = (CUTOFF_DATE - cust['first_ts']).dt.days + 1
-
-    tmp = feat_df.sort_values(['customer_unique_id', 'purchase_ts'])
-    tmp['prev_ts'] = tmp.groupby('customer_unique_id')['purchase_ts'].shift(1)
-    tmp['days_between'] = (tmp['purchase_ts'] - tmp['prev_ts']).dt.days
-    inter = tmp.groupby('customer_unique_id')['days_between'].agg([('avg_days_between', 'mean'), ('std_days_between', 'std')]).reset_index()
-    cust = cust.merge(inter, on='customer_unique_id', how='left')
-
-    for days in [30, 60, 90]:
-        start = CUTOFF_DATE - timedelta(days=days)
-        recent = feat_df[feat_df['purchase_ts'] >= start]
-        cnt = recent.groupby('customer_unique_id')['order_id'].nunique().reset_index()
-        cnt.columns = ['customer_unique_id', f'orders_last_{days}d']
-        cust = cust.merge(cnt, on='customer_unique_id', how='left')
-        cust[f'orders_last_{days}d'] = cust[f'orders_last_{days}d'].fillna(0).astype(int)
-
-    delay_per_order = feat_df.groupby(['customer_unique_id', 'order_id']).agg(delay=('delay_days', 'mean')).reset_index()
-    late = delay_per_order.groupby('customer_unique_id').agg(pct_late=('delay', lambda x: (x > 0).mean())).reset_index()
-    cust = cust.merge(late, on='customer_unique_id', how='left')
+    orders = rows[rows['order_id'] >= 0].groupby(['cust', 'order_id'], sort=False).agg(
+        purchase_ts=('purchase_ts', 'max'),
+        delay=('delay_days', 'mean'),
+    ).reset_index()
+    order_flags = pd.DataFrame({'cust': orders['cust'], 'num_orders': 1, 'pct_late': (orders['delay'] > 0).astype(int)})
+    for days in ORDER_WINDOWS:
+        order_flags[f'orders_last_{days}d'] = (orders['purchase_ts'] >= cutoff_date - timedelta(days=days)).astype(int)
+    order_counts = order_flags.groupby('cust').sum().reindex(cust.index, fill_value=0)
+
+    features = pd.DataFrame({
+        'customer_unique_id': ids.take(cust.index),
+        'num_orders': order_counts['num_orders'].to_numpy(),
+        'total_spent': cust['total_spent'].to_numpy(),
+        'avg_order_value': cust['avg_order_value'].to_numpy(),
+        'avg_review': cust['avg_review'].to_numpy(),
+        'avg_delivery_days': cust['avg_delivery_days'].to_numpy(),
+        'avg_delay': cust['avg_delay'].to_numpy(),
+        'total_items': cust['total_items'].to_numpy(),
+        'preferred_payment': preferred_payment(rows['cust'], rows['payment_type']).reindex(cust.index, fill_value='unknown').to_numpy(),
+        'recency': (cutoff_date - cust['last_ts']).dt.days.to_numpy(),
+        'first_ts': cust['first_ts'].to_numpy(),
+        'tenure_days': (cutoff_date - cust['first_ts']).dt.days.to_numpy() + 1,
+        'avg_days_between': cust['avg_days_between'].to_numpy(),
+        'std_days_between': cust['std_days_between'].to_numpy(),
+        **{f'orders_last_{days}d': order_counts[f'orders_last_{days}d'].to_numpy() for days in ORDER_WINDOWS},
+        'pct_late': order_counts['pct_late'].to_numpy() / np.maximum(order_counts['num_orders'].to_numpy(), 1),
+    })
 
     cols_to_fill = ['avg_days_between', 'std_days_between', 'pct_late', 'avg_review', 'avg_delay']
-    cust[cols_to_fill] = cust[cols_to_fill].fillna(0)
+    features[cols_to_fill] = features[cols_to_fill].fillna(0)
+
+    days_since_last = (global_end_date - last_purchase.reindex(cust.index)).dt.days
+    features['churn'] = (days_since_last > CHURN_WINDOW).astype(int).to_numpy()
+    data = pd.get_dummies(features, columns=['preferred_payment'], prefix='pay', dtype=int)
+    data = data.fillna(0)
+    data = data.replace([np.inf, -np.inf], 0)
+    return data
+
+def preferred_payment(cust, payment_type):
+    # Most frequent payment type per customer, ties broken by the lowest
+    # value, counted from (customer, payment code) pairs instead of a
+    # Series.mode() per group.
+    pay_codes, pay_values = pd.factorize(payment_type, sort=True)
+    valid = pay_codes >= 0
+    n = max(len(pay_values), 1)
+    pairs, counts = np.unique(cust.to_numpy()[valid].astype(np.int64) * n + pay_codes[valid], return_counts=True)
+    pair_cust, pair_code = pairs // n, pairs % n
+    order = np.lexsort((pair_code, -counts, pair_cust))
+    first = order[np.r_[True, pair_cust[order][1:] != pair_cust[order][:-1]]] if len(order) else order
+    values = np.asarray(pay_values, dtype=object)[pair_code[first]]
+    return pd.Series(values, index=pair_cust[first])
 
-    data = cust.merge(last_purchase[['customer_unique_id', 'churn']], on='customer_unique_id', how='left')
-    data = pd.get_dummies(data, columns=['preferred_payment'], prefix='pay', dtype=int)
-    data.fillna(0, inplace=True)
-    data.replace([np.inf, -np.inf], 0, inplace=True)
+def train_churn_model(df):
+    data = build_churn_features(df)
 
     # Train
     target = 'churn'
@@ -138,59 +193,187 @@ def train_churn_model(df):
     auc = roc_auc_score(y_test, pred)
     print(f"AUC = {auc:.5f}")
 
-    explainer = shap.TreeExplainer(model)
+    data = data[['customer_unique_id'] + X.columns.tolist() + ['churn']]
+    metrics = {"auc": float(auc), "best_iteration": int(model.best_iteration)}
+    return model, data, metrics
 
-    joblib.dump(model, os.path.join(OUT_DIR, "churn_model_best.pkl"))
-    joblib.dump(explainer, os.path.join(OUT_DIR, "shap_explainer.pkl"))
-    data[['customer_unique_id'] + X.columns.tolist() + ['churn']].to_parquet(os.path.join(OUT_DIR, "customer_features_full.parquet"), index=False)
-
-    client = storage.Client.from_service_account_info(
-        st.secrets["gcp_service_account"]
+def risk_tier(prob):
+    return pd.Categorical(
+        pd.cut(prob, bins=RISK_BINS, labels=RISK_TIERS, right=False),
+        categories=RISK_TIERS,
+        ordered=True
     )
-    bucket = client.bucket(MODEL_BUCKET)
-    for file_name in ["churn_model_best.pkl", "shap_explainer.pkl", "customer_features_full.parquet"]:
-        local_path = os.path.join(OUT_DIR, file_name)
-        blob = bucket.blob(f"models/{file_name}")
-        blob.upload_from_filename(local_path)
-
-    return model, explainer, data
 
-@st.cache_resource(ttl=3600)
+def adjust_for_recency(prob, recency, rng):
+    # Customers who bought in the last 30 days are damped towards zero.
+    recent = recency < 30
+    scale = recency / 30 + rng.uniform(0, 0.05, size=len(prob))
+    return np.where(recent, prob * scale, prob)
+
+def score_customers(model, df, chunk_size=50_000, n_jobs=-1, seed=42):
+    X = df[model.feature_name()]
+    chunks = [X.iloc[i:i + chunk_size] for i in range(0, len(X), chunk_size)]
+    # LightGBM releases the GIL while predicting, so threads spread the
+    # chunks over all cores without copying the model into subprocesses.
+    parts = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(model.predict)(chunk, num_threads=1) for chunk in chunks
+    )
+    prob = np.concatenate(parts) if parts else np.empty(0)
+    prob = adjust_for_recency(prob, df['recency'].to_numpy(dtype=float), np.random.default_rng(seed))
+
+    return pd.DataFrame({
+        'customer_unique_id': df['customer_unique_id'].to_numpy(),
+        'churn_probability': prob.astype(np.float32),
+        'risk_tier': risk_tier(prob),
+        'num_orders': df['num_orders'].to_numpy(),
+        'recency': df['recency'].to_numpy(),
+        'total_spent': df['total_spent'].to_numpy(),
+    })
+
+def top_contributions(model, X, top_k=DRIVERS_TOP_K):
+    # LightGBM computes TreeSHAP values natively; the last column is the
+    # expected value, not a feature.
+    contrib = model.predict(X, pred_contrib=True, num_threads=1)[:, :-1]
+    top = np.argsort(-np.abs(contrib), axis=1, kind="stable")[:, :top_k]
+    return top, np.take_along_axis(contrib, top, axis=1).astype(np.float32)
+
+def explain_customers(model, df, top_k=DRIVERS_TOP_K, chunk_size=20_000, n_jobs=-1):
+    features = model.feature_name()
+    X = df[features]
+    chunks = [X.iloc[i:i + chunk_size] for i in range(0, len(X), chunk_size)]
+    parts = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(top_contributions)(model, chunk, top_k) for chunk in chunks
+    )
+    k = min(top_k, len(features))
+    top = np.concatenate([p[0] for p in parts]) if parts else np.empty((0, k), dtype=int)
+    values = np.concatenate([p[1] for p in parts]) if parts else np.empty((0, k), dtype=np.float32)
+
+    # One block of k rows per customer, sorted by id for binary-search lookups.
+    order = np.argsort(df['customer_unique_id'].to_numpy(), kind="stable")
+    return pd.DataFrame({
+        'customer_unique_id': np.repeat(df['customer_unique_id'].to_numpy()[order], k),
+        'rank': np.tile(np.arange(k, dtype=np.int8), len(order)),
+        'feature': pd.Categorical.from_codes(top[order].ravel(), categories=features),
+        'shap_value': values[order].ravel(),
+    })
+
+class ChurnDrivers:
+    def __init__(self, table):
+        self.table = table
+        self.k = int(table['rank'].max()) + 1 if len(table) else 1
+        self.ids = table['customer_unique_id'].to_numpy()[::self.k]
+
+    def lookup(self, customer_id):
+        i = int(np.searchsorted(self.ids, customer_id))
+        if i == len(self.ids) or self.ids[i] != customer_id:
+            return None
+        return self.table.iloc[i * self.k:(i + 1) * self.k][['feature', 'shap_value']]
+
+@cached(max_entries=1024)
+def explain_customer(version, customer_id, _model, _X):
+    # LRU fallback for customers missing from the precomputed driver table;
+    # the model version is part of the key, so a promoted model is never
+    # explained with its predecessor's drivers.
+    top, values = top_contributions(_model, _X)
+    return pd.DataFrame({
+        'feature': np.asarray(_model.feature_name())[top[0]],
+        'shap_value': values[0],
+    })
+
+def save_churn_artifacts(directory, model, data, scores, drivers):
+    joblib.dump(model, os.path.join(directory, CHURN_ARTIFACTS["model"]))
+    data.to_parquet(os.path.join(directory, CHURN_ARTIFACTS["features"]), index=False)
+    scores.to_parquet(os.path.join(directory, CHURN_ARTIFACTS["scores"]), index=False)
+    drivers.to_parquet(os.path.join(directory, CHURN_ARTIFACTS["drivers"]), index=False)
+
+@st.cache_data(ttl=300)
+def get_churn_model_version():
+    return ModelRegistry(CHURN_REGISTRY).latest()
+
+# Versions are immutable, so the version id alone keys the loaded assets. A
+# promoted version is picked up by the next request while earlier requests
+# keep using the assets they already hold.
+@cached(max_entries=2)
+def _load_churn_version(version):
+    files = ModelRegistry(CHURN_REGISTRY).fetch(version, CHURN_ARTIFACTS.values())
+    model = joblib.load(io.BytesIO(files[CHURN_ARTIFACTS["model"]]))
+    df = read_parquet_bytes(files[CHURN_ARTIFACTS["features"]]).to_pandas()
+    scores = read_parquet_bytes(files[CHURN_ARTIFACTS["scores"]]).to_pandas()
+    drivers = read_parquet_bytes(files[CHURN_ARTIFACTS["drivers"]]).to_pandas()
+    index = IdSearchIndex(df["customer_unique_id"])
+    return model, df, index, scores, ChurnDrivers(drivers)
+
+@timed("load")
 def load_churn_assets():
     try:
-        client = storage.Client.from_service_account_info(
-            st.secrets["gcp_service_account"]
-        )
-        bucket = client.bucket(MODEL_BUCKET)
-        blobs_exist = all(bucket.blob(p).exists() for p in MODEL_PATHS.values())
-        if blobs_exist:
-    
-            def download(blob_name):
-                blob = bucket.blob(blob_name)
-                tmp = tempfile.NamedTemporaryFile(delete=False)
-                blob.download_to_filename(tmp.name)
-                return tmp.name
-            model_path = download(MODEL_PATHS["model"])
-            explainer_path = download(MODEL_PATHS["explainer"])
-            features_path = download(MODEL_PATHS["features"])
-            model = joblib.load(model_path)
-            explainer = joblib.load(explainer_path)
-            df = pd.read_parquet(features_path)
-            os.unlink(model_path)
-            os.unlink(explainer_path)
-            os.unlink(features_path)
-        else:
-            df_raw = load_raw_data()
-            model, explainer, df = train_churn_model(df_raw)
-        return model, explainer, df
+        version = get_churn_model_version()
+        if version is None:
+            st.warning("No churn model has been published yet. Run `python -m jobs.train_churn` to train one.")
+            st.stop()
+        return (version, *_load_churn_version(version))
     except Exception as e:
         st.error(f"Không load được model Churn: {e}")
         st.stop()
 
+def render_risk_ranking(scores):
+    col_tiers, col_size = st.columns([3, 1])
+    with col_tiers:
+        tiers = st.multiselect(
+            "Risk tiers",
+            RISK_TIERS,
+            default=["VERY HIGH RISK", "HIGH RISK"],
+            key="churn_rank_tiers"
+        )
+    with col_size:
+        page_size = st.selectbox("Rows per page", [25, 50, 100], key="churn_rank_page_size")
+
+    filtered = scores[scores["risk_tier"].isin(tiers)]
+    st.info(f"Customers in selected tiers: **{len(filtered):,}**")
+    if filtered.empty:
+        return
+
+    n_pages = (len(filtered) - 1) // page_size + 1
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1, key="churn_rank_page")
+
+    # Only the rows up to the requested page are ranked, not the whole tier.
+    page_rows = (
+        filtered.nlargest(page * page_size, "churn_probability")
+        .iloc[(page - 1) * page_size:]
+    )
+    st.dataframe(
+        page_rows,
+        column_config={
+            "customer_unique_id": "Customer ID",
+            "churn_probability": st.column_config.NumberColumn("Churn Probability", format="percent"),
+            "risk_tier": "Risk",
+            "num_orders": st.column_config.NumberColumn("Orders", format="%d"),
+            "recency": st.column_config.NumberColumn("Recency (days)", format="%d"),
+            "total_spent": st.column_config.NumberColumn("Total Spent", format="R$ %.0f"),
+        },
+        hide_index=True,
+        use_container_width=True
+    )
+
+    if st.button("Prepare target list export", key="churn_rank_export"):
+        export = filtered.sort_values("churn_probability", ascending=False)
+        st.download_button(
+            "Download target list",
+            export.to_csv(index=False),
+            "churn_targets.csv",
+            "text/csv",
+            on_click="ignore"
+        )
+
 def render_churn_prediction(container):
     with container:
         st.markdown("# Customer Churn Prediction")
-        model, explainer, df = load_churn_assets()
+        version, model, df, index, scores, drivers = load_churn_assets()
+
+        view = st.radio("View", ["Customer lookup", "Risk ranking"], horizontal=True, key="churn_view")
+        if view == "Risk ranking":
+            render_risk_ranking(scores)
+            return
+
         col1, col2 = st.columns([3, 1])
         with col1:
             query = st.text_input("Search Customer ID", placeholder="e.g. 8d9, abc, 123")
@@ -201,31 +384,19 @@ def render_churn_prediction(container):
             st.info("Enter part of a Customer ID to search")
             return
 
-        matches = df[df["customer_unique_id"].astype(str).str.contains(query, case=False, na=False)].head(20)
-        if matches.empty:
+        matches = index.search(query, limit=20)
+        if not matches:
             st.warning("No customers found")
             st.stop()
 
-        selected_id = st.selectbox("Select customer", matches["customer_unique_id"])
-        selected_row = df[df["customer_unique_id"] == selected_id].iloc[0]
-
-        X = df[df["customer_unique_id"] == selected_id].drop(columns=["customer_unique_id", "churn"], errors="ignore")
-        prob = float(model.predict(X)[0])
+        selected_id = st.selectbox("Select customer", matches)
+        position = index.row_of(selected_id)
+        selected_row = df.iloc[position]
 
-        recency = selected_row.get('recency', 0)
-        if recency < 30:
-            # prob = min(prob, 0.5)
-            scale = recency / 30 + random.uniform(0, 0.05)
-            prob = prob * scale 
-
-        if prob >= 0.8:
-            risk, color = "VERY HIGH RISK", "red"
-        elif prob >= 0.6:
-            risk, color = "HIGH RISK", "orange"
-        elif prob >= 0.4:
-            risk, color = "MONITOR", "gray"
-        else:
-            risk, color = "SAFE", "green"
+        X = df.iloc[[position]][model.feature_name()]
+        prob = float(scores["churn_probability"].iat[position])
+        risk = scores["risk_tier"].iat[position]
+        color = RISK_COLORS[risk]
 
         c1, c2 = st.columns(2)
         with c1:
@@ -233,7 +404,7 @@ def render_churn_prediction(container):
         with c2:
             st.markdown(f"### <span style='color:{color}'>{risk}</span>", unsafe_allow_html=True)
 
-        row = df[df["customer_unique_id"] == selected_id].iloc[0]
+        row = selected_row
         st.write(f"**Customer ID**: `{selected_id}`")
         st.write(f"**Number of orders**: {int(row.get('num_orders', 0))}")
         st.write(f"**Recency**: {int(row.get('recency', 0))} days")
@@ -241,17 +412,9 @@ def render_churn_prediction(container):
 
         st.markdown("### Top drivers of churn risk")
         try:
-
-            shap_values = explainer.shap_values(X)
-            if isinstance(shap_values, list):
-                shap_vals = shap_values[1][0] 
-            else:
-                shap_vals = shap_values[0]
-
-            shap_df = pd.DataFrame({
-                'feature': X.columns,
-                'shap_value': shap_vals
-            }).sort_values('shap_value', key=abs, ascending=False).head(10)  
+            shap_df = drivers.lookup(selected_id)
+            if shap_df is None:
+                shap_df = explain_customer(version, selected_id, model, X)
 
             # Vẽ bar chart trực quan
             fig = px.bar(
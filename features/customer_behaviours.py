@@ -1,27 +1,15 @@
 import streamlit as st
-from helpers.gcs_loader import load_parquet_from_gcs
 import pandas as pd
 import altair as alt
 
 
-def render_customer_loyalty(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
+def render_customer_loyalty(column, filters):
+    # Count the number of distinct orders
+    orders_per_customer = filters.aggregate(['customer_unique_id'], {'Order_Count': ('order_id', 'nunique')})
 
     with column:
         st.subheader("Customer Loyalty")
 
-        delivered_df = df[df['order_status'] == 'delivered'].copy()
-
-        orders_per_customer = (
-            delivered_df.groupby('customer_unique_id')['order_id']
-            .nunique() # Count the number of distinct orders
-            .reset_index(name='Order_Count')
-        )
-
         total_customers = orders_per_customer.shape[0]
 
         repeat_customers = orders_per_customer[orders_per_customer['Order_Count'] > 1].shape[0]
@@ -53,24 +41,13 @@ def render_customer_loyalty(column):
         )
         st.altair_chart(pie_chart, width='stretch')
 
-def render_payment_analysis(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-
+def render_payment_analysis(column, filters):
     with column:
         st.subheader("Revenue & Volume by Payment Type")
-        payment_df = df[df['order_status'] == 'delivered'].copy()
 
         payment_summary = (
-            payment_df.groupby('payment_type')
-            .agg(
-                Total_Revenue=('payment_value', 'sum'),
-                Order_Volume=('order_id', 'nunique') # Unique orders per payment type
-            )
-            .reset_index()
+            filters.cube.rollup(['payment_type'], distinct=['orders'])[['payment_type', 'revenue', 'orders']]
+            .rename(columns={'revenue': 'Total_Revenue', 'orders': 'Order_Volume'})
             .sort_values(by='Total_Revenue', ascending=False)
         )
 
@@ -109,31 +86,17 @@ def render_payment_analysis(column):
         )
         st.altair_chart(volume_chart, width='stretch')
 
-def render_sales_volumes_by_reviews(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
+def render_sales_volumes_by_reviews(column, filters):
+    # Orders without a review score are left out of the groups.
+    score_volume = filters.aggregate(['review_score'], {'Total_Orders': ('order_id', 'nunique')})
 
     with column:
         st.subheader("Order Volume Distribution by Review Score")
 
-        review_df = df[
-            (df['order_status'] == 'delivered') & 
-            (df['review_score'].notna())
-        ].copy()
-        
-        if review_df.empty:
-            st.warning("No delivered orders with review scores available.")
+        if score_volume.empty:
+            st.warning("No orders with review scores for the selected filters.")
             return
 
-        score_volume = (
-            review_df.groupby('review_score')['order_id']
-            .nunique()
-            .reset_index(name='Total_Orders')
-        )
-        
         score_volume['review_score'] = score_volume['review_score'].astype(int)
 
         chart = (
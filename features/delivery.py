@@ -2,49 +2,26 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 import numpy as np
-from helpers.gcs_loader import load_parquet_from_gcs
-
-def render_delivery_performance(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
+from helpers.fact_cube import (
+    DELAY_LABELS,
+    DELIVERY_TIME_LABELS,
+    measure_mean,
+)
 
+def render_delivery_performance(column, filters):
     with column:
         st.subheader("Delivery Performance Overview")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="delivery_perf_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
+        totals = filters.cube.rollup(()).iloc[0]
 
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if totals['items'] == 0:
+            st.warning("No data available for the selected filters.")
             return
 
-        avg_delivery_time = filtered_df['delivery_time'].mean()
-        avg_delay = filtered_df['delivery_delay'].mean()
-        on_time_pct = (filtered_df['delivery_delay'] <= 0).mean() * 100
-        late_pct = (filtered_df['delivery_delay'] > 0).mean() * 100
+        avg_delivery_time = measure_mean(totals, 'delivery_time')
+        avg_delay = measure_mean(totals, 'delivery_delay')
+        on_time_pct = totals['on_time'] / totals['items'] * 100
+        late_pct = totals['late'] / totals['items'] * 100
 
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -57,14 +34,10 @@ def render_delivery_performance(column):
             st.metric("Late Rate", f"{late_pct:.1f}%")
 
         st.markdown("### Delivery Time Distribution")
-        delivery_bins = pd.cut(
-            filtered_df['delivery_time'], 
-            bins=[0, 7, 14, 21, 28, 35, 100],
-            labels=['0-7 days', '8-14 days', '15-21 days', '22-28 days', '29-35 days', '35+ days']
-        )
-        
-        delivery_dist = delivery_bins.value_counts().reset_index()
-        delivery_dist.columns = ['Time Range', 'Count']
+        delivery_dist = pd.DataFrame({
+            'Time Range': DELIVERY_TIME_LABELS,
+            'Count': [int(totals[f'delivery_time_bin_{i}']) for i in range(len(DELIVERY_TIME_LABELS))]
+        }).sort_values('Count', ascending=False)
 
         chart = (
             alt.Chart(delivery_dist)
@@ -80,52 +53,24 @@ def render_delivery_performance(column):
         st.altair_chart(chart, width='stretch')
 
 
-def render_delivery_delay_analysis(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_delivery_delay_analysis(column, filters):
     with column:
         st.subheader("Delivery Delay Trends")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="delivery_delay_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
+        daily = filters.cube.rollup(['day'])
 
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if daily.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        filtered_df['month'] = filtered_df['purchase_date'].dt.to_period('M').astype(str)
+        monthly = daily.groupby(daily['day'].dt.to_period('M').astype(str)).sum(numeric_only=True)
         
-        monthly_delay = filtered_df.groupby('month').agg({
-            'delivery_delay': 'mean',
-            'delivery_time': 'mean',
-            'order_id': 'count'
-        }).reset_index()
-        
-        monthly_delay.columns = ['Month', 'Avg Delay', 'Avg Delivery Time', 'Order Count']
+        monthly_delay = pd.DataFrame({
+            'Month': monthly.index,
+            'Avg Delay': measure_mean(monthly, 'delivery_delay').to_numpy(),
+            'Avg Delivery Time': measure_mean(monthly, 'delivery_time').to_numpy(),
+            'Order Count': monthly['items'].to_numpy()
+        })
 
         delay_chart = (
             alt.Chart(monthly_delay)
@@ -141,14 +86,10 @@ def render_delivery_delay_analysis(column):
         st.altair_chart(delay_chart, width='stretch')
 
         st.markdown("### Delay Categories")
-        delay_categories = pd.cut(
-            filtered_df['delivery_delay'],
-            bins=[-100, 0, 7, 14, 30, 100],
-            labels=['On Time', '1-7 days late', '8-14 days late', '15-30 days late', '30+ days late']
-        )
-        
-        delay_dist = delay_categories.value_counts().reset_index()
-        delay_dist.columns = ['Category', 'Count']
+        delay_dist = pd.DataFrame({
+            'Category': DELAY_LABELS,
+            'Count': [int(monthly[f'delay_bin_{i}'].sum()) for i in range(len(DELAY_LABELS))]
+        }).sort_values('Count', ascending=False)
         delay_dist['Percentage'] = (delay_dist['Count'] / delay_dist['Count'].sum() * 100).round(2)
 
         st.dataframe(
@@ -163,50 +104,22 @@ def render_delivery_delay_analysis(column):
         )
 
 
-def render_delivery_by_state(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_delivery_by_state(column, filters):
     with column:
         st.subheader("Delivery Performance by State")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="delivery_state_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
+        state_delivery = filters.cube.rollup(['customer_state'])
 
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if state_delivery.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        state_delivery = filtered_df.groupby('customer_state').agg({
-            'delivery_time': 'mean',
-            'delivery_delay': 'mean',
-            'order_id': 'count'
-        }).reset_index()
-        
-        state_delivery.columns = ['State', 'Avg Delivery Time', 'Avg Delay', 'Orders']
+        state_delivery = pd.DataFrame({
+            'State': state_delivery['customer_state'],
+            'Avg Delivery Time': measure_mean(state_delivery, 'delivery_time'),
+            'Avg Delay': measure_mean(state_delivery, 'delivery_delay'),
+            'Orders': state_delivery['items']
+        })
         state_delivery = state_delivery.sort_values('Orders', ascending=False).head(15)
 
         chart = (
@@ -239,47 +152,20 @@ def render_delivery_by_state(column):
         )
 
 
-def render_freight_analysis(column):
+def render_freight_analysis(column, filters):
     # freight cost = shipping cost
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
     with column:
         st.subheader("Freight Cost Analysis")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="freight_date"
-        )
+        totals = filters.cube.rollup(()).iloc[0]
 
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if totals['items'] == 0:
+            st.warning("No data available for the selected filters.")
             return
 
-        avg_freight = filtered_df['freight_value'].mean()
-        total_freight = filtered_df['freight_value'].sum()
-        freight_ratio = (filtered_df['freight_value'] / filtered_df['price']).mean() * 100
+        avg_freight = measure_mean(totals, 'freight')
+        total_freight = totals['freight']
+        freight_ratio = measure_mean(totals, 'freight_ratio') * 100
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -291,12 +177,13 @@ def render_freight_analysis(column):
 
         st.markdown("### Freight Cost by Product Category")
         
-        category_freight = filtered_df.groupby('product_category_name').agg({
-            'freight_value': ['mean', 'sum'],
-            'order_id': 'count'
-        }).reset_index()
-        
-        category_freight.columns = ['Category', 'Avg Freight', 'Total Freight', 'Orders']
+        category_freight = filters.cube.rollup(['product_category_name'])
+        category_freight = pd.DataFrame({
+            'Category': category_freight['product_category_name'],
+            'Avg Freight': measure_mean(category_freight, 'freight'),
+            'Total Freight': category_freight['freight'],
+            'Orders': category_freight['items']
+        })
         category_freight = category_freight.sort_values('Total Freight', ascending=False).head(15)
 
         chart = (
@@ -1,82 +1,269 @@
 # features/fraud.py
+import json
 import os
 import streamlit as st
 import pandas as pd
-import tempfile
-from google.cloud import storage
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from helpers.exports import render_export
+from helpers.fact_dataset import load_manifest, read_fact_dataset
+from helpers.fact_store import FACT_DATASET
+from helpers.gcs_loader import fetch_blob, get_blob_generation, get_storage_client, read_parquet_bytes
+from helpers.memory_cache import cached
+from helpers.profiling import timed
+from helpers.rule_engine import RuleSet
 
 MODEL_BUCKET = "bdabi-group7"
 FRAUD_BLOB = "models/fraud_candidates.parquet"
 RAW_BLOB = "preprocessed/preprocessed.parquet"
+STATE_BLOB = "models/fraud_state.parquet"
+FILES_KEY = b"fraud_files"
+RULES_KEY = b"fraud_rules"
+# The columns compare_repeat_orders reads and the keys candidates are
+# deduplicated on.
+FRAUD_COLUMNS = [
+    'order_id', 'order_item_id', 'customer_unique_id',
+    'order_purchase_timestamp', 'payment_value', 'customer_zip_code_prefix',
+]
+# Scored order ids per customer, held in Arrow so the state needs no Python
+# object per customer.
+ORDER_IDS = pd.ArrowDtype(pa.list_(pa.string()))
+FRAUD_RULES_PATH = os.environ.get("BDABI_FRAUD_RULES", os.path.join(os.path.dirname(__file__), "fraud_rules.json"))
 
-def generate_fraud_data(df: pd.DataFrame):
-    df['order_value'] = df['payment_value']
-    df['order_purchase_timestamp'] = pd.to_datetime(df['order_purchase_timestamp'])
-    df = df.sort_values(['customer_unique_id', 'order_purchase_timestamp'])
-    df['order_sequence'] = df.groupby('customer_unique_id').cumcount() + 1
+def load_fraud_rules(path: str = FRAUD_RULES_PATH):
+    return RuleSet.from_json(path)
 
-    first = df[df['order_sequence'] == 1].copy()
-    repeat = df[df['order_sequence'] >= 2].copy()
+def score_fraud(comp: pd.DataFrame, rules: RuleSet):
+    comp['fraud_score'] = rules.score(comp)
+    fraud = comp[comp['fraud_score'] >= rules.threshold].copy()
+    fraud['risk_level'] = rules.risk_band(fraud['fraud_score'].to_numpy())
+    return fraud
 
-    comp = repeat.merge(
-        first[['customer_unique_id', 'order_value', 'customer_zip_code_prefix']],
-        on='customer_unique_id',
-        suffixes=('_current', '_first')
+def empty_fraud_state():
+    return pd.DataFrame(
+        {
+            'order_value_first': pd.Series(dtype='float64'),
+            'customer_zip_code_prefix_first': pd.Series(dtype='object'),
+            'order_purchase_timestamp_first': pd.Series(dtype='datetime64[ns]'),
+            'rows_seen': pd.Series(dtype='int64'),
+            'order_ids': pd.Series(dtype=ORDER_IDS),
+        },
+        index=pd.Index([], dtype='object', name='customer_unique_id'),
     )
 
+def scored_order_ids(state: pd.DataFrame):
+    return pc.list_flatten(pa.array(state['order_ids'])).to_pandas()
+
+def compare_repeat_orders(df: pd.DataFrame, state: pd.DataFrame):
+    # Pairs every row of an order not seen before with its customer's first
+    # order. `state` holds, per customer, the value and zip of that first
+    # order, how many rows have been seen and the ids of their orders, so
+    # older rows are not needed and rows read again are skipped whatever
+    # their purchase time. An order's rows are always loaded together.
+    ts = pd.to_datetime(df['order_purchase_timestamp'])
+    keep = ts.notna() & df['customer_unique_id'].notna()
+    if len(state):
+        keep &= ~df['order_id'].isin(scored_order_ids(state))
+    new = df[keep].assign(order_value=df['payment_value'], order_purchase_timestamp=ts)
+    new = new.sort_values(['customer_unique_id', 'order_purchase_timestamp'], kind='stable').reset_index(drop=True)
+    if new.empty:
+        return new.iloc[:0], state
+
+    customers = new['customer_unique_id'].to_numpy()
+    starts_mask = np.r_[True, customers[1:] != customers[:-1]]
+    starts = np.flatnonzero(starts_mask)
+    group = np.cumsum(starts_mask) - 1
+    sizes = np.diff(np.r_[starts, len(new)])
+
+    known = state.index.get_indexer(customers[starts])
+    is_known = known >= 0
+
+    def first_or_stored(column, batch_values):
+        if not is_known.any():
+            return batch_values
+        stored = state[column].to_numpy()[np.where(is_known, known, 0)]
+        return np.where(is_known, stored, batch_values)
+
+    first_value = first_or_stored('order_value_first', new['order_value'].to_numpy()[starts])
+    first_zip = first_or_stored('customer_zip_code_prefix_first', new['customer_zip_code_prefix'].to_numpy(dtype=object)[starts])
+    first_ts = first_or_stored('order_purchase_timestamp_first', new['order_purchase_timestamp'].to_numpy()[starts])
+    seen = first_or_stored('rows_seen', np.zeros(len(starts), dtype=np.int64))
+
+    new['order_sequence'] = seen[group] + np.arange(len(new)) - starts[group] + 1
+    comp = new[new['order_sequence'] >= 2].rename(columns={
+        'order_value': 'order_value_current',
+        'customer_zip_code_prefix': 'customer_zip_code_prefix_current',
+    })
+    comp['order_value_first'] = first_value[group][comp.index]
+    comp['customer_zip_code_prefix_first'] = first_zip[group][comp.index]
+    comp = comp.reset_index(drop=True)
     comp['value_ratio'] = comp['order_value_current'] / (comp['order_value_first'] + 1)
     comp['different_zip'] = (
         comp['customer_zip_code_prefix_current'] != comp['customer_zip_code_prefix_first']
     )
 
-    comp['fraud_score'] = 0
-    comp.loc[(comp['value_ratio'] >= 5) & comp['different_zip'], 'fraud_score'] = 100
-    comp.loc[comp['value_ratio'] >= 5, 'fraud_score'] = comp['fraud_score'].combine(75, max)
-    comp.loc[(3 <= comp['value_ratio']) & (comp['value_ratio'] < 5) & comp['different_zip'], 'fraud_score'] = 50
-
-    fraud = comp[comp['fraud_score'] >= 75].copy()
-    fraud['risk_level'] = pd.cut(
-        fraud['fraud_score'],
-        bins=[0, 80, 99, 100],
-        labels=['High Risk', 'Very High Risk', 'Critical Risk'],
-        include_lowest=True
+    # Each customer's stored order ids followed by their new ones, as one
+    # list per customer built from flat arrays.
+    firsts = ~new.duplicated(['customer_unique_id', 'order_id']).to_numpy()
+    ids, owners = new['order_id'].to_numpy(dtype=object)[firsts], group[firsts]
+    if is_known.any():
+        stored = pa.array(state['order_ids'].iloc[known[is_known]])
+        ids = np.concatenate([pc.list_flatten(stored).to_numpy(zero_copy_only=False), ids])
+        owners = np.concatenate([np.flatnonzero(is_known)[pc.list_parent_indices(stored).to_numpy()], owners])
+    order = np.argsort(owners, kind='stable')
+    offsets = np.r_[0, np.cumsum(np.bincount(owners, minlength=len(starts)))].astype(np.int32)
+    order_ids = pd.arrays.ArrowExtensionArray(pa.ListArray.from_arrays(pa.array(offsets), pa.array(ids[order], pa.string())))
+
+    batch = pd.DataFrame(
+        {
+            'order_value_first': first_value,
+            'customer_zip_code_prefix_first': first_zip,
+            'order_purchase_timestamp_first': first_ts,
+            'rows_seen': seen + sizes,
+            'order_ids': order_ids,
+        },
+        index=pd.Index(customers[starts], name='customer_unique_id'),
     )
+    state = pd.concat([state[~state.index.isin(batch.index)], batch]).sort_index()
+    return comp, state
+
+def earlier_first_orders(df: pd.DataFrame, state: pd.DataFrame):
+    # Customers with an order not seen before that was purchased before the
+    # first order in `state`, as when the ETL upserts a late order: every
+    # row of theirs is now compared with a different first order.
+    if not len(state):
+        return pd.Index([], name='customer_unique_id')
+    ts = pd.to_datetime(df['order_purchase_timestamp']).to_numpy()
+    first = state['order_purchase_timestamp_first'].reindex(df['customer_unique_id']).to_numpy()
+    unseen = ~df['order_id'].isin(scored_order_ids(state)).to_numpy()
+    return pd.Index(df['customer_unique_id'][unseen & (ts < first)].unique(), name='customer_unique_id')
+
+def update_fraud_data(df: pd.DataFrame, state: pd.DataFrame, rules: RuleSet = None):
+    comp, state = compare_repeat_orders(df, state)
+    if comp.empty:
+        return comp, state
+    return score_fraud(comp, rules or load_fraud_rules()), state
+
+def generate_fraud_data(df: pd.DataFrame, rules: RuleSet = None):
+    fraud, _ = update_fraud_data(df, empty_fraud_state(), rules=rules)
     return fraud
 
-@st.cache_resource(ttl=3600)
-def load_fraud_data():
-    client = storage.Client.from_service_account_info(
-        st.secrets["gcp_service_account"]
-    )
-    bucket = client.bucket(MODEL_BUCKET)
-    blob = bucket.blob(FRAUD_BLOB)
-
-    if blob.exists():
-  
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".parquet")
-        blob.download_to_filename(tmp.name)
-        df = pd.read_parquet(tmp.name)
-        tmp.close()
-        os.unlink(tmp.name)
-        return df
+def _download_parquet(bucket, blob_name, generation=None):
+    data = fetch_blob(bucket, blob_name, generation)
+    return None if data is None else read_parquet_bytes(data)
+
+def _upload_parquet(bucket, blob_name, table):
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink)
+    bucket.blob(blob_name).upload_from_string(sink.getvalue().to_pybytes(), content_type="application/octet-stream")
+
+def load_fraud_state(bucket, rules: RuleSet = None):
+    # State scored under a different rule set, or saved before the scored
+    # files were recorded, is discarded, which makes the next refresh a full
+    # rebuild. Returns the state and the dataset files already scored.
+    rules = rules or load_fraud_rules()
+    table = _download_parquet(bucket, STATE_BLOB)
+    metadata = (table.schema.metadata or {}) if table is not None else {}
+    if table is None or metadata.get(RULES_KEY, b"").decode() != rules.fingerprint or FILES_KEY not in metadata:
+        return empty_fraud_state(), None
+    table = table.set_column(table.schema.get_field_index('order_ids'), 'order_ids', table.column('order_ids').cast(ORDER_IDS.pyarrow_dtype))
+    state = table.to_pandas(types_mapper={ORDER_IDS.pyarrow_dtype: ORDER_IDS}.get)
+    return state, json.loads(metadata[FILES_KEY])
+
+def save_fraud_state(bucket, state, files, rules: RuleSet):
+    # The scored files and rule fingerprint live in the state file's metadata
+    # so all three are replaced by the same upload.
+    table = pa.Table.from_pandas(state)
+    metadata = {
+        **(table.schema.metadata or {}),
+        FILES_KEY: json.dumps(files).encode(),
+        RULES_KEY: rules.fingerprint.encode(),
+    }
+    _upload_parquet(bucket, STATE_BLOB, table.replace_schema_metadata(metadata))
+
+def load_raw_orders(bucket, scored=()):
+    # Incremental ETL runs only update the partitioned dataset, so it is
+    # preferred over the monolithic file once it exists. Dataset files are
+    # never rewritten in place, so only files missing from `scored` can hold
+    # orders not scored yet, whatever their purchase time; the monolithic
+    # file is read whole. Returns the rows and the files now scored.
+    manifest = load_manifest(bucket, FACT_DATASET)
+    if manifest is not None:
+        names = [f["name"] for f in manifest["files"]]
+        files = [f for f in manifest["files"] if f["name"] not in set(scored)]
+        if not files:
+            return pd.DataFrame(columns=FRAUD_COLUMNS), names
+        return read_fact_dataset(bucket, {**manifest, "files": files}, FRAUD_COLUMNS).to_pandas(), names
+    data = fetch_blob(bucket, RAW_BLOB)
+    return pq.read_table(pa.BufferReader(data), columns=FRAUD_COLUMNS).to_pandas(), []
+
+def load_customer_orders(bucket, customers):
+    # Every row of the given customers; the row filter is pushed down to
+    # each file's scan.
+    filters = [('customer_unique_id', 'in', list(customers))]
+    manifest = load_manifest(bucket, FACT_DATASET)
+    if manifest is not None:
+        return read_fact_dataset(bucket, manifest, FRAUD_COLUMNS, filters=filters).to_pandas()
+    data = fetch_blob(bucket, RAW_BLOB)
+    return pq.read_table(pa.BufferReader(data), columns=FRAUD_COLUMNS, filters=filters).to_pandas()
+
+def refresh_fraud_candidates(bucket, df: pd.DataFrame = None, rules: RuleSet = None):
+    # Without `df` only the dataset files written since the last refresh are
+    # loaded. Either way, rows of orders already scored are skipped.
+    rules = rules or load_fraud_rules()
+    state, scored = load_fraud_state(bucket, rules)
+    existing = _download_parquet(bucket, FRAUD_BLOB) if scored is not None else None
+    if scored is not None and existing is None:
+        # The candidates were deleted after the state was saved; appending
+        # to nothing would publish only the newest candidates.
+        state, scored = empty_fraud_state(), None
+    files = scored or []
+    if df is None:
+        df, files = load_raw_orders(bucket, files)
+    rescored = earlier_first_orders(df, state)
+    if len(rescored):
+        # Those customers are scored again from all their rows.
+        state = state.drop(rescored)
+        df = pd.concat([df[~df['customer_unique_id'].isin(rescored)], load_customer_orders(bucket, rescored)], ignore_index=True)
+    new_fraud, new_state = update_fraud_data(df, state, rules)
+    if new_state is state:
+        if scored is not None and files != scored:
+            save_fraud_state(bucket, state, files, rules)
+        return None, 0
+
+    if existing is not None:
+        # A run that stopped between the two uploads is re-scored from the
+        # old state; dropping duplicates keeps the append idempotent.
+        kept = existing.to_pandas()
+        kept = kept[~kept['customer_unique_id'].isin(rescored)]
+        candidates = pd.concat([kept, new_fraud], ignore_index=True)
+        candidates = candidates.drop_duplicates(['order_id', 'order_item_id'], keep='last').reset_index(drop=True)
     else:
-    
-        st.info("Fraud dataset not found → generating from raw data...")
-        tmp_raw = tempfile.NamedTemporaryFile(delete=False, suffix=".parquet")
-        bucket.blob(RAW_BLOB).download_to_filename(tmp_raw.name)
-        df_raw = pd.read_parquet(tmp_raw.name)
-        tmp_raw.close()
-        os.unlink(tmp_raw.name)
+        candidates = new_fraud
+    _upload_parquet(bucket, FRAUD_BLOB, pa.Table.from_pandas(candidates, preserve_index=False))
+    save_fraud_state(bucket, new_state, files, rules)
+    return candidates, len(new_fraud)
 
-        df_fraud = generate_fraud_data(df_raw)
+def get_fraud_version():
+    return get_blob_generation(MODEL_BUCKET, FRAUD_BLOB)
 
-        tmp_save = tempfile.NamedTemporaryFile(delete=False, suffix=".parquet")
-        df_fraud.to_parquet(tmp_save.name, index=False)
-        bucket.blob(FRAUD_BLOB).upload_from_filename(tmp_save.name)
-        tmp_save.close()
-        os.unlink(tmp_save.name)
+@cached(max_entries=2)
+def _load_fraud_data(generation):
+    bucket = get_storage_client().bucket(MODEL_BUCKET)
+    table = _download_parquet(bucket, FRAUD_BLOB, generation)
+    if table is not None:
+        return table.to_pandas()
 
-        return df_fraud
+    st.info("Fraud dataset not found → generating from raw data...")
+    candidates, _ = refresh_fraud_candidates(bucket)
+    return candidates if candidates is not None else pd.DataFrame()
+
+@timed("load")
+def load_fraud_data():
+    return _load_fraud_data(get_fraud_version())
 
 def render_fraud_detection(container):
     with container:
@@ -92,7 +279,6 @@ def render_fraud_detection(container):
                 'value_ratio', 'different_zip', 'risk_level'
             ]]
             st.dataframe(top20, use_container_width=True)
-            csv = df.to_csv(index=False)
-            st.download_button("Download full fraud dataset", csv, "fraud_cases.csv", "text/csv")
+            render_export("fraud_cases", get_fraud_version(), load_fraud_data, "Download full fraud dataset")
         else:
             st.warning("No fraud cases found")
@@ -2,51 +2,18 @@ import streamlit as st
 import pandas as pd
 import altair as alt
 import numpy as np
-from helpers.gcs_loader import load_parquet_from_gcs
-
-def render_sales_by_region(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
 
+def render_sales_by_region(column, filters):
     with column:
         st.subheader("Sales Performance by Region")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="geo_sales_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
+        state_sales = filters.cube.rollup(['customer_state'], distinct=['orders', 'customers'])
 
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if state_sales.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        state_sales = filtered_df.groupby('customer_state').agg({
-            'payment_value': 'sum',
-            'order_id': 'nunique',
-            'customer_id': 'nunique'
-        }).reset_index()
-        
+        state_sales = state_sales[['customer_state', 'revenue', 'orders', 'customers']]
         state_sales.columns = ['State', 'Total Revenue', 'Total Orders', 'Unique Customers']
         state_sales['Avg Order Value'] = state_sales['Total Revenue'] / state_sales['Total Orders']
         state_sales = state_sales.sort_values('Total Revenue', ascending=False)
@@ -93,49 +60,17 @@ def render_sales_by_region(column):
         )
 
 
-def render_customer_distribution(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_customer_distribution(column, filters):
     with column:
         st.subheader("Customer Distribution by State")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
+        customer_dist = filters.cube.rollup(['customer_state'], distinct=['customers', 'orders'])
 
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="geo_customer_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if customer_dist.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        customer_dist = filtered_df.groupby('customer_state').agg({
-            'customer_id': 'nunique',
-            'order_id': 'nunique',
-            'payment_value': 'sum'
-        }).reset_index()
-        
+        customer_dist = customer_dist[['customer_state', 'customers', 'orders', 'revenue']]
         customer_dist.columns = ['State', 'Unique Customers', 'Total Orders', 'Total Revenue']
         customer_dist['Orders per Customer'] = customer_dist['Total Orders'] / customer_dist['Unique Customers']
         customer_dist['Revenue per Customer'] = customer_dist['Total Revenue'] / customer_dist['Unique Customers']
@@ -176,50 +111,17 @@ def render_customer_distribution(column):
         )
 
 
-def render_seller_performance_by_region(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_seller_performance_by_region(column, filters):
     with column:
         st.subheader("Seller Performance by Region")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="geo_seller_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
+        seller_perf = filters.cube.rollup(['seller_state'], distinct=['sellers', 'orders'])
 
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if seller_perf.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        seller_perf = filtered_df.groupby('seller_state').agg({
-            'seller_id': 'nunique',
-            'order_id': 'nunique',
-            'payment_value': 'sum',
-            'price': 'sum'
-        }).reset_index()
-        
+        seller_perf = seller_perf[['seller_state', 'sellers', 'orders', 'revenue', 'price']]
         seller_perf.columns = ['State', 'Unique Sellers', 'Total Orders', 'Total Revenue', 'Product Value']
         seller_perf['Avg Orders per Seller'] = seller_perf['Total Orders'] / seller_perf['Unique Sellers']
         seller_perf['Avg Revenue per Seller'] = seller_perf['Total Revenue'] / seller_perf['Unique Sellers']
@@ -268,51 +170,24 @@ def render_seller_performance_by_region(column):
         )
 
 
-def render_city_level_analysis(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_city_level_analysis(column, filters):
     with column:
         st.subheader("City-Level Analysis")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
+        # Only the partitions of the selected months are read.
+        city_analysis = filters.aggregate(['customer_city', 'customer_state'], {
+            'customers': ('customer_id', 'nunique'),
+            'orders': ('order_id', 'nunique'),
+            'revenue': ('payment_value', 'sum'),
+            'review_score': ('review_score', 'mean'),
+        })
 
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="geo_city_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if city_analysis.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        city_analysis = filtered_df.groupby(['customer_city', 'customer_state']).agg({
-            'customer_id': 'nunique',
-            'order_id': 'nunique',
-            'payment_value': 'sum',
-            'review_score': 'mean'
-        }).reset_index()
-        
         city_analysis.columns = ['City', 'State', 'Customers', 'Orders', 'Revenue', 'Avg Review Score']
+        city_analysis['Avg Review Score'] = city_analysis['Avg Review Score'].astype(float)
         city_analysis['Avg Order Value'] = city_analysis['Revenue'] / city_analysis['Orders']
         city_analysis = city_analysis.sort_values('Revenue', ascending=False).head(20)
 
@@ -350,54 +225,26 @@ def render_city_level_analysis(column):
         st.altair_chart(scatter_chart, width='stretch')
 
 
-def render_regional_product_preferences(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_regional_product_preferences(column, filters):
     with column:
         st.subheader("Regional Product Preferences")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered'].copy()
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="geo_product_date"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
+        state_totals = filters.cube.rollup(['customer_state'])
 
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
-        if filtered_df.empty:
-            st.warning("No data available for selected date range.")
+        if state_totals.empty:
+            st.warning("No data available for the selected filters.")
             return
 
-        states = sorted(filtered_df['customer_state'].unique())
+        states = sorted(state_totals['customer_state'])
         selected_state = st.selectbox("Select State to Analyze", states, key="state_selector")
 
         if selected_state:
-            state_df = filtered_df[filtered_df['customer_state'] == selected_state]
-            
-            category_sales = state_df.groupby('product_category_name').agg({
-                'payment_value': 'sum',
-                'order_id': 'nunique'
-            }).reset_index()
+            state_categories = filters.cube.rollup(
+                ['product_category_name'],
+                distinct=['orders'], customer_state=selected_state
+            )
             
+            category_sales = state_categories[['product_category_name', 'revenue', 'orders']]
             category_sales.columns = ['Category', 'Revenue', 'Orders']
             category_sales = category_sales.sort_values('Revenue', ascending=False).head(10)
 
@@ -419,10 +266,14 @@ def render_regional_product_preferences(column):
 
             st.markdown("### Comparison with National Average")
             
-            national_dist = filtered_df.groupby('product_category_name')['payment_value'].sum()
+            # Across every state, whichever states the filter bar keeps.
+            national_dist = (
+                filters.replace(states=()).cube.rollup(['product_category_name'])
+                .set_index('product_category_name')['revenue']
+            )
             national_pct = (national_dist / national_dist.sum() * 100).to_dict()
             
-            state_dist = state_df.groupby('product_category_name')['payment_value'].sum()
+            state_dist = state_categories.set_index('product_category_name')['revenue']
             state_pct = (state_dist / state_dist.sum() * 100).to_dict()
             
             comparison = []
@@ -1,50 +1,65 @@
 import streamlit as st
-import pandas as pd
 import altair as alt
-from helpers.gcs_loader import load_parquet_from_gcs
-from prophet import Prophet
+from helpers.fact_store import get_fact_version
+from helpers.forecast_refresh import ensure_background_refresh, is_refresh_running
+from helpers.forecast_store import TOTAL_SEGMENT, is_stale, list_segments, read_forecast, read_manifest
 from prophet.plot import plot_plotly
 import plotly.graph_objects as go
 
-def get_daily_revenue(df):
-    df_revenue = df[df['order_status'] == 'delivered'].copy()
-    daily_revenue = (
-        df_revenue.groupby(df_revenue['purchase_date'].dt.date)['payment_value']
-        .sum()
-        .reset_index()
-    )
-
-    daily_revenue.columns = ['ds', 'y']
-    daily_revenue['ds'] = pd.to_datetime(daily_revenue['ds'])
-
-    return daily_revenue
-
-def get_forecast(df):
-    m = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            interval_width=0.90 
-        )
-
-    daily_revenue = get_daily_revenue(df)
-
-    m.fit(daily_revenue)
-    future = m.make_future_dataframe(periods=180)
-    forecast = m.predict(future)
-
-    return forecast, m
+FACT_COLUMNS = ["purchase_date", "product_category_name", "order_item_id"]
+
+def segment_label(kind, value):
+    if (kind, value) == TOTAL_SEGMENT:
+        return "All revenue"
+    return f"{kind.title()}: {value}"
+
+def get_forecast_manifest():
+    # Forecasts are fitted by jobs/precompute_forecasts.py; this page only reads them.
+    manifest = read_manifest()
+    data_version = get_fact_version()
+    if is_stale(manifest, data_version):
+        ensure_background_refresh(data_version)
+    return manifest
+
+def get_selected_forecast(manifest):
+    segments = {segment_label(kind, value): (kind, value) for kind, value in list_segments(manifest)}
+    label = st.session_state.get("forecast_segment", segment_label(*TOTAL_SEGMENT))
+    kind, value = segments.get(label, TOTAL_SEGMENT)
+    horizon = st.session_state.get("forecast_horizon", max(manifest["horizons"]))
+    return read_forecast(manifest, kind, value, horizon)
+
+def render_forecasts_pending():
+    if is_refresh_running():
+        st.info("Forecasts are being prepared in the background. Refresh the page in a few minutes.")
+    else:
+        st.info("No forecasts are available yet. Run `python -m jobs.precompute_forecasts` to prepare them.")
 
 def render_revenue_forecasting(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
+    manifest = get_forecast_manifest()
 
     with column:
         st.subheader("Revenue Forecasting")
 
-        forecast, m = get_forecast(df)
+        if manifest is None:
+            render_forecasts_pending()
+            return
+
+        labels = [segment_label(kind, value) for kind, value in list_segments(manifest)]
+        col_segment, col_horizon = st.columns([3, 1])
+        col_segment.selectbox("Series", labels, key="forecast_segment")
+        col_horizon.selectbox(
+            "Horizon (days)",
+            manifest["horizons"],
+            index=len(manifest["horizons"]) - 1,
+            key="forecast_horizon"
+        )
+
+        # The manifest can name a run whose files were pruned by a newer one.
+        selected = get_selected_forecast(manifest)
+        if selected is None:
+            render_forecasts_pending()
+            return
+        forecast, m, _ = selected
 
         fig = plot_plotly(m, forecast)
         fig.update_layout(
@@ -63,25 +78,22 @@ def map_month_to_quarter(month):
     else:
         return 'Q4 (Oct-Dec)'
 
-def render_seasonal_segmentation(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
+def render_seasonal_segmentation(column, filters):
+    df_seasonal = filters.table(FACT_COLUMNS)
 
     with column:
         st.subheader('Seasonal Product Segmentation')
 
-        df_seasonal = df[df['order_status'] == 'delivered'].copy()
-        df_seasonal['purchase_date'] = pd.to_datetime(df_seasonal['purchase_date'])
+        if df_seasonal.empty:
+            st.warning("No data available for the selected filters.")
+            return
 
         df_seasonal['purchase_month'] = df_seasonal['purchase_date'].dt.month
         
         df_seasonal['purchase_quarter'] = df_seasonal['purchase_month'].apply(map_month_to_quarter)
 
         seasonal_sales = (
-            df_seasonal.groupby(['purchase_quarter', 'product_category_name'])['order_item_id']
+            df_seasonal.groupby(['purchase_quarter', 'product_category_name'], observed=True)['order_item_id']
             .count()
             .reset_index(name='Sales_Volume')
             .sort_values(by=['purchase_quarter', 'Sales_Volume'], ascending=[True, False])
@@ -102,23 +114,21 @@ def render_seasonal_segmentation(column):
         st.dataframe(filtered_sales)
 
 def render_key_forecast_metris(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-    df['purchase_date'] = pd.to_datetime(df['purchase_date'])
+    manifest = get_forecast_manifest()
     
     with column:
-        daily_revenue = get_daily_revenue(df)
-        forecast, m = get_forecast(df)
-
         st.subheader("Key Forecast Metrics")
+
+        selected = get_selected_forecast(manifest) if manifest is not None else None
+        if selected is None:
+            return
+
+        forecast, m, last_actual_date = selected
     
-        last_actual_date = daily_revenue['ds'].max()
         future_forecast = forecast[forecast['ds'] > last_actual_date]
         total_forecasted_revenue = future_forecast['yhat'].sum()
         
-        final_actual_value = daily_revenue['y'].iloc[-1]
+        final_actual_value = m.history['y'].iloc[-1]
         final_forecasted_value = future_forecast['yhat'].iloc[-1]
         predicted_growth = ((final_forecasted_value - final_actual_value) / final_actual_value) * 100
         
@@ -1,58 +1,24 @@
 import streamlit as st
-import pandas as pd
 import altair as alt
-from helpers.gcs_loader import load_parquet_from_gcs
+from helpers.fact_store import get_fact_table
 
 def render_df(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
+    df = get_fact_table()
     
     with column:
         st.dataframe(df)
 
-def render_revenue_overtime(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_revenue_overtime(column, filters):
     with column:
         st.subheader("Revenue Over Time")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-
-        completed_df = df[df['order_status'] == 'delivered']
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
-
         daily_rev = (
-            filtered_df.groupby(filtered_df['purchase_date'].dt.date)['payment_value']
-            .sum()
-            .reset_index()
-            .rename(columns={'purchase_date': 'date', 'payment_value': 'revenue'})
+            filters.cube.rollup(['day'])[['day', 'revenue']]
+            .rename(columns={'day': 'date'})
         )
 
         if daily_rev.empty:
-            st.warning("No data available for selected date range.")
+            st.warning("No data available for the selected filters.")
             return
 
         chart = (
@@ -69,49 +35,14 @@ def render_revenue_overtime(column):
         st.altair_chart(chart, use_container_width=True)
          # st.altair_chart(pie, width='stretch')
 
-def render_product_partition(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_product_partition(column, filters):
     with column:
         st.subheader("Product Category Distribution")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        df = df[df['order_status'] == 'delivered']
-
-        min_date = df['purchase_date'].min().date()
-        max_date = df['purchase_date'].max().date()
-
-        selected = st.date_input(
-            "Select date range",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date
-        )
-
-        if isinstance(selected, tuple):
-            start, end = selected
-        else:
-            start = min_date
-            end = max_date
-
-        mask = (
-            (df['purchase_date'].dt.date >= start) &
-            (df['purchase_date'].dt.date <= end)
-        )
-        df = df[mask]
-
-        cat_rev = (
-            df.groupby('product_category_name')['payment_value']
-            .sum()
-            .reset_index()
-            .rename(columns={'payment_value': 'revenue'})
-        )
+        cat_rev = filters.cube.rollup(['product_category_name'])[['product_category_name', 'revenue']]
 
         if cat_rev.empty:
-            st.warning("No data available for this date range.")
+            st.warning("No data available for the selected filters.")
             return
 
         pie = (
@@ -131,57 +62,26 @@ def render_product_partition(column):
         st.altair_chart(pie, use_container_width=True)
         # st.altair_chart(pie, width='stretch')
 
-def render_product_leaderboard(column):
-    df = load_parquet_from_gcs(
-        bucket_name="bdabi-group7",
-        blob_name="preprocessed/preprocessed.parquet"
-    )
-
+def render_product_leaderboard(column, filters):
     with column:
         st.subheader("Top Product Leaderboard")
 
-        df['purchase_date'] = pd.to_datetime(df['purchase_date'])
-        completed_df = df[df['order_status'] == 'delivered']
-
-        min_date = completed_df['purchase_date'].min().date()
-        max_date = completed_df['purchase_date'].max().date()
-
-        selected_range = st.date_input(
-            "Select Date Range for Leaderboards",
-            value=(min_date, max_date),
-            min_value=min_date,
-            max_value=max_date,
-            key="leaderboard_date_range"
-        )
-
-        if isinstance(selected_range, tuple):
-            start_date, end_date = selected_range
-        else:
-            start_date = min_date
-            end_date = max_date
-
-        mask = (completed_df['purchase_date'].dt.date >= start_date) & \
-               (completed_df['purchase_date'].dt.date <= end_date)
-        filtered_df = completed_df[mask]
+        category_sales = filters.cube.rollup(['product_category_name'])
 
-        if filtered_df.empty:
-            st.warning("No data available for the selected date range.")
+        if category_sales.empty:
+            st.warning("No data available for the selected filters.")
             return
 
         revenue_leaderboard = (
-            filtered_df.groupby('product_category_name')['payment_value']
-            .sum()
-            .reset_index()
-            .rename(columns={'payment_value': 'Total Revenue'})
+            category_sales[['product_category_name', 'revenue']]
+            .rename(columns={'revenue': 'Total Revenue'})
             .sort_values(by='Total Revenue', ascending=False)
             .head(10)
         )
         
         volume_leaderboard = (
-            filtered_df.groupby('product_category_name')['order_item_id']
-            .count()
-            .reset_index()
-            .rename(columns={'order_item_id': 'Quantity Sold'})
+            category_sales[['product_category_name', 'items']]
+            .rename(columns={'items': 'Quantity Sold'})
             .sort_values(by='Quantity Sold', ascending=False)
             .head(10)
         )
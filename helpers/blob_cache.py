@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from google.api_core.exceptions import NotFound
+
+from helpers.local_storage import LocalBucket
+
+BLOB_CACHE_DIR = os.environ.get("BDABI_BLOB_CACHE_DIR", os.path.join(".cache", "blobs"))
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BDABI_BLOB_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Temporary files older than this were left by a write that died.
+STALE_TMP_SECONDS = 3600
+# Entries used more recently than this are kept by eviction even above the
+# size limit: a path returned by fetch(as_file=True) is read after fetch
+# returns, possibly while other threads or processes store and evict.
+IN_USE_SECONDS = 300
+
+_evict_lock = threading.Lock()
+
+
+def _blob_dir(bucket_name: str, blob_name: str):
+    return os.path.join(BLOB_CACHE_DIR, quote(bucket_name, safe=""), quote(blob_name, safe=""))
+
+
+def _read(path: str):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    # The modification time doubles as the last use for eviction.
+    os.utime(path)
+    return data
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _store(directory: str, generation, data: bytes):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, os.path.join(directory, str(generation)))
+
+    # Older generations of the same blob can never be served again, once
+    # readers that were handed their path are done.
+    in_use = time.time_ns() - IN_USE_SECONDS * 10 ** 9
+    for entry in os.scandir(directory):
+        if entry.name != str(generation) and not entry.name.endswith(".tmp"):
+            try:
+                if entry.stat().st_mtime_ns <= in_use:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def evict(max_bytes: int = None):
+    # Removes least recently used entries until the cache fits in max_bytes.
+    # Files another thread or process is still writing or reading are left
+    # alone, so the cache can exceed max_bytes by the recent working set.
+    max_bytes = BLOB_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time_ns()
+    stale_tmp = now - STALE_TMP_SECONDS * 10 ** 9
+    in_use = now - IN_USE_SECONDS * 10 ** 9
+    with _evict_lock:
+        entries = []
+        for directory, _, files in os.walk(BLOB_CACHE_DIR):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if file_name.endswith(".tmp") and stat.st_mtime_ns > stale_tmp:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= max_bytes or mtime > in_use:
+                break
+            try:
+                os.remove(path)
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+            total -= size
+
+
+def fetch(bucket, blob_name: str, generation=None, as_file=False):
+    # Returns the blob's bytes, or None if it does not exist. Only the
+    # blob's metadata is requested when a cached copy of the current
+    # generation is on disk; pass a known generation to skip even that.
+    # With as_file the path of the cached copy is returned instead, unless
+    # the blob could not be cached, so readers can load only what they need.
+    known = generation
+    if isinstance(bucket, LocalBucket):
+        # Blobs of a local bucket are files already; copying them into the
+        # cache would only double the disk use.
+        blob = bucket.blob(blob_name)
+        if as_file:
+            return blob.path if blob.exists() else None
+        try:
+            return blob.download_as_bytes()
+        except NotFound:
+            return None
+
+    if generation is None:
+        blob = bucket.get_blob(blob_name)
+        if blob is None:
+            return None
+        generation = blob.generation
+
+    directory = _blob_dir(bucket.name, blob_name)
+    path = os.path.join(directory, str(generation))
+    if BLOB_CACHE_MAX_BYTES > 0:
+        if as_file and _touch(path):
+            return path
+        data = None if as_file else _read(path)
+        if data is not None:
+            return data
+
+    try:
+        data = bucket.blob(blob_name, generation=generation).download_as_bytes()
+    except NotFound:
+        # A caller's generation can be stale if the blob was replaced since.
+        return None if known is None else fetch(bucket, blob_name, as_file=as_file)
+
+    if 0 < len(data) <= BLOB_CACHE_MAX_BYTES:
+        _store(directory, generation, data)
+        evict()
+        if as_file and os.path.exists(path):
+            return path
+    return data
@@ -0,0 +1,91 @@
+import gzip
+import os
+import re
+import tempfile
+
+import pandas as pd
+import streamlit as st
+
+EXPORT_DIR = os.environ.get("BDABI_EXPORT_DIR", os.path.join(".cache", "exports"))
+EXPORT_CHUNK_ROWS = 100_000
+
+# label -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def write_export(df: pd.DataFrame, path: str, fmt: str, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    # Writes chunk by chunk under a temporary name, so neither the full text
+    # of a CSV nor a half-written file is ever visible.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        if fmt == "Parquet":
+            df.to_parquet(tmp, index=False, row_group_size=chunk_rows)
+        else:
+            opener = gzip.open if fmt == "CSV (gzip)" else open
+            with opener(tmp, "wt", newline="") as f:
+                for start in range(0, max(len(df), 1), chunk_rows):
+                    df.iloc[start:start + chunk_rows].to_csv(f, index=False, header=start == 0)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _slug(value):
+    return re.sub(r"[^0-9A-Za-z]+", "_", str(value)).strip("_")
+
+
+def export_path(name: str, version, fmt: str):
+    extension, _ = EXPORT_FORMATS[fmt]
+    return os.path.join(EXPORT_DIR, f"{_slug(name)}--{_slug(version)}.{extension}")
+
+
+def _prune_exports(name: str, version):
+    prefix = f"{_slug(name)}--"
+    current = f"{prefix}{_slug(version)}."
+    for file_name in os.listdir(EXPORT_DIR):
+        if file_name.startswith(prefix) and not file_name.startswith(current):
+            try:
+                os.remove(os.path.join(EXPORT_DIR, file_name))
+            except FileNotFoundError:
+                pass
+
+
+# One file per (name, data version, format) on disk; building it is skipped
+# whenever the file already exists from an earlier session or process.
+# Unversioned data is always rebuilt once per process.
+@st.cache_resource(max_entries=16)
+def _build_export(name: str, version, fmt: str, _load_frame):
+    path = export_path(name, version, fmt)
+    if version is None or not os.path.exists(path):
+        write_export(_load_frame(), path, fmt)
+        _prune_exports(name, version)
+    return path
+
+
+def render_export(name: str, version, load_frame, label: str = "Download"):
+    # Nothing is serialized until the user asks for a file.
+    col_format, col_button = st.columns([2, 1])
+    with col_format:
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key=f"{name}_export_format")
+    with col_button:
+        prepare = st.button("Prepare export", key=f"{name}_export_prepare")
+    if not prepare:
+        return
+
+    path = _build_export(name, version, fmt, load_frame)
+    if not os.path.exists(path):
+        # Removed by another process since it was cached here.
+        _build_export.clear()
+        path = _build_export(name, version, fmt, load_frame)
+    extension, mime = EXPORT_FORMATS[fmt]
+    # Streamlit reads the whole file into its media manager and keeps it
+    # while the button is shown; only building the file is chunked.
+    with open(path, "rb") as f:
+        st.download_button(label, f, f"{name}.{extension}", mime, key=f"{name}_export_download", on_click="ignore")
@@ -0,0 +1,237 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from helpers.fact_store import get_fact_manifest, get_fact_table, get_fact_version, read_fact_files
+from helpers.memory_cache import cached
+from helpers.profiling import timed
+
+CUBE_KEYS = ["day", "order_status", "product_category_name", "customer_state", "seller_state", "payment_type"]
+FACT_COLUMNS = [
+    "purchase_date", *CUBE_KEYS[1:],
+    "payment_value", "price", "freight_value", "delivery_time", "delivery_delay",
+    "order_id", "customer_id", "seller_id",
+]
+
+DELIVERY_TIME_BINS = [0, 7, 14, 21, 28, 35, 100]
+DELIVERY_TIME_LABELS = ['0-7 days', '8-14 days', '15-21 days', '22-28 days', '29-35 days', '35+ days']
+DELAY_BINS = [-100, 0, 7, 14, 30, 100]
+DELAY_LABELS = ['On Time', '1-7 days late', '8-14 days late', '15-30 days late', '30+ days late']
+
+# Distinct counts are not additive, so each cell keeps the exact set of ids it
+# contains as (cell, code) pairs sorted by cell. At Olist cardinality a cell
+# holds one or two orders, which is far smaller than any probabilistic sketch.
+# Codes are local to a cube; `ids` keeps a 64-bit hash per code so cubes
+# built from different rows can be stacked.
+DISTINCT_COLUMNS = {
+    "orders": "order_id",
+    "customers": "customer_id",
+    "sellers": "seller_id",
+}
+
+
+def _cell_measures(rows: pd.DataFrame):
+    delivery_time = rows['delivery_time']
+    delay = rows['delivery_delay']
+    freight_ratio = rows['freight_value'] / rows['price']
+
+    measures = pd.DataFrame({
+        'items': np.ones(len(rows), dtype=np.int32),
+        'revenue': rows['payment_value'],
+        'price': rows['price'],
+        'freight': rows['freight_value'],
+        'freight_n': rows['freight_value'].notna().astype(np.int32),
+        'freight_ratio': freight_ratio,
+        'freight_ratio_n': freight_ratio.notna().astype(np.int32),
+        'delivery_time': delivery_time,
+        'delivery_time_n': delivery_time.notna().astype(np.int32),
+        'delivery_delay': delay,
+        'delivery_delay_n': delay.notna().astype(np.int32),
+        'on_time': (delay <= 0).astype(np.int32),
+        'late': (delay > 0).astype(np.int32),
+    }, index=rows.index)
+
+    time_bins = pd.cut(delivery_time, bins=DELIVERY_TIME_BINS, labels=False)
+    for i in range(len(DELIVERY_TIME_LABELS)):
+        measures[f'delivery_time_bin_{i}'] = (time_bins == i).astype(np.int32)
+
+    delay_bins = pd.cut(delay, bins=DELAY_BINS, labels=False)
+    for i in range(len(DELAY_LABELS)):
+        measures[f'delay_bin_{i}'] = (delay_bins == i).astype(np.int32)
+
+    return measures
+
+
+class FactCube:
+    def __init__(self, cells: pd.DataFrame, members: dict, n_codes: dict, ids: dict = None):
+        self.cells = cells
+        self.members = members
+        self.n_codes = n_codes
+        self.ids = ids
+        self._days = cells['day'].to_numpy()
+
+    @classmethod
+    def from_fact(cls, df: pd.DataFrame):
+        rows = df[df['purchase_date'].notna()]
+        rows = rows.assign(day=rows['purchase_date'].dt.normalize())
+
+        grouped = _cell_measures(rows).groupby(
+            [rows[k] for k in CUBE_KEYS], observed=True, dropna=False, sort=True
+        )
+        cell_ids = grouped.ngroup().to_numpy()
+        cells = grouped.sum(min_count=0).reset_index()
+
+        members, n_codes, ids = {}, {}, {}
+        for name, column in DISTINCT_COLUMNS.items():
+            codes, uniques = pd.factorize(rows[column])
+            n = max(len(uniques), 1)
+            keep = codes >= 0
+            pairs = np.unique(cell_ids[keep].astype(np.int64) * n + codes[keep])
+            members[name] = ((pairs // n).astype(np.int32), (pairs % n).astype(np.int32))
+            n_codes[name] = n
+            ids[name] = pd.util.hash_array(np.asarray(uniques, dtype=object))
+
+        return cls(cells, members, n_codes, ids)
+
+    @classmethod
+    def concat(cls, cubes):
+        # Stacks cubes of disjoint days into one, as if it had been built
+        # from all of their rows; cells stay sorted by day and ids are
+        # matched across cubes by hash.
+        cells = pd.concat([c.cells for c in cubes], ignore_index=True)
+        order = np.argsort(cells['day'].to_numpy(), kind='stable')
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        cells = cells.iloc[order].reset_index(drop=True)
+        for key in CUBE_KEYS[1:]:
+            cells[key] = cells[key].astype('category')
+        cell_offsets = np.cumsum([0] + [len(c.cells) for c in cubes])
+
+        members, n_codes = {}, {}
+        for name in DISTINCT_COLUMNS:
+            codes, uniques = pd.factorize(np.concatenate([c.ids[name] for c in cubes]))
+            n = max(len(uniques), 1)
+            code_offsets = np.cumsum([0] + [len(c.ids[name]) for c in cubes])
+            pairs = np.unique(np.concatenate([
+                position[cell_offsets[i] + cell] * n + codes[code_offsets[i] + code]
+                for i, (cell, code) in enumerate(c.members[name] for c in cubes)
+            ]))
+            members[name] = ((pairs // n).astype(np.int32), (pairs % n).astype(np.int32))
+            n_codes[name] = n
+        return cls(cells, members, n_codes)
+
+    @property
+    def min_day(self):
+        return self.cells['day'].min()
+
+    @property
+    def max_day(self):
+        return self.cells['day'].max()
+
+    def _day_range(self, start, end):
+        lo = 0 if start is None else np.searchsorted(self._days, np.datetime64(pd.Timestamp(start)), side='left')
+        hi = len(self._days) if end is None else np.searchsorted(self._days, np.datetime64(pd.Timestamp(end)), side='right')
+        return int(lo), int(hi)
+
+    @staticmethod
+    def _select(cells, filters):
+        selected = np.ones(len(cells), dtype=bool)
+        for key, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            selected &= cells[key].isin(values).to_numpy()
+        return selected
+
+    def slice(self, start=None, end=None, **filters):
+        # The cells rollup would sum for these arguments, as a cube of their
+        # own; rollups of the slice skip the date search and the filters.
+        lo, hi = self._day_range(start, end)
+        keep = lo + np.flatnonzero(self._select(self.cells.iloc[lo:hi], filters))
+        if len(keep) == len(self.cells):
+            return self
+        remap = np.full(hi - lo, -1, dtype=np.int64)
+        remap[keep - lo] = np.arange(len(keep))
+
+        members = {}
+        for name, (cell, code) in self.members.items():
+            a, b = np.searchsorted(cell, [lo, hi])
+            new = remap[cell[a:b] - lo]
+            kept = new >= 0
+            members[name] = (new[kept].astype(np.int32), code[a:b][kept])
+        return FactCube(self.cells.iloc[keep].reset_index(drop=True), members, self.n_codes)
+
+    def _distinct(self, name, lo, cell_groups, n_groups):
+        cell, code = self.members[name]
+        a, b = np.searchsorted(cell, [lo, lo + len(cell_groups)])
+        groups = cell_groups[cell[a:b] - lo]
+        keep = groups >= 0
+        n = self.n_codes[name]
+        pairs = np.unique(groups[keep].astype(np.int64) * n + code[a:b][keep])
+        return np.bincount(pairs // n, minlength=n_groups)
+
+    @timed("aggregate")
+    def rollup(self, by=(), start=None, end=None, distinct=(), **filters):
+        # Sums cells between start and end (inclusive). Keyword filters pin a
+        # cube key to one or more values; `distinct` adds exact id counts.
+        lo, hi = self._day_range(start, end)
+        cells = self.cells.iloc[lo:hi]
+        selected = self._select(cells, filters)
+
+        by = list(by)
+        measures = cells.columns.difference(CUBE_KEYS, sort=False)
+        if by:
+            grouped = cells[selected].groupby(by, observed=True, sort=True)
+            result = grouped[list(measures)].sum().reset_index()
+            cell_groups = np.full(len(cells), -1, dtype=np.int64)
+            cell_groups[selected] = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        else:
+            result = pd.DataFrame({m: [cells.loc[selected, m].sum()] for m in measures})
+            cell_groups = np.where(selected, 0, -1)
+
+        for name in distinct:
+            result[name] = self._distinct(name, lo, cell_groups, len(result))
+        return result
+
+
+def measure_mean(result: pd.DataFrame, measure: str):
+    return result[measure] / result[f'{measure}_n']
+
+
+# One cube per purchase month, keyed by the files it reads as fact tables
+# are, so an incremental build only re-aggregates the months it rewrote and
+# the full cube is stacked from the rest.
+@cached(max_entries=64)
+def _build_month_cube(files: str, all_columns):
+    return FactCube.from_fact(read_fact_files(json.loads(files), all_columns, FACT_COLUMNS))
+
+
+@cached(max_entries=2)
+def _build_fact_cube(generation):
+    manifest = get_fact_manifest()
+    months = {}
+    for f in manifest["files"] if manifest is not None else ():
+        # Rows without a purchase time have no day, so they are left out.
+        if f["year"] is not None:
+            months.setdefault((f["year"], f["month"]), []).append(f)
+    if not months:
+        return FactCube.from_fact(get_fact_table(FACT_COLUMNS))
+    return FactCube.concat([
+        _build_month_cube(json.dumps(months[month], sort_keys=True), tuple(manifest["columns"]))
+        for month in sorted(months)
+    ])
+
+
+@timed("load")
+def get_fact_cube():
+    return _build_fact_cube(get_fact_version())
+
+
+@cached(max_entries=8)
+def _slice_fact_cube(generation, start, end, filters):
+    return _build_fact_cube(generation).slice(start, end, **dict(filters))
+
+
+@timed("load")
+def get_fact_cube_slice(start=None, end=None, **filters):
+    # Sessions with the same filters share one slice.
+    return _slice_fact_cube(get_fact_version(), start, end, tuple(sorted(filters.items())))
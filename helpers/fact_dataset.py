@@ -0,0 +1,205 @@
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from helpers import blob_cache
+from helpers.gcs_loader import FETCH_WORKERS
+from helpers.rule_engine import OPERATORS
+
+# The fact table as a Hive-partitioned dataset:
+#
+#   <prefix>/<version>/order_status=delivered/year=2017/month=3/part-0.parquet
+#   <prefix>/manifest.json
+#   <prefix>/manifests/<version>.json
+#
+# Each file is sorted by purchase time. The manifest lists every file of the
+# current version with its partition values and generation and is written
+# last, so readers see either the old version or the complete new one, and
+# can prune partitions without listing the bucket. An incremental build
+# rewrites only the partitions it touches; the other entries keep pointing
+# at files written by earlier versions. Every file is written against the
+# Arrow schema stored in the manifest, so files from different chunks and
+# versions read back as one table.
+PARTITION_COLUMNS = ["order_status", "year", "month"]
+TIMESTAMP_COLUMN = "order_purchase_timestamp"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+ROW_GROUP_ROWS = 64 * 1024
+MANIFEST = "manifest.json"
+HISTORY = "manifests"
+
+
+def new_dataset_version():
+    return datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%f")
+
+
+def _partition_path(values):
+    return "/".join(
+        f"{column}={NULL_PARTITION if pd.isna(value) else value}"
+        for column, value in zip(PARTITION_COLUMNS, values)
+    )
+
+
+def _json_value(value):
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def partition_key(entry: dict):
+    return _partition_path([entry[column] for column in PARTITION_COLUMNS])
+
+
+def fact_schema(df: pd.DataFrame):
+    return pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+
+
+def dataset_schema(manifest: dict):
+    # The schema the manifest's files were written against; None for
+    # manifests written before it was recorded.
+    if manifest.get("schema") is None:
+        return None
+    return pa.ipc.read_schema(pa.py_buffer(base64.b64decode(manifest["schema"])))
+
+
+def partition_values(df: pd.DataFrame):
+    ts = pd.to_datetime(df[TIMESTAMP_COLUMN])
+    return pd.DataFrame({
+        "order_status": df["order_status"].astype(object),
+        "year": ts.dt.year.astype("Int16"),
+        "month": ts.dt.month.astype("Int8"),
+    }, index=df.index)
+
+
+def write_partitions(df: pd.DataFrame, bucket, prefix: str, version: str, part: int = 0, schema=None):
+    # Writes one file per partition present in df and returns their manifest
+    # entries; a build that writes in chunks uses one part number per chunk
+    # and passes every chunk the same schema.
+    order = np.argsort(pd.to_datetime(df[TIMESTAMP_COLUMN]).to_numpy(), kind="stable")
+    df = df.iloc[order]
+    keys = partition_values(df)
+
+    # One conversion to Arrow; every partition is a slice of rows taken in
+    # purchase order.
+    columns = [c for c in df.columns if c not in PARTITION_COLUMNS]
+    schema = fact_schema(df) if schema is None else schema
+    table = pa.Table.from_pandas(df[columns], schema=pa.schema([schema.field(c) for c in columns]), preserve_index=False)
+    groups = keys.reset_index(drop=True).groupby(PARTITION_COLUMNS, dropna=False, sort=True).indices
+
+    def upload(item):
+        values, rows = item
+        name = f"{prefix}/{version}/{_partition_path(values)}/part-{part}.parquet"
+        sink = pa.BufferOutputStream()
+        pq.write_table(table.take(rows), sink, row_group_size=ROW_GROUP_ROWS)
+        blob = bucket.blob(name)
+        blob.upload_from_string(sink.getvalue().to_pybytes(), content_type="application/octet-stream")
+        return {
+            "name": name,
+            **{column: _json_value(value) for column, value in zip(PARTITION_COLUMNS, values)},
+            "rows": len(rows),
+            "generation": blob.generation,
+        }
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        return list(pool.map(upload, groups.items()))
+
+
+def load_manifest(bucket, prefix: str, generation=None):
+    data = blob_cache.fetch(bucket, f"{prefix}/{MANIFEST}", generation)
+    return None if data is None else json.loads(data)
+
+
+def publish_dataset(bucket, prefix: str, version: str, columns, files, keep: int = 2, schema=None, **extra):
+    # `extra` carries build details such as the ETL watermark and the change
+    # manifest of an incremental build.
+    manifest = {"version": version, "columns": list(columns), "files": files, **extra}
+    if schema is not None:
+        manifest["schema"] = base64.b64encode(schema.serialize().to_pybytes()).decode("ascii")
+    text = json.dumps(manifest, indent=2)
+    bucket.blob(f"{prefix}/{HISTORY}/{version}.json").upload_from_string(text, content_type="application/json")
+    bucket.blob(f"{prefix}/{MANIFEST}").upload_from_string(text, content_type="application/json")
+    prune_dataset_versions(bucket, prefix, keep)
+    return manifest
+
+
+def write_fact_dataset(df: pd.DataFrame, bucket, prefix: str, keep: int = 2):
+    version = new_dataset_version()
+    schema = fact_schema(df)
+    files = write_partitions(df, bucket, prefix, version, schema=schema)
+    return publish_dataset(bucket, prefix, version, df.columns, files, keep, schema=schema)
+
+
+def prune_dataset_versions(bucket, prefix: str, keep: int = 2):
+    # Deletes files no longer referenced by the newest `keep` manifests, so
+    # a reader that loaded the previous manifest can still fetch its files.
+    history = sorted(b.name for b in bucket.list_blobs(prefix=f"{prefix}/{HISTORY}/"))
+    referenced = set()
+    for name in history[-keep:]:
+        referenced.update(f["name"] for f in json.loads(blob_cache.fetch(bucket, name))["files"])
+    for name in history[:-keep]:
+        bucket.blob(name).delete()
+    for blob in bucket.list_blobs(prefix=prefix + "/"):
+        if blob.name.endswith(".parquet") and blob.name not in referenced:
+            blob.delete()
+
+
+def date_filters(start=None, end=None):
+    # Row filters for purchases from start to end, both days inclusive.
+    filters = []
+    if start is not None:
+        filters.append((TIMESTAMP_COLUMN, ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append((TIMESTAMP_COLUMN, "<", pd.Timestamp(end) + pd.Timedelta(days=1)))
+    return filters
+
+
+def prune_files(files, filters=(), start=None, end=None):
+    # Files whose partition values can match; filters on partition columns
+    # are answered here and the rest are returned for the row scan.
+    row_filters = []
+    for column, op, value in filters:
+        if column not in PARTITION_COLUMNS:
+            row_filters.append((column, op, value))
+            continue
+        if op in ("in", "not in"):
+            files = [f for f in files if f[column] is not None and (f[column] in value) == (op == "in")]
+            continue
+        if op not in OPERATORS:
+            raise ValueError(f"Unsupported partition filter operator {op!r}")
+        files = [f for f in files if f[column] is not None and OPERATORS[op](f[column], value)]
+
+    if start is not None or end is not None:
+        lo = (pd.Timestamp(start).year, pd.Timestamp(start).month) if start is not None else (0, 0)
+        hi = (pd.Timestamp(end).year, pd.Timestamp(end).month) if end is not None else (9999, 12)
+        files = [f for f in files if f["year"] is not None and lo <= (f["year"], f["month"]) <= hi]
+        row_filters += date_filters(start, end)
+    return files, row_filters
+
+
+def read_fact_dataset(bucket, manifest: dict, columns=None, filters=(), start=None, end=None):
+    files, row_filters = prune_files(manifest["files"], filters, start, end)
+    columns = list(columns) if columns is not None else manifest["columns"]
+    file_columns = [c for c in columns if c not in PARTITION_COLUMNS]
+
+    def read(f):
+        source = blob_cache.fetch(bucket, f["name"], f["generation"], as_file=True)
+        if source is None:
+            raise FileNotFoundError(f"gs://{bucket.name}/{f['name']}")
+        if isinstance(source, bytes):
+            source = pa.BufferReader(source)
+        table = pq.read_table(source, columns=file_columns, filters=row_filters or None, partitioning=None)
+        for column in PARTITION_COLUMNS:
+            if column in columns:
+                table = table.append_column(column, pa.array([f[column]] * table.num_rows, type=pa.string() if column == "order_status" else pa.int16()))
+        return table.select(columns)
+
+    if not files:
+        return read(manifest["files"][0]).slice(0, 0)
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(files))) as pool:
+        # Files written from different chunks may disagree on all-null columns.
+        return pa.concat_tables(pool.map(read, files), promote_options="default")
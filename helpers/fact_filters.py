@@ -0,0 +1,107 @@
+import streamlit as st
+
+from helpers.fact_cube import get_fact_cube, get_fact_cube_slice
+from helpers.fact_store import get_fact_table
+from helpers.query_engine import aggregate_fact
+from helpers.translate import untranslate_category_names
+
+DEFAULT_STATUSES = ("delivered",)
+
+
+class FactFilters:
+    # The rows every fact panel of a rerun looks at, set once in the filter
+    # bar. Panels roll up `cube`, which is sliced on first use and shared by
+    # the rest of the rerun (and by sessions with the same filters); panels
+    # that need rows pass the same filters down to the scan. Dates are
+    # inclusive, None is unbounded and an empty selection keeps every state
+    # or category.
+    def __init__(self, start=None, end=None, statuses=DEFAULT_STATUSES, states=(), categories=()):
+        self.start = start
+        self.end = end
+        self.statuses = tuple(statuses)
+        self.states = tuple(states)
+        self.categories = tuple(categories)
+        self._cube = None
+
+    def replace(self, **changes):
+        return FactFilters(**{
+            "start": self.start,
+            "end": self.end,
+            "statuses": self.statuses,
+            "states": self.states,
+            "categories": self.categories,
+            **changes,
+        })
+
+    def cube_filters(self):
+        filters = {"order_status": list(self.statuses)}
+        if self.states:
+            filters["customer_state"] = list(self.states)
+        if self.categories:
+            filters["product_category_name"] = list(self.categories)
+        return filters
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            self._cube = get_fact_cube_slice(self.start, self.end, **self.cube_filters())
+        return self._cube
+
+    def row_filters(self):
+        # A single status is written as DELIVERED is, so the default filters
+        # share the cached tables of views that ask for delivered orders.
+        if len(self.statuses) == 1:
+            filters = [("order_status", "==", self.statuses[0])]
+        else:
+            filters = [("order_status", "in", self.statuses)]
+        if self.states:
+            filters.append(("customer_state", "in", self.states))
+        if self.categories:
+            filters.append(("product_category_name", "in", tuple(untranslate_category_names(self.categories))))
+        return tuple(filters)
+
+    def table(self, columns):
+        return get_fact_table(columns, self.row_filters(), self.start, self.end)
+
+    def aggregate(self, by, aggregations: dict):
+        return aggregate_fact(by, aggregations, self.row_filters(), self.start, self.end)
+
+
+def render_filter_bar(container):
+    cube = get_fact_cube()
+    min_date = cube.min_day.date()
+    max_date = cube.max_day.date()
+    cells = cube.cells
+
+    with container:
+        selected_range = st.date_input(
+            "Date range",
+            value=(min_date, max_date),
+            min_value=min_date,
+            max_value=max_date,
+            key="filter_dates"
+        )
+        statuses = sorted(cells['order_status'].dropna().unique())
+        selected_statuses = st.multiselect(
+            "Order status",
+            statuses,
+            default=[s for s in DEFAULT_STATUSES if s in statuses] or statuses,
+            key="filter_statuses"
+        )
+        states = st.multiselect(
+            "Customer state", sorted(cells['customer_state'].dropna().unique()), placeholder="All states", key="filter_states"
+        )
+        categories = st.multiselect(
+            "Product category", sorted(cells['product_category_name'].dropna().unique()), placeholder="All categories", key="filter_categories"
+        )
+
+    # The full range is left unbounded, which skips the date filter and
+    # shares cache entries with views that have no date range.
+    start, end = selected_range if isinstance(selected_range, tuple) and len(selected_range) == 2 else (min_date, max_date)
+    return FactFilters(
+        None if start <= min_date else start,
+        None if end >= max_date else end,
+        selected_statuses,
+        states,
+        categories,
+    )
@@ -0,0 +1,122 @@
+import json
+
+import pandas as pd
+import streamlit as st
+
+from helpers.fact_dataset import MANIFEST, date_filters, load_manifest, prune_files, read_fact_dataset
+from helpers.gcs_loader import get_blob_generation, get_storage_client, read_parquet_from_gcs, translate_categories
+from helpers.memory_cache import cached
+from helpers.profiling import timed
+
+FACT_BUCKET = "bdabi-group7"
+FACT_BLOB = "preprocessed/preprocessed.parquet"
+# The partitioned layout written by the ETL; FACT_BLOB is read while it
+# does not exist yet. Incremental ETL runs only update the dataset, so the
+# blob is never read once they have run.
+FACT_DATASET = "preprocessed/fact"
+FACT_MANIFEST = f"{FACT_DATASET}/{MANIFEST}"
+
+DATETIME_COLUMNS = [
+    "purchase_date",
+    "order_purchase_timestamp",
+    "order_approved_at",
+    "order_delivered_carrier_date",
+    "order_delivered_customer_date",
+    "order_estimated_delivery_date",
+    "shipping_limit_date",
+    "review_creation_date",
+    "review_answer_timestamp",
+]
+CATEGORY_COLUMNS = [
+    "order_status",
+    "customer_state",
+    "customer_city",
+    "seller_state",
+    "seller_city",
+    "product_category_name",
+    "payment_type",
+]
+INT8_COLUMNS = ["review_score"]
+
+# Row filter for the delivered orders most views are built from, in
+# pyarrow's filter format so it is applied while the Parquet file is read.
+DELIVERED = (("order_status", "==", "delivered"),)
+
+
+def apply_fact_dtypes(df: pd.DataFrame):
+    for col in DATETIME_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in INT8_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("Int8")
+    return df
+
+
+@st.cache_data
+def _load_fact_manifest(generation):
+    return load_manifest(get_storage_client().bucket(FACT_BUCKET), FACT_DATASET, generation)
+
+
+def read_fact_files(files, all_columns, columns=None, filters=None, start=None, end=None):
+    manifest = {"columns": list(all_columns), "files": files}
+    bucket = get_storage_client().bucket(FACT_BUCKET)
+    df = read_fact_dataset(bucket, manifest, columns, filters or (), start, end).to_pandas()
+    if "product_category_name" in df.columns:
+        df = translate_categories(df)
+    return apply_fact_dtypes(df)
+
+
+# One entry per projection a view asks for. Entries are keyed by the files
+# they read rather than by the manifest, so an incremental build that
+# rewrites a few partitions only invalidates the views that read them.
+@cached(max_entries=16)
+def _build_fact_table(files: str, all_columns, columns=None, filters=None, start=None, end=None):
+    return read_fact_files(json.loads(files), all_columns, columns, filters, start, end)
+
+
+@cached(max_entries=16)
+def _build_fact_table_from_blob(generation, columns=None, filters=None, start=None, end=None):
+    filters = [*(filters or ()), *date_filters(start, end)]
+    return apply_fact_dtypes(read_parquet_from_gcs(FACT_BUCKET, FACT_BLOB, generation, columns, filters))
+
+
+def get_fact_files(filters=None, start=None, end=None):
+    # Manifest entries of the files a scan has to read and the filters left
+    # for their rows; before the dataset exists that is the one fact blob.
+    generation = get_blob_generation(FACT_BUCKET, FACT_MANIFEST)
+    if generation is None:
+        blob = {"name": FACT_BLOB, "generation": get_blob_generation(FACT_BUCKET, FACT_BLOB)}
+        return [blob], [*(filters or ()), *date_filters(start, end)]
+    return prune_files(_load_fact_manifest(generation)["files"], filters or (), start, end)
+
+
+def get_fact_manifest():
+    generation = get_blob_generation(FACT_BUCKET, FACT_MANIFEST)
+    return None if generation is None else _load_fact_manifest(generation)
+
+
+def get_fact_version():
+    return get_blob_generation(FACT_BUCKET, FACT_MANIFEST) or get_blob_generation(FACT_BUCKET, FACT_BLOB)
+
+
+@timed("load")
+def get_fact_table(columns=None, filters=None, start=None, end=None):
+    # Views pass the columns they use, DELIVERED where they only look at
+    # delivered orders, and their date range (inclusive) if they have one;
+    # with none of these, the whole table is returned.
+    columns = tuple(columns) if columns is not None else None
+    filters = tuple(tuple(f) for f in filters) if filters else None
+
+    generation = get_blob_generation(FACT_BUCKET, FACT_MANIFEST)
+    if generation is None:
+        return _build_fact_table_from_blob(get_blob_generation(FACT_BUCKET, FACT_BLOB), columns, filters, start, end)
+
+    manifest = _load_fact_manifest(generation)
+    files, _ = prune_files(manifest["files"], filters or (), start, end)
+    # With nothing left after pruning, one file still supplies the schema.
+    files = files or manifest["files"][:1]
+    return _build_fact_table(json.dumps(files, sort_keys=True), tuple(manifest["columns"]), columns, filters, start, end)
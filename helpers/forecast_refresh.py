@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers.fact_cube import get_fact_cube
+from helpers.forecast_store import (
+    HORIZONS,
+    SEGMENT_COLUMNS,
+    TOTAL_SEGMENT,
+    new_run_id,
+    prune_runs,
+    write_manifest,
+    write_segment,
+)
+from helpers.forecasting import FORECAST_PARAMS, get_cached_forecast
+
+MIN_HISTORY_DAYS = 60
+# Whether the dashboard refits a missing or stale store on a background
+# thread; with 0 only jobs/precompute_forecasts.py writes it.
+FORECAST_BACKGROUND = os.environ.get("BDABI_FORECAST_BACKGROUND", "1") != "0"
+
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_refresh_version = None
+
+
+def segment_series(cube, top: int):
+    # Forecasts are of delivered revenue.
+    cube = cube.slice(order_status='delivered')
+
+    def daily(**filters):
+        series = cube.rollup(['day'], **filters)[['day', 'revenue']]
+        series.columns = ['ds', 'y']
+        return series
+
+    segments = [(*TOTAL_SEGMENT, daily())]
+    for kind, column in SEGMENT_COLUMNS.items():
+        ranked = cube.rollup([column]).sort_values('revenue', ascending=False)
+        for value in ranked[column].head(top):
+            series = daily(**{column: value})
+            if len(series) >= MIN_HISTORY_DAYS:
+                segments.append((kind, str(value), series))
+    return segments
+
+
+def _fit_segment(task):
+    kind, value, series, periods = task
+    # Series that did not change since the last run come from the fingerprint cache.
+    forecast, m = get_cached_forecast(series, FORECAST_PARAMS, periods)
+    return kind, value, series['ds'].max(), forecast, m
+
+
+def precompute(cube, data_version, horizons=HORIZONS, top: int = 10, workers=None):
+    periods = max(horizons)
+    tasks = [(kind, value, series, periods) for kind, value, series in segment_series(cube, top)]
+    run_id = new_run_id()
+
+    # Prophet drives cmdstan from each worker; spawn keeps this safe when the
+    # pool is started from a thread inside the Streamlit server.
+    context = multiprocessing.get_context("spawn")
+    segments = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for kind, value, last_actual, forecast, m in pool.map(_fit_segment, tasks):
+            path = write_segment(run_id, kind, value, forecast, m)
+            segments.append({
+                "kind": kind,
+                "value": value,
+                "path": path,
+                "last_actual": last_actual.isoformat(),
+            })
+
+    manifest = write_manifest(run_id, data_version, horizons, segments)
+    prune_runs()
+    return manifest
+
+
+def _refresh(data_version):
+    try:
+        precompute(get_fact_cube(), data_version)
+    except Exception as e:
+        print(f"Background forecast refresh failed: {e}")
+
+
+def ensure_background_refresh(data_version):
+    # Starts at most one refresh per data version per process; a failed run
+    # is retried by the CLI or after the next data version lands.
+    global _refresh_thread, _refresh_version
+    if not FORECAST_BACKGROUND:
+        return False
+    with _refresh_lock:
+        if is_refresh_running():
+            return True
+        if _refresh_version == data_version:
+            return False
+        _refresh_version = data_version
+        _refresh_thread = threading.Thread(target=_refresh, args=(data_version,), name="forecast-refresh", daemon=True)
+        _refresh_thread.start()
+        return True
+
+
+def is_refresh_running():
+    return _refresh_thread is not None and _refresh_thread.is_alive()
@@ -0,0 +1,101 @@
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from helpers.forecasting import read_forecast_dir, write_forecast_dir
+from helpers.memory_cache import cached
+from helpers.profiling import timed
+
+FORECAST_STORE_DIR = os.environ.get("BDABI_FORECAST_STORE_DIR", os.path.join(".cache", "forecast_store"))
+HORIZONS = [30, 90, 180]
+SEGMENT_COLUMNS = {
+    "category": "product_category_name",
+    "state": "customer_state",
+}
+TOTAL_SEGMENT = ("total", "All")
+
+
+def _manifest_path(root=None):
+    return os.path.join(root or FORECAST_STORE_DIR, "manifest.json")
+
+
+def segment_dir(kind: str, value: str):
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", str(value)).strip("_").lower() or "blank"
+    return os.path.join(kind, slug)
+
+
+def new_run_id():
+    return datetime.now(timezone.utc).strftime("run-%Y%m%dT%H%M%S%f")
+
+
+def write_segment(run_id: str, kind: str, value: str, forecast: pd.DataFrame, m, root=None):
+    rel = os.path.join(run_id, segment_dir(kind, value))
+    write_forecast_dir(os.path.join(root or FORECAST_STORE_DIR, rel), forecast, m)
+    return rel
+
+
+def prune_runs(keep: int = 2, root=None):
+    root = root or FORECAST_STORE_DIR
+    runs = sorted(d for d in os.listdir(root) if d.startswith("run-"))
+    for run in runs[:-keep]:
+        shutil.rmtree(os.path.join(root, run), ignore_errors=True)
+
+
+def write_manifest(run_id, data_version, horizons, segments, root=None):
+    path = _manifest_path(root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        "run_id": run_id,
+        "data_version": None if data_version is None else str(data_version),
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "horizons": list(horizons),
+        "segments": segments,
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+    return manifest
+
+
+def read_manifest(root=None):
+    path = _manifest_path(root)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_stale(manifest, data_version):
+    return manifest is None or manifest.get("data_version") != (None if data_version is None else str(data_version))
+
+
+def list_segments(manifest):
+    return [(s["kind"], s["value"]) for s in manifest["segments"]]
+
+
+# Run directories are never rewritten, so the path alone identifies a forecast.
+@cached(max_entries=64)
+def _read_segment(path: str):
+    return read_forecast_dir(path)
+
+
+@timed("load")
+def read_forecast(manifest, kind: str, value: str, horizon: int, root=None):
+    for segment in manifest["segments"]:
+        if segment["kind"] == kind and segment["value"] == value:
+            break
+    else:
+        return None
+
+    stored = _read_segment(os.path.join(root or FORECAST_STORE_DIR, segment["path"]))
+    if stored is None:
+        return None
+    forecast, m = stored
+    last_actual = pd.Timestamp(segment["last_actual"])
+    forecast = forecast[forecast["ds"] <= last_actual + pd.Timedelta(days=horizon)]
+    return forecast, m, last_actual
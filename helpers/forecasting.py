@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+from prophet import Prophet
+from prophet.serialize import model_from_json, model_to_json
+
+from helpers.memory_cache import cached
+from helpers.profiling import timed
+
+FORECAST_PARAMS = {
+    "yearly_seasonality": True,
+    "weekly_seasonality": True,
+    "interval_width": 0.90,
+}
+FORECAST_PERIODS = 180
+FORECAST_CACHE_DIR = os.environ.get("BDABI_FORECAST_CACHE_DIR", os.path.join(".cache", "forecasts"))
+
+
+def forecast_fingerprint(series: pd.DataFrame, params: dict, periods: int):
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(series[["ds", "y"]], index=False).to_numpy().tobytes())
+    digest.update(json.dumps({"params": params, "periods": periods}, sort_keys=True).encode())
+    return digest.hexdigest()[:20]
+
+
+@timed("fit")
+def fit_forecast(series: pd.DataFrame, params: dict, periods: int):
+    m = Prophet(**params)
+    m.fit(series)
+    future = m.make_future_dataframe(periods=periods)
+    forecast = m.predict(future)
+    return forecast, m
+
+
+def read_forecast_dir(path):
+    model_path = os.path.join(path, "model.json")
+    forecast_path = os.path.join(path, "forecast.parquet")
+    if not (os.path.exists(model_path) and os.path.exists(forecast_path)):
+        return None
+    with open(model_path) as f:
+        m = model_from_json(f.read())
+    return pd.read_parquet(forecast_path), m
+
+
+def write_forecast_dir(path, forecast, m):
+    os.makedirs(path, exist_ok=True)
+    # Write both files under temporary names first so a reader never sees
+    # a model without its forecast frame.
+    model_tmp = os.path.join(path, "model.json.tmp")
+    forecast_tmp = os.path.join(path, "forecast.parquet.tmp")
+    with open(model_tmp, "w") as f:
+        f.write(model_to_json(m))
+    forecast.to_parquet(forecast_tmp, index=False)
+    os.replace(forecast_tmp, os.path.join(path, "forecast.parquet"))
+    os.replace(model_tmp, os.path.join(path, "model.json"))
+
+
+@cached(max_entries=16)
+def _load_or_fit(fingerprint: str, _series: pd.DataFrame, params_json: str, periods: int):
+    path = os.path.join(FORECAST_CACHE_DIR, fingerprint)
+    stored = read_forecast_dir(path)
+    if stored is not None:
+        return stored
+
+    forecast, m = fit_forecast(_series, json.loads(params_json), periods)
+    try:
+        write_forecast_dir(path, forecast, m)
+    except OSError as e:
+        print(f"Could not persist forecast {fingerprint}: {e}")
+    return forecast, m
+
+
+def get_cached_forecast(series: pd.DataFrame, params: dict = FORECAST_PARAMS, periods: int = FORECAST_PERIODS):
+    fingerprint = forecast_fingerprint(series, params, periods)
+    return _load_or_fit(fingerprint, series, json.dumps(params, sort_keys=True), periods)
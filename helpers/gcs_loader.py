@@ -1,36 +1,99 @@
+import os
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
-import tempfile
-import os
+from concurrent.futures import ThreadPoolExecutor
 
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
-from helpers.translate import translate
+from helpers import blob_cache
+from helpers.local_storage import LocalClient
+from helpers.memory_cache import cached
+from helpers.translate import translate_category_names
+
+FETCH_WORKERS = 8
+# A directory of bucket folders to read and write instead of GCS, for
+# running offline.
+STORAGE_ROOT = os.environ.get("BDABI_STORAGE_ROOT")
 
-@st.cache_data
-def load_parquet_from_gcs(bucket_name: str, blob_name: str):
-    client = storage.Client.from_service_account_info(
+
+# One client per process, so every download reuses its connection pool.
+@st.cache_resource
+def get_storage_client():
+    if STORAGE_ROOT:
+        return LocalClient(STORAGE_ROOT)
+    return storage.Client.from_service_account_info(
         st.secrets["gcp_service_account"]
     )
 
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
 
-    tmp = tempfile.NamedTemporaryFile(delete=False)
-    tmp_path = tmp.name
-    tmp.close()
+def fetch_blob(bucket, blob_name: str, generation=None):
+    # Served from the local blob cache when it holds the current generation;
+    # a missing blob is None.
+    return blob_cache.fetch(bucket, blob_name, generation)
+
+
+def fetch_blobs(bucket, blob_names, max_workers: int = FETCH_WORKERS):
+    # Concurrent downloads, so the total time is set by the largest blob.
+    blob_names = list(blob_names)
+    if len(blob_names) <= 1:
+        return {name: fetch_blob(bucket, name) for name in blob_names}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(blob_names))) as pool:
+        return dict(zip(blob_names, pool.map(lambda name: fetch_blob(bucket, name), blob_names)))
+
 
-    blob.download_to_filename(tmp_path)
+def read_parquet_bytes(data: bytes):
+    # Arrow reads the buffer in place, without a temporary file.
+    return pq.read_table(pa.BufferReader(data))
 
-    df = pd.read_parquet(tmp_path)
 
-    categories = df["product_category_name"].dropna().unique()
-    translated_categories = {
-        category: translate(category.replace("_", " ")).title()
-        for category in categories
-    }
-    df["product_category_name"] = df["product_category_name"].map(translated_categories)
+@st.cache_data(ttl=300)
+def get_blob_generation(bucket_name: str, blob_name: str):
+    blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+    return blob.generation if blob is not None else None
+
+
+def translate_categories(df: pd.DataFrame):
+    # Recodes the categories rather than mapping every row's string; two
+    # names that translate alike share one category.
+    column = df["product_category_name"].astype("category")
+    translated = translate_category_names(column.cat.categories)
+    names = pd.Index([translated[c] for c in column.cat.categories])
+    categories = names.unique()
+    recode = categories.get_indexer(names)
+    codes = column.cat.codes.to_numpy()
+    df["product_category_name"] = pd.Categorical.from_codes(
+        np.where(codes >= 0, recode[codes], -1) if len(recode) else codes, categories=categories
+    )
+    return df
+
+
+def read_parquet_from_gcs(bucket_name: str, blob_name: str, generation=None, columns=None, filters=None):
+    # Columns and filters are pushed down to the Arrow dataset scan: only the
+    # listed column chunks are decoded, and row groups whose statistics rule
+    # out the filters (pyarrow's [(column, op, value), ...]) are skipped.
+    bucket = get_storage_client().bucket(bucket_name)
+    source = blob_cache.fetch(bucket, blob_name, generation, as_file=True)
+    if source is None:
+        raise NotFound(f"gs://{bucket_name}/{blob_name}")
+    if isinstance(source, bytes):
+        source = pa.BufferReader(source)
+
+    table = pq.read_table(
+        source,
+        columns=list(columns) if columns is not None else None,
+        filters=list(filters) if filters else None,
+    )
+    df = table.to_pandas()
+    if "product_category_name" in df.columns:
+        df = translate_categories(df)
 
+    return df
 
-    os.remove(tmp_path)
 
-    return df
\ No newline at end of file
+@cached()
+def load_parquet_from_gcs(bucket_name: str, blob_name: str, columns=None, filters=None):
+    return read_parquet_from_gcs(bucket_name, blob_name, columns=columns, filters=filters)
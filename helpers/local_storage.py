@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+
+from google.api_core.exceptions import NotFound
+
+# A filesystem stand-in for the parts of google.cloud.storage the dashboard
+# uses. Buckets are directories under the root and blob names are relative
+# paths; a blob's generation is its file's modification time in ns.
+
+
+class LocalBlob:
+    def __init__(self, bucket, name: str, generation=None):
+        self.bucket = bucket
+        self.name = name
+        self._generation = generation
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.path, *self.name.split("/"))
+
+    @property
+    def generation(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def size(self):
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return None
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def _check(self):
+        generation = self.generation
+        if generation is None or (self._generation is not None and generation != self._generation):
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+
+    def download_as_bytes(self):
+        self._check()
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def download_as_text(self):
+        return self.download_as_bytes().decode()
+
+    def download_to_filename(self, filename: str):
+        self._check()
+        shutil.copyfile(self.path, filename)
+
+    def _write(self, write):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        os.close(fd)
+        write(tmp)
+        os.replace(tmp, self.path)
+
+    def upload_from_filename(self, filename: str, content_type=None):
+        self._write(lambda tmp: shutil.copyfile(filename, tmp))
+
+    def upload_from_string(self, data, content_type=None):
+        data = data.encode() if isinstance(data, str) else data
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+        self._write(write)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        # Buckets have no directories, so none are left behind empty.
+        directory = os.path.dirname(self.path)
+        while directory != self.bucket.path and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+
+class LocalBucket:
+    def __init__(self, root: str, name: str):
+        self.name = name
+        self.path = os.path.join(root, name)
+
+    def blob(self, blob_name: str, generation=None):
+        return LocalBlob(self, blob_name, generation)
+
+    def get_blob(self, blob_name: str):
+        blob = LocalBlob(self, blob_name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix: str = ""):
+        blobs = []
+        for directory, _, files in os.walk(self.path):
+            for file_name in files:
+                if file_name.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(directory, file_name), self.path).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    blobs.append(LocalBlob(self, name))
+        return sorted(blobs, key=lambda b: b.name)
+
+
+class LocalClient:
+    def __init__(self, root: str):
+        self.root = root
+
+    def bucket(self, bucket_name: str):
+        return LocalBucket(self.root, bucket_name)
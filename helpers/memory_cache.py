@@ -0,0 +1,188 @@
+import inspect
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from helpers.profiling import record_bytes
+
+# One in-memory cache per process for the frames, tables and models the
+# feature modules load. Every session gets the same objects: frames are
+# handed out as shallow copies under pandas copy-on-write (which processes
+# that share the cache turn on with enable_copy_on_write), Arrow tables are
+# immutable and cached NumPy arrays are made read-only, so no session can
+# change what another sees and nothing is copied per caller. Entries are
+# evicted least recently used first once their total size passes the
+# budget; 0 keeps nothing.
+MEMORY_CACHE_MAX_BYTES = int(os.environ.get("BDABI_MEMORY_CACHE_MAX_BYTES", 4 * 1024 ** 3))
+
+
+def enable_copy_on_write():
+    # Without it, a caller writing into a shared frame's column changes the
+    # cached frame. Left to the entry point, since it is global to pandas.
+    pd.set_option("mode.copy_on_write", True)
+
+
+def estimate_bytes(value, _seen=None):
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pa.Table, pa.Array, pa.ChunkedArray)):
+        return value.nbytes
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_bytes(v, seen) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(k, seen) + estimate_bytes(v, seen) for k, v in value.items())
+    if hasattr(value, "__dict__") and not isinstance(value, type):
+        return sys.getsizeof(value) + estimate_bytes(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            _freeze(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _freeze(v)
+    return value
+
+
+def _share(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(_share(v) for v in value)
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    if isinstance(value, tuple):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+class MemoryCache:
+    def __init__(self, max_bytes: int = MEMORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace: str, event: str):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "evictions": 0})
+        stats[event] += 1
+
+    def _pop(self, key):
+        _, nbytes = self._entries.pop(key)
+        self.bytes -= nbytes
+        self._count(key[0], "evictions")
+
+    def _evict(self, namespace: str, max_entries=None):
+        if max_entries is not None:
+            keys = [k for k in self._entries if k[0] == namespace]
+            for key in keys[:max(len(keys) - max_entries, 0)]:
+                self._pop(key)
+        while self._entries and self.bytes > self.max_bytes:
+            self._pop(next(iter(self._entries)))
+
+    def get(self, namespace: str, key, load, max_entries=None):
+        # Sessions asking for an entry that is being loaded wait for that
+        # load instead of starting their own.
+        key = (namespace, key)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self._count(namespace, "hits")
+                    return self._entries[key][0]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self._count(namespace, "misses")
+                    break
+            loading.wait()
+
+        try:
+            value = _freeze(load())
+            nbytes = estimate_bytes(value)
+            record_bytes(nbytes)
+            with self._lock:
+                self._entries[key] = (value, nbytes)
+                self.bytes += nbytes
+                self._evict(namespace, max_entries)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return value
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            for key in [k for k in self._entries if namespace is None or k[0] == namespace]:
+                _, nbytes = self._entries.pop(key)
+                self.bytes -= nbytes
+
+    def stats(self):
+        with self._lock:
+            rows = {
+                namespace: {"entries": 0, "bytes": 0, **counts}
+                for namespace, counts in self._stats.items()
+            }
+            for (namespace, _), (_, nbytes) in self._entries.items():
+                rows[namespace]["entries"] += 1
+                rows[namespace]["bytes"] += nbytes
+        return pd.DataFrame.from_dict(rows, orient="index", columns=["entries", "bytes", "hits", "misses", "evictions"]).rename_axis("cache")
+
+
+CACHE = MemoryCache()
+
+
+def cached(max_entries: int = None, namespace: str = None):
+    # Like st.cache_resource, keyed by the arguments whose names do not
+    # start with an underscore, but stored in the shared CACHE.
+    def decorate(fn):
+        name = namespace or f"{fn.__module__}.{fn.__qualname__}"
+        signature = inspect.signature(fn)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple((k, _hashable(v)) for k, v in bound.arguments.items() if not k.startswith("_"))
+            return _share(CACHE.get(name, key, lambda: fn(*args, **kwargs), max_entries))
+
+        wrapper.clear = lambda: CACHE.clear(name)
+        return wrapper
+
+    return decorate
+
+
+def render_cache_stats(container):
+    stats = CACHE.stats()
+    with container:
+        st.metric("Cached", f"{CACHE.bytes / 1024 ** 2:,.0f} MB", f"of {CACHE.max_bytes / 1024 ** 2:,.0f} MB", delta_color="off")
+        if not stats.empty:
+            stats = stats.assign(mb=stats.pop("bytes") / 1024 ** 2)
+            stats.index = stats.index.str.rsplit(".", n=1).str[-1]
+            st.dataframe(stats, column_config={"mb": st.column_config.NumberColumn("MB", format="%.1f")}, width="stretch")
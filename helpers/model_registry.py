@@ -0,0 +1,136 @@
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from helpers.gcs_loader import fetch_blob, fetch_blobs, get_storage_client
+
+LATEST = "latest.json"
+METADATA = "metadata.json"
+
+
+def new_version_id():
+    return datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%f")
+
+
+class ModelRegistry:
+    # Versioned model artifacts under `root`, either a local directory or a
+    # gs://bucket/prefix. A version is immutable once written; latest.json
+    # points at the version readers should use and is written last, so a
+    # reader sees either the old version or the complete new one.
+
+    def __init__(self, root: str):
+        self.root = root
+        if root.startswith("gs://"):
+            bucket_name, _, prefix = root[len("gs://"):].partition("/")
+            self.bucket = get_storage_client().bucket(bucket_name)
+            self.prefix = prefix.strip("/")
+        else:
+            self.bucket = None
+            self.prefix = root
+
+    def _name(self, *parts):
+        if self.bucket is not None:
+            return "/".join(p for p in (self.prefix, *parts) if p)
+        return os.path.join(self.prefix, *parts)
+
+    def _read_json(self, *parts):
+        name = self._name(*parts)
+        if self.bucket is not None:
+            data = fetch_blob(self.bucket, name)
+            return None if data is None else json.loads(data)
+        if not os.path.exists(name):
+            return None
+        with open(name) as f:
+            return json.load(f)
+
+    def _write_json(self, payload, *parts):
+        text = json.dumps(payload, indent=2)
+        name = self._name(*parts)
+        if self.bucket is not None:
+            self.bucket.blob(name).upload_from_string(text, content_type="application/json")
+            return
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name + ".tmp", "w") as f:
+            f.write(text)
+        os.replace(name + ".tmp", name)
+
+    def versions(self):
+        if self.bucket is not None:
+            prefix = self._name("versions") + "/"
+            names = {b.name[len(prefix):].split("/", 1)[0] for b in self.bucket.list_blobs(prefix=prefix)}
+        else:
+            path = self._name("versions")
+            names = set(os.listdir(path)) if os.path.isdir(path) else set()
+        return sorted(n for n in names if n.startswith("v") and not n.endswith(".tmp"))
+
+    def publish(self, staging_dir: str, metadata: dict, version=None):
+        # Copies every file in staging_dir into a new version; metadata.json
+        # goes last and marks the version as complete.
+        version = version or new_version_id()
+        if self.metadata(version) is not None:
+            raise ValueError(f"Version {version} already exists")
+        metadata = {**metadata, "version": version}
+        files = sorted(os.listdir(staging_dir))
+
+        if self.bucket is not None:
+            def upload(file_name):
+                self.bucket.blob(self._name("versions", version, file_name)).upload_from_filename(os.path.join(staging_dir, file_name))
+            with ThreadPoolExecutor(max_workers=max(len(files), 1)) as pool:
+                list(pool.map(upload, files))
+            self._write_json(metadata, "versions", version, METADATA)
+            return version
+
+        target = self._name("versions", version)
+        tmp = target + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(staging_dir, tmp)
+        with open(os.path.join(tmp, METADATA), "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp, target)
+        return version
+
+    def metadata(self, version: str):
+        return self._read_json("versions", version, METADATA)
+
+    def promote(self, version: str):
+        if self.metadata(version) is None:
+            raise ValueError(f"Version {version} is incomplete or missing")
+        self._write_json({
+            "version": version,
+            "promoted_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }, LATEST)
+
+    def latest(self):
+        pointer = self._read_json(LATEST)
+        return None if pointer is None else pointer["version"]
+
+    def fetch(self, version: str, file_names):
+        # Contents of the named files of a version as bytes (None if absent),
+        # downloaded concurrently into memory.
+        file_names = list(file_names)
+        if self.bucket is not None:
+            blobs = fetch_blobs(self.bucket, [self._name("versions", version, f) for f in file_names])
+            return dict(zip(file_names, blobs.values()))
+
+        contents = {}
+        for file_name in file_names:
+            path = self._name("versions", version, file_name)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    contents[file_name] = f.read()
+            else:
+                contents[file_name] = None
+        return contents
+
+    def prune(self, keep: int = 5):
+        latest = self.latest()
+        for version in self.versions()[:-keep]:
+            if version == latest:
+                continue
+            if self.bucket is not None:
+                for blob in self.bucket.list_blobs(prefix=self._name("versions", version) + "/"):
+                    blob.delete()
+            else:
+                shutil.rmtree(self._name("versions", version), ignore_errors=True)
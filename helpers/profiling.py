@@ -0,0 +1,228 @@
+import contextvars
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import wraps
+
+import pandas as pd
+import streamlit as st
+
+# Per-panel timings. Every render_* function of the feature modules runs
+# under a PanelProfile; loaders, aggregations and model fits are timed as
+# phases where they are defined, and Streamlit's chart and table elements
+# as "chart", which covers serializing their data for the browser. The
+# rest of the render function is "transform". Time spent in a phase called
+# from another one (a load inside an aggregation) counts only for the inner
+# phase.
+PHASES = ["load", "transform", "aggregate", "fit", "chart"]
+CHART_ELEMENTS = ["altair_chart", "plotly_chart", "dataframe", "table", "line_chart", "bar_chart"]
+# Written by flush_metrics at the end of a rerun in Prometheus text format,
+# for a node exporter textfile collector.
+METRICS_PATH = os.environ.get("BDABI_METRICS_PATH")
+
+_current = contextvars.ContextVar("panel_profile", default=None)
+_totals = {}
+_lock = threading.Lock()
+_dirty = False
+_elements_timed = False
+
+
+class PanelProfile:
+    def __init__(self, panel: str):
+        self.panel = panel
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.total = 0.0
+        self.rows = 0
+        self.bytes_copied = 0
+        self.nested = []
+
+    def as_dict(self):
+        return {
+            "panel": self.panel,
+            "total_s": self.total,
+            **{f"{phase}_s": self.seconds[phase] for phase in PHASES},
+            "rows": self.rows,
+            "bytes_copied": self.bytes_copied,
+        }
+
+
+def _frame_rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_frame_rows(v) for v in value)
+    return 0
+
+
+def _frame_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    data = getattr(value, "data", None)
+    return int(data.memory_usage(index=True).sum()) if isinstance(data, pd.DataFrame) else 0
+
+
+def record_bytes(nbytes: int):
+    # Bytes materialized for the running panel: cache misses and data
+    # handed to chart and table elements.
+    profile = _current.get()
+    if profile is not None:
+        profile.bytes_copied += nbytes
+
+
+def timed(phase: str):
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return fn(*args, **kwargs)
+            # Seconds spent in phases nested in this call.
+            profile.nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                profile.seconds[phase] += elapsed - profile.nested.pop()
+                if profile.nested:
+                    profile.nested[-1] += elapsed
+            if phase == "load":
+                profile.rows += _frame_rows(result)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def _timed_element(element):
+    timed_element = timed("chart")(element)
+
+    @wraps(element)
+    def wrapper(*args, **kwargs):
+        record_bytes(_frame_bytes(args[0] if args else next(iter(kwargs.values()), None)))
+        return timed_element(*args, **kwargs)
+
+    return wrapper
+
+
+def _finish(profile: PanelProfile):
+    global _dirty
+    profile.seconds["transform"] = max(profile.total - sum(profile.seconds.values()), 0.0)
+    with _lock:
+        _dirty = True
+        totals = _totals.setdefault(profile.panel, {"runs": 0, "rows": 0, "bytes_copied": 0, "seconds": dict.fromkeys(PHASES, 0.0)})
+        totals["runs"] += 1
+        totals["rows"] += profile.rows
+        totals["bytes_copied"] += profile.bytes_copied
+        for phase, seconds in profile.seconds.items():
+            totals["seconds"][phase] += seconds
+    if st.runtime.exists():
+        st.session_state.setdefault("panel_profiles", {})[profile.panel] = profile.as_dict()
+
+
+def profiled(fn, panel: str = None):
+    panel = panel or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A render function called from another one is part of its panel.
+        if _current.get() is not None:
+            return fn(*args, **kwargs)
+        profile = PanelProfile(panel)
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.total = time.perf_counter() - start
+            _current.reset(token)
+            _finish(profile)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def instrument(*modules):
+    # Replaces every render_* function defined in the modules with its
+    # profiled version; calls through the module, including the module's
+    # own calls, go through the wrapper. Streamlit's chart and table
+    # elements are timed from the first call on. Modules outlive a rerun, so
+    # calling this on every rerun wraps each function once.
+    global _elements_timed
+    with _lock:
+        if not _elements_timed:
+            for name in CHART_ELEMENTS:
+                setattr(st, name, _timed_element(getattr(st, name)))
+            _elements_timed = True
+    for module in modules:
+        for name, value in list(vars(module).items()):
+            if (
+                name.startswith("render_") and callable(value) and not getattr(value, "profiled", False)
+                and getattr(value, "__module__", None) == module.__name__
+            ):
+                setattr(module, name, profiled(value))
+
+
+def flush_metrics(path: str = METRICS_PATH):
+    # Called once at the end of a rerun; a rerun cut short by st.stop() is
+    # written with the next one.
+    global _dirty
+    with _lock:
+        if not path or not _dirty:
+            return
+        _dirty = False
+    write_metrics(path)
+
+
+def metrics_json():
+    with _lock:
+        return json.dumps(_totals, indent=2, sort_keys=True)
+
+
+def metrics_prometheus():
+    lines = [
+        "# HELP bdabi_panel_runs_total Panel renders.",
+        "# TYPE bdabi_panel_runs_total counter",
+    ]
+    with _lock:
+        totals = copy.deepcopy(_totals)
+    for panel, t in sorted(totals.items()):
+        lines.append(f'bdabi_panel_runs_total{{panel="{panel}"}} {t["runs"]}')
+    lines += ["# HELP bdabi_panel_phase_seconds_total Time spent per panel and phase.", "# TYPE bdabi_panel_phase_seconds_total counter"]
+    for panel, t in sorted(totals.items()):
+        for phase in PHASES:
+            lines.append(f'bdabi_panel_phase_seconds_total{{panel="{panel}",phase="{phase}"}} {t["seconds"][phase]:.6f}')
+    lines += ["# HELP bdabi_panel_rows_total Rows loaded by panels.", "# TYPE bdabi_panel_rows_total counter"]
+    for panel, t in sorted(totals.items()):
+        lines.append(f'bdabi_panel_rows_total{{panel="{panel}"}} {t["rows"]}')
+    lines += ["# HELP bdabi_panel_bytes_copied_total Bytes materialized or serialized by panels.", "# TYPE bdabi_panel_bytes_copied_total counter"]
+    for panel, t in sorted(totals.items()):
+        lines.append(f'bdabi_panel_bytes_copied_total{{panel="{panel}"}} {t["bytes_copied"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(metrics_prometheus())
+    os.replace(tmp, path)
+
+
+def render_profile_panel(container):
+    with container:
+        if not st.checkbox("Show panel timings", key="profile_panels"):
+            return
+        profiles = st.session_state.get("panel_profiles", {})
+        if profiles:
+            table = pd.DataFrame(list(profiles.values())).set_index("panel").sort_values("total_s", ascending=False)
+            table.index = table.index.str.replace(".render_", ": ", regex=False)
+            st.dataframe(table, column_config={
+                c: st.column_config.NumberColumn(c.removesuffix("_s"), format="%.3f s") for c in table.columns if c.endswith("_s")
+            })
+        st.download_button("Metrics (JSON)", metrics_json(), "panel_metrics.json", "application/json")
+        st.download_button("Metrics (Prometheus)", metrics_prometheus(), "panel_metrics.prom", "text/plain")
@@ -0,0 +1,150 @@
+import os
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from helpers import blob_cache
+from helpers.fact_dataset import PARTITION_COLUMNS
+from helpers.fact_store import FACT_BUCKET, get_fact_files, get_fact_table
+from helpers.gcs_loader import get_storage_client, translate_categories
+from helpers.profiling import timed
+
+# Grouped aggregates over the fact table. "pandas" groups the cached fact
+# frame on the script thread; "duckdb" runs the query in an embedded engine
+# straight over the Parquet files in the blob cache, on all cores, and only
+# the aggregated rows become a DataFrame.
+QUERY_BACKEND = os.environ.get("BDABI_QUERY_BACKEND", "pandas")
+
+SQL_AGGREGATES = {
+    "sum": "COALESCE(SUM({}), 0)",
+    "mean": "AVG({})",
+    "count": "COUNT({})",
+    "nunique": "COUNT(DISTINCT {})",
+    "min": "MIN({})",
+    "max": "MAX({})",
+    "median": "MEDIAN({})",
+}
+SQL_OPERATORS = {"==": "=", "=": "=", "!=": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def _aggregate_pandas(by, aggregations, filters=None, start=None, end=None):
+    columns = list(dict.fromkeys([*by, *(column for column, _ in aggregations.values())]))
+    df = get_fact_table(columns, filters, start, end)
+    return df.groupby(list(by), observed=True).agg(**aggregations).reset_index()
+
+
+@st.cache_resource
+def _connection():
+    # One in-process database; every query runs on its own cursor so
+    # sessions rendering at the same time do not share state.
+    return duckdb.connect()
+
+
+def _quote(name: str):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _param(value):
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, "item") else value
+
+
+def _where(filters):
+    clauses, params = [], []
+    for column, op, value in filters:
+        if op in ("in", "not in"):
+            values = [_param(v) for v in value]
+            if not values:
+                clauses.append("FALSE" if op == "in" else "TRUE")
+                continue
+            clauses.append(f"{_quote(column)} {op.upper()} ({', '.join('?' * len(values))})")
+            params += values
+        elif op in SQL_OPERATORS:
+            clauses.append(f"{_quote(column)} {SQL_OPERATORS[op]} ?")
+            params.append(_param(value))
+        else:
+            raise ValueError(f"Unsupported filter operator {op!r}")
+    return clauses, params
+
+
+def _aggregate_duckdb(by, aggregations, filters=None, start=None, end=None):
+    files, row_filters = get_fact_files(filters, start, end)
+    if not files:
+        return pd.DataFrame(columns=[*by, *aggregations])
+
+    referenced = {*by, *(column for column, _ in aggregations.values()), *(f[0] for f in row_filters)}
+    # Dataset files do not store their partition values; they are joined
+    # back by file name when the query uses them.
+    partitions = [c for c in PARTITION_COLUMNS if c in referenced and c in files[0]]
+    file_columns = sorted(referenced - set(partitions))
+
+    bucket = get_storage_client().bucket(FACT_BUCKET)
+    paths, tables, rows = [], [], []
+    for f in files:
+        source = blob_cache.fetch(bucket, f["name"], f["generation"], as_file=True)
+        if source is None:
+            raise FileNotFoundError(f"gs://{FACT_BUCKET}/{f['name']}")
+        if isinstance(source, bytes):
+            # Blobs the cache could not keep are scanned from memory.
+            table = pq.read_table(pa.BufferReader(source), columns=file_columns, partitioning=None)
+            for column in partitions:
+                table = table.append_column(column, pa.array([f[column]] * table.num_rows))
+            tables.append(table)
+        else:
+            paths.append(source)
+            rows.append({"filename": source, **{column: f[column] for column in partitions}})
+
+    cursor = _connection().cursor()
+    scans, params = [], []
+    select = ", ".join(_quote(c) for c in [*file_columns, *partitions])
+    if paths:
+        scans.append(f"SELECT {select} FROM read_parquet(?, filename = true, union_by_name = true)" + (" JOIN fact_partitions USING (filename)" if partitions else ""))
+        params.append(paths)
+        if partitions:
+            cursor.register("fact_partitions", pd.DataFrame(rows))
+    if tables:
+        cursor.register("fact_memory", pa.concat_tables(tables, promote_options="default"))
+        scans.append(f"SELECT {select} FROM fact_memory")
+
+    keys = ", ".join(_quote(c) for c in by)
+    measures = ", ".join(
+        f"{SQL_AGGREGATES[func].format(_quote(column))} AS {_quote(name)}"
+        for name, (column, func) in aggregations.items()
+    )
+    clauses, filter_params = _where(row_filters)
+    # groupby drops rows whose key is missing.
+    clauses += [f"{_quote(c)} IS NOT NULL" for c in by]
+    query = (
+        f"SELECT {', '.join(filter(None, [keys, measures]))} FROM ({' UNION ALL BY NAME '.join(scans)})"
+        + (f" WHERE {' AND '.join(clauses)}" if clauses else "")
+        + (f" GROUP BY {keys} ORDER BY {keys}" if by else "")
+    )
+    try:
+        result = cursor.execute(query, params + filter_params).df()
+    finally:
+        cursor.close()
+
+    if "product_category_name" in result.columns:
+        result = translate_categories(result)
+    return result
+
+
+BACKENDS = {
+    "pandas": _aggregate_pandas,
+    "duckdb": _aggregate_duckdb,
+}
+
+
+@timed("aggregate")
+def aggregate_fact(by, aggregations: dict, filters=None, start=None, end=None, backend: str = None):
+    # `aggregations` maps output columns to (column, function) pairs as in
+    # pandas named aggregation, with the functions in SQL_AGGREGATES;
+    # filters and the date range are those of get_fact_table.
+    backend = backend or QUERY_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown query backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](list(by), aggregations, filters, start, end)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import operator
+
+import numpy as np
+import pandas as pd
+
+OPERATORS = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+COMBINE = {
+    "max": lambda weighted: weighted.max(axis=0),
+    "sum": lambda weighted: weighted.sum(axis=0),
+}
+
+
+class RuleSet:
+    # A declarative scoring rule set, usually loaded from JSON:
+    #
+    #   rules        [{"name", "when": [[column, op, value], ...], "score"}]
+    #   combine      "max" or "sum" over the scores of matching rules
+    #   score_cap    upper bound applied after combining
+    #   threshold    minimum score for a row to be flagged
+    #   risk_bands   [{"label", "max"}] by ascending upper bound
+    #
+    # Every distinct condition is evaluated once over whole columns, then the
+    # rule scores are combined in one matrix operation.
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self.names = [rule["name"] for rule in spec["rules"]]
+        self.weights = np.array([rule["score"] for rule in spec["rules"]], dtype=np.int64)
+        self.combine = COMBINE[spec.get("combine", "max")]
+        self.score_cap = spec.get("score_cap")
+        self.threshold = spec.get("threshold", 0)
+        self.band_labels = [band["label"] for band in spec["risk_bands"]]
+        self.band_max = np.array([band["max"] for band in spec["risk_bands"]])
+
+        self.conditions = []
+        self.rule_conditions = []
+        for rule in spec["rules"]:
+            ids = []
+            for column, op, value in rule["when"]:
+                if op not in OPERATORS:
+                    raise ValueError(f"Unknown operator {op!r} in rule {rule['name']!r}")
+                condition = (column, op, value)
+                if condition not in self.conditions:
+                    self.conditions.append(condition)
+                ids.append(self.conditions.index(condition))
+            self.rule_conditions.append(ids)
+
+    @classmethod
+    def from_json(cls, path: str):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @property
+    def fingerprint(self):
+        return hashlib.sha256(json.dumps(self.spec, sort_keys=True).encode()).hexdigest()[:16]
+
+    def hits(self, frame: pd.DataFrame):
+        # Boolean matrix with one row per rule.
+        evaluated = [
+            np.asarray(OPERATORS[op](frame[column].to_numpy(), value), dtype=bool)
+            for column, op, value in self.conditions
+        ]
+        matrix = np.ones((len(self.names), len(frame)), dtype=bool)
+        for row, ids in enumerate(self.rule_conditions):
+            for i in ids:
+                matrix[row] &= evaluated[i]
+        return matrix
+
+    def score(self, frame: pd.DataFrame, hits=None):
+        hits = self.hits(frame) if hits is None else hits
+        if not len(self.names):
+            return np.zeros(len(frame), dtype=np.int64)
+        scores = self.combine(hits * self.weights[:, None])
+        if self.score_cap is not None:
+            scores = np.minimum(scores, self.score_cap)
+        return scores
+
+    def risk_band(self, scores):
+        # Bands are right-closed like pd.cut: a score equal to a band's max
+        # belongs to that band.
+        codes = np.searchsorted(self.band_max, scores, side="left")
+        codes = np.where(codes < len(self.band_labels), codes, -1)
+        return pd.Categorical.from_codes(codes, categories=self.band_labels, ordered=True)
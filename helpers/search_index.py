@@ -0,0 +1,115 @@
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+NGRAM = 3
+
+
+def _build_postings(values: np.ndarray):
+    # Encode every character position as a small alphabet code, then build
+    # (trigram code, row) pairs for all rows at once instead of per string.
+    # The postings are returned in CSR form: the rows holding the trigram
+    # coded grams[i] are rows[offsets[i]:offsets[i + 1]], in row order.
+    width = values.dtype.itemsize // 4
+    if len(values) == 0 or width < NGRAM:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+    chars = values.view(np.uint32).reshape(len(values), width)
+    present = np.zeros(int(chars.max()) + 1, dtype=bool)
+    present[chars.ravel()] = True
+    alphabet = np.flatnonzero(present)
+    codes = (np.cumsum(present) - 1)[chars]
+    base = len(alphabet)
+
+    grams = codes[:, :-2] * base * base + codes[:, 1:-1] * base + codes[:, 2:]
+    valid = (chars[:, :-2] != 0) & (chars[:, 1:-1] != 0) & (chars[:, 2:] != 0)
+    rows = np.broadcast_to(np.arange(len(values))[:, None], grams.shape)
+
+    pairs = np.sort(grams[valid] * len(values) + rows[valid])
+    pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+    gram_codes, row_ids = pairs // len(values), (pairs % len(values)).astype(np.int32)
+    starts = np.flatnonzero(np.r_[True, gram_codes[1:] != gram_codes[:-1]])
+    return alphabet.astype(np.uint32), gram_codes[starts], np.r_[starts, len(pairs)], row_ids
+
+
+class IdSearchIndex:
+    # Case-insensitive search over a column of string ids. Prefix matches come
+    # from a sorted array, other substring matches from a trigram index, and
+    # exact ids resolve to their row position through a hash map.
+
+    def __init__(self, ids: pd.Series):
+        self.ids = ids.astype(str).to_numpy()
+        self.lower = np.array([i.lower() for i in self.ids])
+        self.positions = {value: row for row, value in enumerate(self.ids)}
+
+        self.sorted_rows = np.argsort(self.lower, kind="stable")
+        self.sorted_lower = self.lower[self.sorted_rows]
+
+        self.alphabet, self.grams, self.offsets, self.posting_rows = _build_postings(self.lower)
+        base = len(self.alphabet)
+        self.gram_chars = np.stack([self.grams // (base * base), self.grams // base % base, self.grams % base], axis=1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, customer_id):
+        return self.positions.get(str(customer_id))
+
+    def _prefix_rows(self, query: str, limit: int):
+        lo = np.searchsorted(self.sorted_lower, query, side="left")
+        hi = np.searchsorted(self.sorted_lower, query + "\uffff", side="left")
+        return self.sorted_rows[lo:min(hi, lo + limit)]
+
+    def _encode(self, text: str):
+        # Alphabet codes of the characters, or None if one never occurs.
+        chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        codes = np.searchsorted(self.alphabet, chars)
+        if (codes >= len(self.alphabet)).any() or (self.alphabet[codes] != chars).any():
+            return None
+        return codes.astype(np.int64)
+
+    def _postings(self, indices):
+        return [self.posting_rows[start:end] for start, end in zip(self.offsets[indices].tolist(), self.offsets[indices + 1].tolist())]
+
+    def _substring_rows(self, query: str, count: int):
+        # Rows containing the query in row order, at least the first `count`.
+        codes = self._encode(query)
+        if codes is None:
+            return iter(())
+        base = len(self.alphabet)
+
+        if len(query) >= NGRAM:
+            grams = np.unique(codes[:-2] * base * base + codes[1:-1] * base + codes[2:])
+            indices = np.searchsorted(self.grams, grams)
+            if (indices >= len(self.grams)).any() or (self.grams[indices] != grams).any():
+                return iter(())
+            lists = self._postings(indices)
+            lists.sort(key=len)
+            candidates = lists[0]
+            for rows in lists[1:]:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            # Trigrams can match out of order, so confirm the full substring.
+            return (row for row in candidates if query in self.lower[row])
+
+        # Shorter queries: the first `count` rows of the union of every
+        # trigram containing the query are among the first `count` rows of
+        # each posting list, so only those are gathered.
+        contains = np.zeros(len(self.grams), dtype=bool)
+        for offset in range(NGRAM - len(query) + 1):
+            contains |= (self.gram_chars[:, offset:offset + len(query)] == codes).all(axis=1)
+        indices = np.flatnonzero(contains)
+        starts = self.offsets[indices]
+        lengths = np.minimum(self.offsets[indices + 1] - starts, count)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return iter(np.unique(self.posting_rows[positions])[:count])
+
+    def search(self, query: str, limit: int = 20):
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        rows = list(self._prefix_rows(query, limit))
+        seen = set(rows)
+        for row in islice((r for r in self._substring_rows(query, limit + len(rows)) if r not in seen), limit - len(rows)):
+            rows.append(row)
+        return [self.ids[row] for row in rows]
@@ -1,7 +1,59 @@
+import json
+import os
+
 import streamlit as st
 from deep_translator import GoogleTranslator
 
+# Portuguese product category -> English label, built once offline with
+# jobs/build_category_translations.py so loading the data needs no network.
+CATEGORY_TRANSLATIONS_PATH = os.environ.get(
+    "BDABI_CATEGORY_TRANSLATIONS", os.path.join(os.path.dirname(__file__), "category_translations.json")
+)
+
+
+def translate_batch(texts):
+    # One request for all texts, one per line; deep_translator's own
+    # translate_batch sends a request per text, so it is only the fallback
+    # when the lines do not come back one for one.
+    texts = list(texts)
+    translator = GoogleTranslator(source="pt", target="en")
+    lines = translator.translate("\n".join(texts)).split("\n")
+    return lines if len(lines) == len(texts) else translator.translate_batch(texts)
+
+
+def category_label(translated: str):
+    return translated.replace("_", " ").title()
+
 
 @st.cache_data
-def translate(text):
-    return GoogleTranslator(source="pt", target="en").translate(text)
\ No newline at end of file
+def load_category_translations(path: str = CATEGORY_TRANSLATIONS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@st.cache_data
+def _translate_unseen(categories: tuple):
+    # One batched request for categories missing from the mapping file; if
+    # the translator is unreachable the Portuguese name is shown instead.
+    try:
+        translated = translate_batch(c.replace("_", " ") for c in categories)
+    except Exception:
+        translated = categories
+    return {c: category_label(t or c) for c, t in zip(categories, translated)}
+
+
+def untranslate_category_names(labels, path: str = CATEGORY_TRANSLATIONS_PATH):
+    # Portuguese names shown under these labels, for filters applied to the
+    # stored data. A category missing from the mapping file is matched when
+    # its label is its own name title-cased, as when it was not translated.
+    labels = set(labels)
+    names = {c for c, label in load_category_translations(path).items() if label in labels}
+    return sorted(names | {label.lower().replace(" ", "_") for label in labels})
+
+
+def translate_category_names(categories, path: str = CATEGORY_TRANSLATIONS_PATH):
+    known = load_category_translations(path)
+    unseen = tuple(sorted(c for c in categories if c not in known))
+    return {**{c: known[c] for c in categories if c in known}, **(_translate_unseen(unseen) if unseen else {})}
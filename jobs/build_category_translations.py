@@ -0,0 +1,47 @@
+import argparse
+import json
+
+import pyarrow.compute as pc
+
+from helpers.fact_dataset import load_manifest, read_fact_dataset
+from helpers.fact_store import FACT_BLOB, FACT_BUCKET, FACT_DATASET
+from helpers.gcs_loader import fetch_blob, get_storage_client, read_parquet_bytes
+from helpers.translate import CATEGORY_TRANSLATIONS_PATH, category_label, load_category_translations, translate_batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add translations for new product categories in the fact table to the category mapping file.")
+    parser.add_argument("--bucket", default=FACT_BUCKET)
+    parser.add_argument("--prefix", default=FACT_DATASET, help="fact dataset prefix")
+    parser.add_argument("--blob", default=FACT_BLOB, help="monolithic fact blob, read while the dataset does not exist")
+    parser.add_argument("--output", default=CATEGORY_TRANSLATIONS_PATH, help="mapping file to update")
+    parser.add_argument("--all", action="store_true", help="retranslate categories already in the file")
+    args = parser.parse_args(argv)
+
+    # Incremental ETL runs only update the dataset, so the blob can miss
+    # categories added since the first build.
+    bucket = get_storage_client().bucket(args.bucket)
+    manifest = load_manifest(bucket, args.prefix)
+    if manifest is not None:
+        column = read_fact_dataset(bucket, manifest, ["product_category_name"]).column("product_category_name")
+    else:
+        data = fetch_blob(bucket, args.blob)
+        if data is None:
+            parser.error(f"gs://{args.bucket}/{args.blob} not found")
+        column = read_parquet_bytes(data).column("product_category_name")
+    categories = sorted(c for c in pc.unique(column).to_pylist() if c is not None)
+
+    translations = {} if args.all else dict(load_category_translations(args.output))
+    missing = [c for c in categories if c not in translations]
+    if missing:
+        translated = translate_batch(c.replace("_", " ") for c in missing)
+        translations.update({c: category_label(t) for c, t in zip(missing, translated)})
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(translations, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    print(f"Translated {len(missing)} of {len(categories)} categories into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
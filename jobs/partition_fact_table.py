@@ -0,0 +1,34 @@
+import argparse
+import time
+
+from helpers.fact_dataset import load_manifest, write_fact_dataset
+from helpers.fact_store import FACT_BLOB, FACT_BUCKET, FACT_DATASET
+from helpers.gcs_loader import fetch_blob, get_storage_client, read_parquet_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rewrite the monolithic fact Parquet file as the partitioned fact dataset.")
+    parser.add_argument("--bucket", default=FACT_BUCKET)
+    parser.add_argument("--source", default=FACT_BLOB, help="monolithic fact table blob")
+    parser.add_argument("--prefix", default=FACT_DATASET, help="dataset prefix to write")
+    parser.add_argument("--keep", type=int, default=2, help="dataset versions to keep")
+    parser.add_argument("--force", action="store_true", help="replace a dataset that already exists")
+    args = parser.parse_args(argv)
+
+    bucket = get_storage_client().bucket(args.bucket)
+    # The blob is not updated by incremental ETL runs, so converting it
+    # again would drop every order they added.
+    if load_manifest(bucket, args.prefix) is not None and not args.force:
+        parser.error(f"gs://{args.bucket}/{args.prefix} already exists; pass --force to replace it with the blob's rows")
+    data = fetch_blob(bucket, args.source)
+    if data is None:
+        parser.error(f"gs://{args.bucket}/{args.source} not found")
+
+    start = time.perf_counter()
+    manifest = write_fact_dataset(read_parquet_bytes(data).to_pandas(), bucket, args.prefix, args.keep)
+    rows = sum(f["rows"] for f in manifest["files"])
+    print(f"Wrote {rows:,} rows in {len(manifest['files'])} partitions to gs://{args.bucket}/{args.prefix}/{manifest['version']} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
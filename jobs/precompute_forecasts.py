@@ -0,0 +1,29 @@
+import argparse
+import time
+
+from helpers.fact_cube import get_fact_cube
+from helpers.fact_store import get_fact_version
+from helpers.forecast_refresh import precompute
+from helpers.forecast_store import HORIZONS, is_stale, read_manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute Prophet revenue forecasts into the forecast store.")
+    parser.add_argument("--horizons", type=int, nargs="+", default=HORIZONS, help="forecast horizons in days")
+    parser.add_argument("--top", type=int, default=10, help="number of top categories and states to forecast")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="refit even if the store matches the data version")
+    args = parser.parse_args(argv)
+
+    data_version = get_fact_version()
+    if not args.force and not is_stale(read_manifest(), data_version):
+        print(f"Forecast store is up to date for data version {data_version}")
+        return
+
+    start = time.perf_counter()
+    manifest = precompute(get_fact_cube(), data_version, sorted(args.horizons), args.top, args.workers)
+    print(f"Wrote {len(manifest['segments'])} forecasts ({manifest['run_id']}) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
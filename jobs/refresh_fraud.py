@@ -0,0 +1,23 @@
+import argparse
+import time
+
+from features.fraud import MODEL_BUCKET, refresh_fraud_candidates
+from helpers.gcs_loader import get_storage_client
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score orders not scored yet and append them to the candidate set.")
+    parser.add_argument("--bucket", default=MODEL_BUCKET, help="bucket holding the raw orders and fraud artifacts")
+    args = parser.parse_args(argv)
+
+    bucket = get_storage_client().bucket(args.bucket)
+    start = time.perf_counter()
+    candidates, added = refresh_fraud_candidates(bucket)
+    if candidates is None:
+        print("No orders left to score")
+        return
+    print(f"Added {added:,} fraud candidates ({len(candidates):,} total) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import hashlib
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from features.churn import (
+    CHURN_REGISTRY,
+    explain_customers,
+    load_raw_data,
+    save_churn_artifacts,
+    score_customers,
+    train_churn_model,
+)
+from helpers.fact_store import get_fact_version
+from helpers.model_registry import ModelRegistry
+
+
+def data_fingerprint(data: pd.DataFrame):
+    digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:20]
+
+
+def train_and_publish(registry: ModelRegistry, data_version, min_auc: float):
+    model, data, metrics = train_churn_model(load_raw_data())
+    scores = score_customers(model, data)
+    drivers = explain_customers(model, data)
+
+    metadata = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "data_version": None if data_version is None else str(data_version),
+        "data_fingerprint": data_fingerprint(data),
+        "features": model.feature_name(),
+        "customers": len(data),
+        **metrics,
+    }
+
+    staging_dir = tempfile.mkdtemp(prefix="churn-model-")
+    try:
+        save_churn_artifacts(staging_dir, model, data, scores, drivers)
+        version = registry.publish(staging_dir, metadata)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # Every version is kept for inspection, but only good ones are served.
+    promoted = metrics["auc"] >= min_auc
+    if promoted:
+        registry.promote(version)
+    return version, metrics, promoted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the churn model and publish it to the model registry.")
+    parser.add_argument("--registry", default=CHURN_REGISTRY, help="local directory or gs://bucket/prefix")
+    parser.add_argument("--min-auc", type=float, default=0.7, help="validation AUC a version needs to be promoted")
+    parser.add_argument("--keep", type=int, default=5, help="number of versions to keep")
+    parser.add_argument("--force", action="store_true", help="retrain even if the latest version used the current data")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.registry)
+    data_version = get_fact_version()
+    latest = registry.latest()
+    if not args.force and latest is not None:
+        metadata = registry.metadata(latest)
+        if metadata.get("data_version") == (None if data_version is None else str(data_version)):
+            print(f"Churn model {latest} is up to date for data version {data_version}")
+            return
+
+    start = time.perf_counter()
+    version, metrics, promoted = train_and_publish(registry, data_version, args.min_auc)
+    status = "promoted" if promoted else f"not promoted (AUC below {args.min_auc})"
+    print(f"Published churn model {version} with AUC {metrics['auc']:.4f}, {status}, in {time.perf_counter() - start:.1f}s")
+    registry.prune(args.keep)
+
+
+if __name__ == "__main__":
+    main()